@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:12
+
+from django.db import migrations, models
+
+MAX_DEPTH = 10
+
+
+def build_paths(apps, schema_editor):
+    Comment = apps.get_model('comments', 'Comment')
+    level = Comment.objects.filter(parent=None)
+    while True:
+        comments = list(level)
+        if not comments:
+            break
+        for comment in comments:
+            segment = f'{int(comment.created_at.timestamp() * 1_000_000):013x}{comment.id.hex[:8]}'
+            parent = comment.parent
+            if parent is not None and parent.depth >= MAX_DEPTH:
+                parent = comment.parent = parent.parent
+            if parent is None:
+                comment.path, comment.depth = segment, 0
+            else:
+                comment.path, comment.depth = f'{parent.path}/{segment}', parent.depth + 1
+        Comment.objects.bulk_update(comments, ['parent', 'path', 'depth'], batch_size=500)
+        # Replies whose parent has its path now
+        level = Comment.objects.filter(path='').exclude(parent__path='').select_related('parent__parent')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0002_comment_likes_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=255),
+            preserve_default=False,
+        ),
+        migrations.RunPython(build_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['story', 'path'], name='comment_thread_idx'),
+        ),
+    ]
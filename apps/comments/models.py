@@ -1,7 +1,31 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
 from django.contrib.auth.models import User
+from django.utils import timezone
 from apps.utils.models import CoreModel
-from apps.story.models import Story
+from apps.story.models import Story, invalidate_story_page
+
+# Threads are stored as materialized paths: a comment's path is its parent's
+# path, '/', and a segment sorting by creation time. Ordering by path lists a
+# story's comments depth-first, each thread in the order it was written, and a
+# subtree is the range [path, path + PATH_END) of one index.
+PATH_SEPARATOR = '/'
+# Sorts right after PATH_SEPARATOR and before every segment character
+PATH_END = '0'
+PATH_MAX_LENGTH = 255
+# Replies to a comment this deep become replies to its parent instead
+MAX_DEPTH = 10
+# Keyset ordering of a story's comments in thread order, and the size of a page
+THREAD_ORDER = ('path', 'id')
+COMMENTS_PER_PAGE = 50
+
+
+def path_segment(moment, comment_id) -> str:
+    """Segment of a comment's path: microseconds since the epoch, then a piece of its id"""
+    return f'{int(moment.timestamp() * 1_000_000):013x}{comment_id.hex[:8]}'
+
 
 class Comment(CoreModel):
     """Comment model for stories"""
@@ -12,8 +36,28 @@ class Comment(CoreModel):
     # For threaded comments
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
     
+    path = models.CharField(max_length=PATH_MAX_LENGTH, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    
+    # Engagement Metrics
+    likes_count = models.PositiveIntegerField(default=0)
+    # Active direct replies
+    replies_count = models.PositiveIntegerField(default=0)
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['story', 'path'], name='comment_thread_idx')]
+    
+    def save(self, *args, **kwargs):
+        if not self.path:
+            if self.parent is not None and self.parent.depth >= MAX_DEPTH:
+                self.parent = self.parent.parent
+            segment = path_segment(self.created_at or timezone.now(), self.id)
+            if self.parent is None:
+                self.path, self.depth = segment, 0
+            else:
+                self.path, self.depth = f'{self.parent.path}{PATH_SEPARATOR}{segment}', self.parent.depth + 1
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return f'Comment by {self.author.username} on {self.story}'
@@ -22,9 +66,21 @@ class Comment(CoreModel):
     def is_reply(self):
         return self.parent is not None
     
-    @property
-    def replies_count(self):
-        return self.replies.filter(is_active=True).count()
+    def subtree(self):
+        """The comment and every reply under it, in one range of the thread index"""
+        return Comment.objects.filter(story_id=self.story_id, path__gte=self.path, path__lt=self.path + PATH_END)
+    
+    def deactivate_thread(self):
+        """Deactivate the comment and every reply under it, with the counters in one update each"""
+        with transaction.atomic():
+            # Nothing under a deactivated comment stays active to be counted
+            removed = self.subtree().update(is_active=False, replies_count=0)
+            if removed:
+                Story._base_manager.filter(pk=self.story_id).update(comments_count=F('comments_count') - removed)
+            if self.is_active and self.parent_id:
+                Comment._base_manager.filter(pk=self.parent_id).update(replies_count=F('replies_count') - 1)
+        self.is_active = False
+        self.replies_count = 0
 
 class CommentLike(CoreModel):
     """Model for tracking likes on comments"""
@@ -36,3 +92,39 @@ class CommentLike(CoreModel):
     
     def __str__(self):
         return f'{self.user.username} likes {self.comment}'
+
+
+"""===== COUNTER SIGNALS ====="""
+@receiver(pre_save, sender=Comment)
+def remember_previous_activity(sender, instance, **kwargs):
+    if instance._state.adding:
+        instance._was_active = False
+    else:
+        instance._was_active = Comment._base_manager.filter(pk=instance.pk).values_list('is_active', flat=True).first()
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, **kwargs):
+    change = int(instance.is_active) - int(bool(getattr(instance, '_was_active', False)))
+    if change:
+        count_comment(instance, change)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    if instance.is_active:
+        count_comment(instance, -1)
+
+
+def count_comment(comment, change: int) -> None:
+    """Add change to the counters comment is counted in: its story's and its parent's"""
+    Story._base_manager.filter(pk=comment.story_id).update(comments_count=F('comments_count') + change)
+    if comment.parent_id:
+        Comment._base_manager.filter(pk=comment.parent_id).update(replies_count=F('replies_count') + change)
+
+
+"""===== PAGE CACHE SIGNALS ====="""
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_commented_story_page(sender, instance, **kwargs):
+    invalidate_story_page(instance.story_id)
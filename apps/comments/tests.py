@@ -1,3 +1,259 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from apps.story.models import Story
+
+from .models import MAX_DEPTH, PATH_SEPARATOR, Comment, CommentLike
+
+
+class CommentLikeTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', password='x')
+        self.reader = User.objects.create_user('reader', password='x')
+        self.story = Story.objects.create(title='Derby day', content='...', author=self.author, status='published')
+        self.comments = [Comment.objects.create(story=self.story, author=self.author, text=f'#{n}') for n in range(3)]
+        self.client.force_login(self.reader)
+
+    def like(self, comment, action):
+        return self.client.post(reverse('comments:like_comment', args=[comment.id]), {'action': action}).json()
+
+    def test_likes_count_is_kept_with_atomic_updates(self):
+        comment = self.comments[0]
+        self.assertEqual(self.like(comment, 'like')['likes_count'], 1)
+        self.assertEqual(self.like(comment, 'like')['likes_count'], 1)
+
+        other = User.objects.create_user('other', password='x')
+        self.client.force_login(other)
+        self.assertEqual(self.like(comment, 'like')['likes_count'], 2)
+        self.assertEqual(self.like(comment, 'unlike')['likes_count'], 1)
+        self.assertEqual(self.like(comment, 'unlike')['likes_count'], 1)
+
+        comment.refresh_from_db()
+        self.assertEqual(comment.likes_count, comment.likes.count())
+
+    def test_unknown_action_is_rejected(self):
+        response = self.client.post(reverse('comments:like_comment', args=[self.comments[0].id]), {'action': 'love'})
+        self.assertEqual(response.status_code, 400)
+
+        url = reverse('comments:like_comment', args=[self.comments[0].id])
+        for body in ('["like"]', '"like"', 'null', '{'):
+            response = self.client.post(url, body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+        self.assertFalse(CommentLike.objects.exists())
+
+    def test_liked_state_of_a_page_in_one_query(self):
+        self.like(self.comments[1], 'like')
+        ids = ','.join(str(comment.id) for comment in self.comments)
+
+        with self.assertNumQueries(3):  # session, user, likes
+            response = self.client.get(reverse('comments:liked_comments'), {'ids': ids})
+
+        self.assertEqual(response.json()['liked'], [str(self.comments[1].id)])
+
+    def test_story_page_marks_liked_comments(self):
+        self.like(self.comments[1], 'like')
+
+        response = self.client.get(self.story.get_absolute_url(), HTTP_USER_AGENT='Mozilla/5.0')
+
+        self.assertEqual(response.context['liked_comment_ids'], {self.comments[1].id})
+        self.assertContains(response, 'data-liked="true"', count=1)
+
+
+class CommentThreadTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', password='x')
+        self.story = Story.objects.create(title='Derby day', content='...', author=self.author, status='published')
+
+    def comment(self, text, parent=None):
+        return Comment.objects.create(story=self.story, author=self.author, text=text, parent=parent)
+
+    def fetch_all(self, **params):
+        texts, cursor = [], None
+        while True:
+            response = self.client.get(
+                reverse('comments:get_comments', args=[self.story.id]), {**params, **({'cursor': cursor} if cursor else {})}
+            ).json()
+            texts += [(comment['text'], comment['depth']) for comment in response['comments']]
+            cursor = response['next_cursor']
+            if cursor is None:
+                return texts
+
+    def test_paths_nest_under_the_parent(self):
+        first = self.comment('first')
+        reply = self.comment('reply', first)
+        self.assertEqual((first.depth, reply.depth), (0, 1))
+        self.assertTrue(reply.path.startswith(first.path + PATH_SEPARATOR))
+
+        deepest = first
+        for _ in range(MAX_DEPTH + 2):
+            deepest = self.comment('deeper', deepest)
+        self.assertEqual(deepest.depth, MAX_DEPTH)
+        self.assertLessEqual(len(deepest.path), Comment._meta.get_field('path').max_length)
+
+    def test_threads_page_depth_first_at_constant_cost(self):
+        first = self.comment('first')
+        second = self.comment('second')
+        reply = self.comment('first/a', first)
+        self.comment('second/a', second)
+        self.comment('first/a/i', reply)
+        self.comment('first/b', first)
+
+        expected = [('first', 0), ('first/a', 1), ('first/a/i', 2), ('first/b', 1), ('second', 0), ('second/a', 1)]
+        with mock.patch('apps.comments.views.COMMENTS_PER_PAGE', 2):
+            self.assertEqual(self.fetch_all(), expected)
+            self.assertEqual(self.fetch_all(root=reply.id), [('first/a', 1), ('first/a/i', 2)])
+
+            url = reverse('comments:get_comments', args=[self.story.id])
+            cursor = self.client.get(url, {'root': first.id}).json()['next_cursor']
+            with self.assertNumQueries(3):  # story, root, page
+                page = self.client.get(url, {'root': first.id, 'cursor': cursor}).json()
+            self.assertEqual([comment['text'] for comment in page['comments']], ['first/a/i', 'first/b'])
+
+        self.assertEqual(self.client.get(url, {'cursor': 'nope'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'root': 'nope'}).status_code, 400)
+
+    @override_settings(ANONYMOUS_PAGE_CACHE=False)
+    def test_story_page_shows_replies_at_every_depth(self):
+        first = self.comment('first')
+        reply = self.comment('first/a', first)
+        self.comment('first/a/i', reply)
+
+        response = self.client.get(self.story.get_absolute_url())
+
+        self.assertContains(response, 'first/a/i')
+        self.assertContains(response, 'class="reply-item', count=2)
+
+    def test_replies_stay_in_the_story_of_their_parent(self):
+        other = Story.objects.create(title='Cup final', content='...', author=self.author, status='published')
+        elsewhere = Comment.objects.create(story=other, author=self.author, text='elsewhere')
+        self.client.force_login(self.author)
+
+        response = self.client.post(reverse('comments:add_comment'), {
+            'story_slug': self.story.slug, 'text': 'reply', 'parent_id': elsewhere.id
+        })
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Comment.objects.filter(story=self.story).exists())
+
+    def test_deleting_a_comment_takes_its_replies(self):
+        first = self.comment('first')
+        reply = self.comment('first/a', first)
+        self.comment('first/a/i', reply)
+        self.comment('second')
+        self.client.force_login(self.author)
+
+        response = self.client.post(reverse('comments:delete_comment', args=[reply.id]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.fetch_all(), [('first', 0), ('second', 0)])
+
+
+class CommentCounterTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', password='x')
+        self.story = Story.objects.create(title='Derby day', content='...', author=self.author, status='published')
+        self.first = self.comment('first')
+        self.reply = self.comment('first/a', self.first)
+        self.comment('first/a/i', self.reply)
+        self.second = self.comment('second')
+
+    def comment(self, text, parent=None):
+        return Comment.objects.create(story=self.story, author=self.author, text=text, parent=parent)
+
+    def counts(self):
+        self.story.refresh_from_db()
+        return self.story.comments_count, *Comment._base_manager.filter(
+            pk__in=[self.first.pk, self.reply.pk]
+        ).order_by('depth').values_list('replies_count', flat=True)
+
+    def test_counters_follow_creates_and_soft_deletes(self):
+        self.assertEqual(self.counts(), (4, 1, 1))
+
+        self.client.force_login(self.author)
+        self.client.post(reverse('comments:delete_comment', args=[self.reply.id]))
+        self.assertEqual(self.counts(), (2, 0, 0))
+
+        self.reply.refresh_from_db()
+        self.reply.activate()
+        self.assertEqual(self.counts(), (3, 1, 0))
+
+        self.second.delete()
+        self.assertEqual(self.counts()[0], 2)
+
+    def test_reconcile_repairs_drift_in_batches(self):
+        reader = User.objects.create_user('reader', password='x')
+        CommentLike.objects.create(comment=self.second, user=reader)
+        Story.objects.filter(pk=self.story.pk).update(comments_count=40)
+        Comment.objects.filter(pk=self.first.pk).update(replies_count=7)
+
+        out = StringIO()
+        call_command('reconcile_counters', batch_size=1, stdout=out)
+
+        self.assertIn('Story.comments_count: repaired 1 rows.', out.getvalue())
+        self.assertIn('Comment.likes_count: repaired 1 rows.', out.getvalue())
+        self.assertEqual(self.counts(), (4, 1, 1))
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.likes_count, 1)
+
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertEqual(out.getvalue().count('repaired 0 rows.'), 4)
+
+
+class CommentThrottleTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', password='x')
+        self.reader = User.objects.create_user('reader', password='x')
+        self.story = Story.objects.create(title='Derby day', content='...', author=self.author, status='published')
+
+    def post(self, text='Great read'):
+        return self.client.post(reverse('comments:add_comment'), {'story_slug': self.story.slug, 'text': text})
+
+    @override_settings(THROTTLE_RATES={'comments': '3/m'})
+    def test_buckets_refill_and_are_per_user(self):
+        now = 1_000_000.0
+        with mock.patch('apps.utils.throttle.time.time', lambda: now):
+            self.client.force_login(self.reader)
+            self.assertEqual([self.post().status_code for _ in range(5)], [200, 200, 200, 429, 429])
+
+            response = self.post()
+            self.assertEqual(response['Retry-After'], '20')
+            self.assertEqual(response.json()['status'], 'error')
+
+            self.client.force_login(self.author)
+            self.assertEqual(self.post().status_code, 200)
+
+            self.client.force_login(self.reader)
+            now += 20
+            self.assertEqual(self.post().status_code, 200)
+            self.assertEqual(self.post().status_code, 429)
+
+        self.assertEqual(Comment.objects.filter(author=self.reader).count(), 4)
+
+    @override_settings(THROTTLE_RATES={'comments': '1/m'})
+    def test_only_requests_that_change_something_take_tokens(self):
+        self.client.force_login(self.reader)
+        for _ in range(3):
+            self.client.get(reverse('comments:add_comment'))
+        self.assertIsNone(cache.get(f'throttle:comments:user:{self.reader.pk}'))
+        self.assertEqual(self.post().status_code, 200)
+        self.assertEqual(self.post().status_code, 429)
+
+    @override_settings(THROTTLE_ENABLED=False, THROTTLE_RATES={'comments': '1/m'})
+    def test_throttling_can_be_switched_off(self):
+        self.client.force_login(self.reader)
+        self.assertEqual([self.post().status_code for _ in range(3)], [200, 200, 200])
@@ -1,12 +1,14 @@
 from django.urls import path
+from apps.utils.read_views import read_view
 from . import views
 
 app_name = 'comments'
 
 urlpatterns = [
     path('add/', views.add_comment, name='add_comment'),
-    path('edit/<int:comment_id>/', views.edit_comment, name='edit_comment'),
-    path('delete/<int:comment_id>/', views.delete_comment, name='delete_comment'),
-    path('like/<int:comment_id>/', views.like_comment, name='like_comment'),
-    path('get/<int:story_id>/', views.get_comments, name='get_comments'),
+    path('edit/<uuid:comment_id>/', views.edit_comment, name='edit_comment'),
+    path('delete/<uuid:comment_id>/', views.delete_comment, name='delete_comment'),
+    path('like/<uuid:comment_id>/', views.like_comment, name='like_comment'),
+    path('liked/', views.liked_comments, name='liked_comments'),
+    path('get/<uuid:story_id>/', read_view(views.get_comments, views.aget_comments), name='get_comments'),
 ]
@@ -1,14 +1,20 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib import messages
+from django.core.exceptions import ValidationError
 import json
 
-from .models import Comment, CommentLike
-from apps.story.models import Story
+from .models import COMMENTS_PER_PAGE, THREAD_ORDER, Comment, CommentLike
+from apps.story.live import publish_comment, publish_comment_likes
+from apps.story.models import Story, invalidate_story_page
+from apps.utils.likes import liked_ids, requested_like, set_like
+from apps.utils.pagination import InvalidCursor, apaginate_keyset, paginate_keyset
+from apps.utils.throttle import throttle
 
 @login_required
+@throttle('comments', '10/m', burst=5)
 def add_comment(request):
     """Add a new comment to a story"""
     if request.method == 'POST':
@@ -36,7 +42,7 @@ def add_comment(request):
                 story = get_object_or_404(Story, id=story_slug)
             parent = None
             if parent_id:
-                parent = get_object_or_404(Comment, id=parent_id)
+                parent = get_object_or_404(Comment, id=parent_id, story=story)
             
             comment = Comment.objects.create(
                 story=story,
@@ -44,6 +50,7 @@ def add_comment(request):
                 text=text,
                 parent=parent
             )
+            publish_comment(comment)
             
             return JsonResponse({
                 'status': 'success',
@@ -62,6 +69,11 @@ def add_comment(request):
                 'status': 'error',
                 'message': 'Invalid JSON data'
             }, status=400)
+        except Http404 as e:
+            return JsonResponse({
+                'status': 'error',
+                'message': str(e)
+            }, status=404)
         except Exception as e:
             return JsonResponse({
                 'status': 'error',
@@ -119,8 +131,9 @@ def delete_comment(request, comment_id):
     comment = get_object_or_404(Comment, id=comment_id, author=request.user)
     
     if request.method == 'POST':
-        comment.is_active = False
-        comment.save()
+        # Its replies go with it, in one range update of the thread
+        comment.deactivate_thread()
+        invalidate_story_page(comment.story_id)
         
         return JsonResponse({
             'status': 'success',
@@ -133,28 +146,29 @@ def delete_comment(request, comment_id):
     }, status=405)
 
 @login_required
+@throttle('likes', '60/m')
 def like_comment(request, comment_id):
     """Like or unlike a comment"""
     comment = get_object_or_404(Comment, id=comment_id)
     
     if request.method == 'POST':
-        like, created = CommentLike.objects.get_or_create(
-            comment=comment,
-            user=request.user
-        )
-        
-        if not created:
-            # Unlike
-            like.delete()
-            action = 'unliked'
-        else:
-            action = 'liked'
+        try:
+            liked = requested_like(request, lambda: comment.likes.filter(user=request.user).exists())
+        except ValueError as e:
+            return JsonResponse({
+                'status': 'error',
+                'message': str(e)
+            }, status=400)
         
-        likes_count = comment.likes.count()
+        # Idempotent: liking twice, or unliking what is not liked, changes nothing
+        changed, likes_count = set_like(CommentLike, comment, request.user, liked)
+        if changed:
+            publish_comment_likes(comment)
         
         return JsonResponse({
             'status': 'success',
-            'action': action,
+            'action': 'liked' if liked else 'unliked',
+            'changed': changed,
             'likes_count': likes_count
         })
     
@@ -163,48 +177,86 @@ def like_comment(request, comment_id):
         'message': 'Only POST method allowed'
     }, status=405)
 
+def liked_comments(request):
+    """Which of the comments in ?ids=a,b,c the user likes, in one query"""
+    ids = [comment_id for comment_id in request.GET.get('ids', '').split(',') if comment_id][:200]
+    try:
+        liked = liked_ids(CommentLike, Comment, request.user, ids)
+    except ValidationError:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Invalid comment id'
+        }, status=400)
+    
+    return JsonResponse({
+        'status': 'success',
+        'liked': sorted(str(comment_id) for comment_id in liked)
+    })
+
 def get_comments(request, story_id):
-    """Get all comments for a specific story"""
+    """
+    Page of a story's comments in thread order, depth-first
+
+    ?root=<comment id> limits it to that comment's thread, and ?cursor= is the
+    next_cursor or previous_cursor of another page. Each page is one seek
+    along the (story, path) index, however deep into the thread it is.
+    """
+    story = get_object_or_404(Story, id=story_id)
+    comments = Comment.objects.filter(story=story)
     try:
-        story = get_object_or_404(Story, id=story_id)
-        comments = Comment.objects.filter(
-            story=story,
-            is_active=True,
-            parent=None  # Only top-level comments
-        ).select_related('author').prefetch_related('replies', 'likes')
-        
-        comments_data = []
-        for comment in comments:
-            comment_data = {
+        root_id = request.GET.get('root')
+        if root_id:
+            comments = get_object_or_404(comments, id=root_id).subtree()
+        page = paginate_keyset(
+            comments.select_related('author'), THREAD_ORDER, request.GET.get('cursor'), COMMENTS_PER_PAGE
+        )
+    except (ValidationError, InvalidCursor):
+        return invalid_comments_page()
+    return comments_page(page)
+
+async def aget_comments(request, story_id):
+    """get_comments for the ASGI stack, see settings.ASYNC_READ_VIEWS"""
+    if not await Story.objects.filter(id=story_id).aexists():
+        raise Http404('No Story matches the given query.')
+    comments = Comment.objects.filter(story_id=story_id)
+    try:
+        root_id = request.GET.get('root')
+        if root_id:
+            try:
+                comments = (await comments.aget(id=root_id)).subtree()
+            except Comment.DoesNotExist:
+                raise Http404('No Comment matches the given query.')
+        page = await apaginate_keyset(
+            comments.select_related('author'), THREAD_ORDER, request.GET.get('cursor'), COMMENTS_PER_PAGE
+        )
+    except (ValidationError, InvalidCursor):
+        return invalid_comments_page()
+    return comments_page(page)
+
+def invalid_comments_page():
+    """Answer to a malformed ?root= or ?cursor="""
+    return JsonResponse({
+        'status': 'error',
+        'message': 'Invalid comment id or cursor'
+    }, status=400)
+
+def comments_page(page):
+    """JSON of a keyset page of comments"""
+    return JsonResponse({
+        'status': 'success',
+        'comments': [
+            {
                 'id': comment.id,
+                'parent_id': comment.parent_id,
+                'depth': comment.depth,
                 'text': comment.text,
                 'author': comment.author.username,
                 'created_at': comment.created_at.isoformat(),
-                'likes_count': comment.likes.count(),
+                'likes_count': comment.likes_count,
                 'replies_count': comment.replies_count,
-                'replies': []
             }
-            
-            # Add replies
-            for reply in comment.replies.filter(is_active=True).select_related('author'):
-                reply_data = {
-                    'id': reply.id,
-                    'text': reply.text,
-                    'author': reply.author.username,
-                    'created_at': reply.created_at.isoformat(),
-                    'likes_count': reply.likes.count()
-                }
-                comment_data['replies'].append(reply_data)
-            
-            comments_data.append(comment_data)
-        
-        return JsonResponse({
-            'status': 'success',
-            'comments': comments_data
-        })
-        
-    except Exception as e:
-        return JsonResponse({
-            'status': 'error',
-            'message': str(e)
-        }, status=500)
+            for comment in page
+        ],
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor
+    })
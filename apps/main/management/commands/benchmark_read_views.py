@@ -0,0 +1,241 @@
+"""
+Requests per second and latency of the hot read views, under WSGI and ASGI.
+
+By default both stacks are driven in-process, without sockets, at the same
+concurrency: WSGIHandler from a pool of threads, as a threaded WSGI server
+runs it, and core.asgi.application from as many asyncio tasks on one event
+loop, as uvicorn runs it. Each stack serves the sync views and then their
+async twins (apps/utils/read_views.py), so that settings.ASYNC_READ_VIEWS is
+chosen from measurements; --views limits the run to one set. --url measures
+running servers over HTTP instead, e.g. gunicorn and uvicorn started side by
+side, each serving the views it is configured with.
+"""
+import asyncio
+import http.client
+import importlib
+import io
+import math
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.urls import clear_url_caches, reverse
+
+from apps.story.models import Story
+
+VIEW_SETS = ('sync', 'async')
+# URLconfs that call read_view; the root URLconf is reloaded after them, since its
+# include()s hold resolvers that cache the patterns they were built with
+URLCONF_MODULES = ['apps.main.urls', 'apps.story.urls', 'apps.comments.urls', 'apps.rss_feeds.urls']
+
+
+class Command(BaseCommand):
+    help = 'Compare requests/sec and p99 latency of the sync and async read views under WSGI and ASGI'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500,
+                            help='Timed requests per stack, spread over the paths')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Requests in flight at once')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Path to request; repeat for several (default: the hot read views)')
+        parser.add_argument('--no-page-cache', action='store_true',
+                            help='Render every request instead of serving anonymous pages from the cache')
+        parser.add_argument('--views', action='append', choices=VIEW_SETS,
+                            help='Read views to serve in-process; repeat for both (default: both)')
+        parser.add_argument('--url', action='append', dest='urls', metavar='NAME=URL',
+                            help='Measure a running server instead, e.g. asgi=http://127.0.0.1:8001; repeatable')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or default_paths()
+        if options['urls']:
+            runs = [(None, self.server_stack(spec)) for spec in options['urls']]
+        else:
+            runs = [
+                (views, (f'{name}/{views}', run))
+                for views in options['views'] or VIEW_SETS
+                for name, run in (('wsgi', run_wsgi), ('asgi', run_asgi))
+            ]
+
+        results = {}
+        with override_settings(ANONYMOUS_PAGE_CACHE=not options['no_page_cache']):
+            for views, (name, run) in runs:
+                with routed_read_views(views == 'async') if views else nullcontext():
+                    # One untimed pass, so that every run starts from the same warm caches
+                    run(paths, len(paths), 1)
+                    results[name] = run(paths, options['requests'], options['concurrency'])
+
+        self.stdout.write(f"{len(paths)} paths, {options['requests']} requests, concurrency {options['concurrency']}")
+        for name, (elapsed, latencies, errors) in results.items():
+            self.stdout.write(
+                f'{name:>12}: {len(latencies) / elapsed:8.1f} req/s   '
+                f'p50 {percentile(latencies, 50) * 1000:7.1f} ms   '
+                f'p99 {percentile(latencies, 99) * 1000:7.1f} ms   '
+                f'{errors} errors'
+            )
+
+    def server_stack(self, spec):
+        name, _, url = spec.partition('=')
+        parts = urlsplit(url)
+        if not name or parts.scheme != 'http' or not parts.hostname:
+            raise CommandError(f'--url takes NAME=http://host:port, not {spec!r}')
+        return name, lambda paths, count, concurrency: run_http(parts, paths, count, concurrency)
+
+
+def default_paths():
+    paths = [reverse('main:home'), reverse('story:story_list'), reverse('rss_feeds:feed_list'),
+             reverse('rss_feeds:feed_api')]
+    story = Story.objects.filter(status='published').order_by('-published_at').first()
+    if story is not None:
+        paths += [story.get_absolute_url(), reverse('comments:get_comments', args=[story.id])]
+    return paths
+
+
+@contextmanager
+def routed_read_views(async_views: bool):
+    """Route to the async (or sync) read views for a while, e.g. to compare them"""
+    try:
+        with override_settings(ASYNC_READ_VIEWS=async_views):
+            reload_urlconfs()
+            yield
+    finally:
+        reload_urlconfs()
+
+
+def reload_urlconfs() -> None:
+    for name in URLCONF_MODULES + [settings.ROOT_URLCONF]:
+        importlib.reload(importlib.import_module(name))
+    clear_url_caches()
+
+
+def percentile(values, p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def run_threads(request, paths, count, concurrency):
+    """Time count calls of request(path), from concurrency threads; request says whether it succeeded"""
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    queue = iter(paths[index % len(paths)] for index in range(count))
+
+    def worker():
+        nonlocal errors
+        while True:
+            with lock:
+                path = next(queue, None)
+            if path is None:
+                return
+            started = time.perf_counter()
+            ok = request(path)
+            with lock:
+                latencies.append(time.perf_counter() - started)
+                errors += not ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    return time.perf_counter() - started, latencies, errors
+
+
+def run_wsgi(paths, count, concurrency):
+    handler = WSGIHandler()
+
+    def request(path):
+        status = []
+        body = handler(wsgi_environ(path), lambda line, headers, exc_info=None: status.append(line))
+        try:
+            b''.join(body)
+        finally:
+            body.close()
+        return status[0].startswith('2')
+
+    return run_threads(request, paths, count, concurrency)
+
+
+def wsgi_environ(path):
+    path, _, query = path.partition('?')
+    return {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+        'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1', 'HTTP_HOST': 'localhost',
+        'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(b''), 'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+
+
+def run_asgi(paths, count, concurrency):
+    from core.asgi import application
+
+    async def request(path):
+        path, _, query = path.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+            'root_path': '', 'headers': [(b'host', b'localhost')],
+            'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+        }
+        requested = False
+        status = []
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # The client stays connected until it has the response
+            await asyncio.Future()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+
+        await application(scope, receive, send)
+        return 200 <= status[0] < 300
+
+    async def run():
+        latencies, errors = [], 0
+        queue = iter(paths[index % len(paths)] for index in range(count))
+
+        async def worker():
+            nonlocal errors
+            for path in queue:
+                started = time.perf_counter()
+                ok = await request(path)
+                latencies.append(time.perf_counter() - started)
+                errors += not ok
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - started, latencies, errors
+
+    return asyncio.run(run())
+
+
+def run_http(parts, paths, count, concurrency):
+    connections = threading.local()
+
+    def request(path):
+        if not hasattr(connections, 'connection'):
+            connections.connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        connection = connections.connection
+        try:
+            connection.request('GET', parts.path.rstrip('/') + path)
+            response = connection.getresponse()
+            response.read()
+            return 200 <= response.status < 300
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            return False
+
+    return run_threads(request, paths, count, concurrency)
@@ -1,4 +1,5 @@
 from django.urls import path
+from apps.utils.read_views import read_view
 from . import views
 
 app_name = 'main'
@@ -8,6 +9,7 @@ urlpatterns = [
     path('about/', views.about, name='about'),
     path('reports/', views.reports, name='reports'),
     path('api/example/', views.api_example, name='api_example'),
+    path('personal/', views.personal, name='personal'),
     path('stories/', views.stories, name='stories'),
-    path('', views.home, name='home'),
+    path('', read_view(views.home, views.ahome), name='home'),
 ]
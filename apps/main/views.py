@@ -1,28 +1,97 @@
 from django.shortcuts import render, redirect
 from django.http import JsonResponse
+from django.core.exceptions import ValidationError
+from django.utils.cache import patch_cache_control
 from django.views.decorators.csrf import csrf_exempt
-from django.core.paginator import Paginator
-from apps.story.models import Story, StoryTag
+from apps.comments.models import Comment, CommentLike
+from apps.story.cards import aattach_cards, aload_cards, attach_cards, card_page_queryset, load_cards
+from apps.story.models import Story, StoryLike
+from apps.utils.likes import liked_ids
+from apps.utils.page_cache import anonymous_page_cache
+from apps.utils.pagination import (
+    InvalidCursor, acached_count, apaginate_keyset, cached_count, page_query, paginate_keyset
+)
+from apps.utils.users import auser
 import json
 
 
+HOME_ORDERING = ('-published_at', '-id')
+
+
+@anonymous_page_cache('stories', personalized=True)
 def home(request):
-    """Home page view showing featured stories with tags and pagination"""
-    stories = Story.objects.filter(status='published').order_by('-published_at')
-    tags = StoryTag.objects.all().order_by('name')
+    """Home page view showing featured stories with tags and keyset pagination"""
+    stories = card_page_queryset(Story.objects.filter(status='published'))
 
-    # Pagination: 6 stories per page
-    paginator = Paginator(stories, 6)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Pagination: 6 stories per page, by cursor
+    try:
+        page_obj = paginate_keyset(stories, HOME_ORDERING, request.GET.get('cursor'), 6)
+    except InvalidCursor:
+        page_obj = paginate_keyset(stories, HOME_ORDERING, None, 6)
+    attach_cards(page_obj, 'home', load_cards)
 
-    context = {
+    return render(request, 'home.html', home_context(request, page_obj, cached_count(stories)))
+
+
+@anonymous_page_cache('stories', personalized=True)
+async def ahome(request):
+    """home for the ASGI stack, see settings.ASYNC_READ_VIEWS"""
+    stories = card_page_queryset(Story.objects.filter(status='published'))
+
+    try:
+        page_obj = await apaginate_keyset(stories, HOME_ORDERING, request.GET.get('cursor'), 6)
+    except InvalidCursor:
+        page_obj = await apaginate_keyset(stories, HOME_ORDERING, None, 6)
+    await aattach_cards(page_obj, 'home', aload_cards)
+
+    context = home_context(request, page_obj, await acached_count(stories))
+    # The templates ask who the user is, which they may not look up themselves
+    await auser(request)
+    return render(request, 'home.html', context)
+
+
+def home_context(request, page_obj, total_stories):
+    """Template context of home and ahome"""
+    return {
         'title': 'Home',
         'page_title': 'Goal Line Report - Dashboard',
         'page_obj': page_obj,   # stories with pagination
-        'tags': tags,           # all tags
+        'previous_page_query': page_obj.has_previous and page_query(request, cursor=page_obj.previous_cursor),
+        'next_page_query': page_obj.has_next and page_query(request, cursor=page_obj.next_cursor),
+        'total_stories': total_stories,
     }
-    return render(request, 'home.html', context)
+
+
+def personal(request):
+    """
+    Per-user bits of a cached page, filled into its data-personal-* holes by main.js
+
+    Takes the ids of the stories and comments on the page as ?stories=a,b and
+    ?comments=c,d and answers which of them the user likes, along with who the
+    user is and what they may do.
+    """
+    user = request.user
+    if not user.is_authenticated:
+        response = JsonResponse({'authenticated': False})
+    else:
+        story_ids = [story_id for story_id in request.GET.get('stories', '').split(',') if story_id][:100]
+        comment_ids = [comment_id for comment_id in request.GET.get('comments', '').split(',') if comment_id][:200]
+        try:
+            liked_stories = liked_ids(StoryLike, Story, user, story_ids)
+            liked_comments = liked_ids(CommentLike, Comment, user, comment_ids)
+        except ValidationError:
+            return JsonResponse({'status': 'error', 'message': 'Invalid id'}, status=400)
+        response = JsonResponse({
+            'authenticated': True,
+            'id': user.id,
+            'username': user.username,
+            'is_editor': user.profile.is_editor,
+            'is_chief_editor': user.profile.is_chief_editor,
+            'liked_stories': sorted(str(story_id) for story_id in liked_stories),
+            'liked_comments': sorted(str(comment_id) for comment_id in liked_comments),
+        })
+    patch_cache_control(response, private=True, no_store=True)
+    return response
 
 
 def about(request):
@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from .models import RSSFeedSource, RSSFeedItem, FeedFetchLog
+from .models import RSSFeedSource, RSSFeedItem, FeedFetchLog, FeedPayload, DeadLetter, WebSubSubscription, FeedImage
+from .services import DeadLetterQueue, RSSFeedFetcher
 
 
 @admin.register(RSSFeedSource)
@@ -34,18 +35,23 @@ class RSSFeedSourceAdmin(admin.ModelAdmin):
 @admin.register(RSSFeedItem)
 class RSSFeedItemAdmin(admin.ModelAdmin):
     list_display = ['title', 'source', 'author', 'published_date', 'is_read', 'is_archived', 'fetched_at']
-    list_filter = ['source', 'is_read', 'is_archived', 'published_date', 'fetched_at', 'category']
+    list_filter = ['source', 'is_read', 'is_archived', 'published_date', 'fetched_at', 'category', 'tags']
     search_fields = ['title', 'description', 'author', 'category']
-    readonly_fields = ['fetched_at', 'guid']
+    filter_horizontal = ['tags']
+    readonly_fields = ['fetched_at', 'guid', 'canonical_link', 'content_hash', 'image_url', 'image', 'image_checked_at']
     list_editable = ['is_read', 'is_archived']
     date_hierarchy = 'published_date'
     
     fieldsets = (
         ('Content', {
-            'fields': ('title', 'description', 'content', 'link', 'author', 'category')
+            'fields': ('title', 'description', 'content', 'link', 'author', 'category', 'tags')
         }),
         ('Metadata', {
-            'fields': ('source', 'guid', 'published_date', 'fetched_at')
+            'fields': ('source', 'guid', 'canonical_link', 'content_hash', 'published_date', 'fetched_at')
+        }),
+        ('Image', {
+            'fields': ('image_url', 'image', 'image_checked_at'),
+            'classes': ('collapse',)
         }),
         ('Status', {
             'fields': ('is_read', 'is_archived')
@@ -69,7 +75,7 @@ class RSSFeedItemAdmin(admin.ModelAdmin):
 
 @admin.register(FeedFetchLog)
 class FeedFetchLogAdmin(admin.ModelAdmin):
-    list_display = ['source', 'status', 'items_fetched', 'items_new', 'fetch_duration', 'created_at']
+    list_display = ['source', 'status', 'items_fetched', 'items_new', 'items_updated', 'fetch_duration', 'created_at']
     list_filter = ['source', 'status', 'created_at']
     search_fields = ['source__name', 'error_message']
     readonly_fields = ['created_at']
@@ -77,7 +83,7 @@ class FeedFetchLogAdmin(admin.ModelAdmin):
     
     fieldsets = (
         ('Fetch Information', {
-            'fields': ('source', 'status', 'items_fetched', 'items_new', 'fetch_duration')
+            'fields': ('source', 'status', 'items_fetched', 'items_new', 'items_updated', 'fetch_duration', 'payload')
         }),
         ('Error Details', {
             'fields': ('error_message',),
@@ -100,3 +106,109 @@ class FeedFetchLogAdmin(admin.ModelAdmin):
     def has_change_permission(self, request, obj=None):
         """Disable editing of fetch logs"""
         return False
+
+
+@admin.register(FeedPayload)
+class FeedPayloadAdmin(admin.ModelAdmin):
+    list_display = ['content_hash', 'size', 'compressed_size', 'created_at']
+    search_fields = ['content_hash']
+    readonly_fields = ['content_hash', 'size', 'compressed_size', 'created_at']
+    exclude = ['data']
+    date_hierarchy = 'created_at'
+    
+    def has_add_permission(self, request):
+        """Payloads are only written by the fetcher"""
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        """Archived payloads are immutable"""
+        return False
+
+
+@admin.register(DeadLetter)
+class DeadLetterAdmin(admin.ModelAdmin):
+    list_display = ['source', 'kind', 'stage', 'status', 'attempts', 'short_error', 'last_failed_at']
+    list_filter = ['status', 'kind', 'stage', 'source']
+    search_fields = ['fingerprint', 'error_message']
+    readonly_fields = ['source', 'kind', 'stage', 'fingerprint', 'error_message', 'payload', 'attempts',
+                       'last_failed_at', 'created_at', 'updated_at']
+    date_hierarchy = 'last_failed_at'
+    actions = ['requeue_selected']
+    
+    fieldsets = (
+        ('Failure', {
+            'fields': ('source', 'kind', 'stage', 'status', 'attempts', 'error_message')
+        }),
+        ('Payload', {
+            'fields': ('fingerprint', 'payload'),
+            'classes': ('collapse',)
+        }),
+        ('Timestamps', {
+            'fields': ('last_failed_at', 'created_at', 'updated_at'),
+            'classes': ('collapse',)
+        }),
+    )
+    
+    def get_queryset(self, request):
+        """Optimize queryset with select_related"""
+        return super().get_queryset(request).select_related('source')
+    
+    def has_add_permission(self, request):
+        """Dead letters are only written by the fetcher"""
+        return False
+    
+    def short_error(self, obj):
+        """Display truncated error message"""
+        return obj.error_message[:100]
+    short_error.short_description = 'Error'
+    
+    @admin.action(description='Requeue selected dead letters')
+    def requeue_selected(self, request, queryset):
+        """Run the selected pending dead letters through the pipeline again"""
+        result = DeadLetterQueue().requeue(queryset)
+        self.message_user(request, f"Requeued {result['requeued']} dead letters, {result['resolved']} resolved.")
+
+
+@admin.register(WebSubSubscription)
+class WebSubSubscriptionAdmin(admin.ModelAdmin):
+    list_display = ['source', 'hub_url', 'state', 'lease_expires_at', 'last_push_at', 'pushes_received']
+    list_filter = ['state', 'source']
+    search_fields = ['hub_url', 'topic_url']
+    readonly_fields = ['source', 'hub_url', 'topic_url', 'state', 'lease_expires_at', 'last_requested_at',
+                       'last_push_at', 'pushes_received', 'error_message', 'created_at', 'updated_at']
+    actions = ['resubscribe_selected']
+    
+    def get_queryset(self, request):
+        """Optimize queryset with select_related"""
+        return super().get_queryset(request).select_related('source')
+    
+    def has_add_permission(self, request):
+        """Subscriptions are created from the hubs feeds advertise"""
+        return False
+    
+    @admin.action(description='Send a new subscription request to the hub')
+    def resubscribe_selected(self, request, queryset):
+        """Ask the hub for a fresh lease for each selected subscription"""
+        websub = RSSFeedFetcher().websub
+        if not websub.enabled:
+            self.message_user(request, 'Set RSS_FEEDS_WEBSUB_CALLBACK_BASE_URL to enable WebSub.', level='error')
+            return
+        accepted = sum(websub.subscribe(subscription) for subscription in queryset)
+        self.message_user(request, f"Hub accepted {accepted} of {queryset.count()} subscription requests.")
+
+
+@admin.register(FeedImage)
+class FeedImageAdmin(admin.ModelAdmin):
+    list_display = ['preview', 'content_hash', 'width', 'height', 'original_size', 'created_at']
+    search_fields = ['content_hash']
+    readonly_fields = ['preview', 'content_hash', 'thumbnail', 'width', 'height', 'original_size', 'created_at']
+    date_hierarchy = 'created_at'
+    
+    def has_add_permission(self, request):
+        """Thumbnails are only made by the thumbnail task"""
+        return False
+    
+    def preview(self, obj):
+        """Display the thumbnail"""
+        return format_html('<img src="{}" style="max-height: 60px;">', obj.thumbnail.url)
+    preview.short_description = 'Thumbnail'
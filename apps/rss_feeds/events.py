@@ -0,0 +1,117 @@
+"""
+Server-Sent Events stream of newly ingested feed items.
+
+Fetchers (usually Celery workers) publish compact events to the ITEMS_CHANNEL
+broadcast channel once their transaction commits, and each ASGI process tails
+it with one Broadcaster (apps/utils/broadcast.py) shared by every open stream.
+Clients resume with Last-Event-ID from whatever its buffer still holds.
+"""
+import asyncio
+from typing import Iterable, Optional
+from urllib.parse import parse_qs
+
+from django.conf import settings
+
+from apps.utils.broadcast import Broadcaster, publish
+
+ITEMS_CHANNEL = 'rss:items'
+# Comment line sent to idle connections so that proxies keep them open
+KEEPALIVE_SECONDS = 15
+# Reconnection delay suggested to EventSource clients, in milliseconds
+RETRY_MILLISECONDS = 3000
+
+
+def item_event(item) -> dict:
+    """Compact event payload of a feed item"""
+    return {
+        'id': str(item.id),
+        'title': item.title,
+        'link': item.link,
+        'source': item.source.source_type,
+        'published': item.published_date.isoformat() if item.published_date else None,
+    }
+
+
+def publish_items(items: Iterable) -> None:
+    """Publish new-item events once the surrounding transaction commits"""
+    publish(ITEMS_CHANNEL, [item_event(item) for item in items])
+
+
+broker = Broadcaster(
+    buffer_size=getattr(settings, 'RSS_FEEDS_SSE_BUFFER_SIZE', 1000),
+    poll_interval=getattr(settings, 'RSS_FEEDS_SSE_POLL_INTERVAL', 0.5),
+)
+
+
+def format_event(seq: int, data: str) -> bytes:
+    return f"id: {seq}\nevent: item\ndata: {data}\n\n".encode('utf-8')
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+def _last_event_id(scope) -> Optional[int]:
+    """Last-Event-ID header, or ?last_event_id= for clients that cannot set headers"""
+    value = dict(scope.get('headers', [])).get(b'last-event-id', b'').decode('latin-1')
+    if not value:
+        value = parse_qs(scope.get('query_string', b'').decode('latin-1')).get('last_event_id', [''])[0]
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+async def sse_application(scope, receive, send):
+    """ASGI application streaming new-item events to EventSource clients"""
+    if scope['type'] != 'http':
+        return
+    if scope['method'] != 'GET':
+        await send({'type': 'http.response.start', 'status': 405, 'headers': [(b'allow', b'GET')]})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    channel = await broker.subscribe(ITEMS_CHANNEL)
+    try:
+        last_id = _last_event_id(scope)
+        if last_id is None or last_id > channel.last_id:
+            # New clients only want what happens from now on; ids from before
+            # a cache flush are meaningless
+            last_id = channel.last_id
+
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': f"retry: {RETRY_MILLISECONDS}\n\n".encode(), 'more_body': True})
+
+        disconnected = asyncio.create_task(_wait_for_disconnect(receive))
+        try:
+            while True:
+                events = channel.since(last_id)
+                if events:
+                    last_id = events[-1][0]
+                    body = b''.join(format_event(seq, data) for seq, data in events)
+                    await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+                    continue
+
+                waiting = asyncio.create_task(channel.wait(KEEPALIVE_SECONDS))
+                await asyncio.wait({disconnected, waiting}, return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    waiting.cancel()
+                    break
+                if not waiting.result():
+                    await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+        finally:
+            disconnected.cancel()
+    except OSError:
+        # Client went away mid-write
+        pass
+    finally:
+        broker.unsubscribe(ITEMS_CHANNEL)
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.utils.text import slugify
+from apps.rss_feeds.models import RSSFeedItem
+from apps.rss_feeds.tag_dictionary import TAG_DICTIONARY
+from apps.rss_feeds.tagging import RSSTagger
+from apps.story.models import StoryTag
+
+
+class Command(BaseCommand):
+    help = 'Create story tags for the clubs and competitions in the tag dictionary'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retag',
+            action='store_true',
+            help='Re-tag every stored RSS item afterwards',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Items tagged per bulk insert with --retag (default: 2000)',
+        )
+
+    def handle(self, *args, **options):
+        existing = set(StoryTag.objects.values_list('slug', flat=True))
+        created = 0
+        for name in TAG_DICTIONARY:
+            if slugify(name) not in existing:
+                StoryTag.objects.create(name=name)
+                created += 1
+        self.stdout.write(f'Created {created} tags ({len(TAG_DICTIONARY) - created} already existed).')
+
+        if options['retag']:
+            tagger = RSSTagger()
+            batch_size = options['batch_size']
+            items = RSSFeedItem.objects.only('id', 'title', 'description').order_by('id')
+            tagged = links = 0
+            batch = []
+            for item in items.iterator(chunk_size=batch_size):
+                batch.append(item)
+                if len(batch) == batch_size:
+                    links += tagger.tag_items(batch, replace=True)
+                    tagged += len(batch)
+                    batch = []
+            links += tagger.tag_items(batch, replace=True)
+            tagged += len(batch)
+            self.stdout.write(f'Re-tagged {tagged} items with {links} tag links.')
+
+        self.stdout.write(
+            self.style.SUCCESS('Successfully initialized the tag dictionary!')
+        )
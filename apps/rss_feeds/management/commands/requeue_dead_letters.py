@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from apps.rss_feeds.models import DeadLetter
+from apps.rss_feeds.services import DeadLetterQueue
+
+
+class Command(BaseCommand):
+    help = 'Run pending dead letters (failed entries and fetches) through the RSS pipeline again'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kind',
+            type=str,
+            choices=[kind for kind, _ in DeadLetter.KIND_CHOICES],
+            help='Only requeue entry or fetch dead letters',
+        )
+        parser.add_argument(
+            '--stage',
+            type=str,
+            choices=[stage for stage, _ in DeadLetter.STAGE_CHOICES],
+            help='Only requeue dead letters that failed at this stage',
+        )
+        parser.add_argument(
+            '--source',
+            type=str,
+            help='Only requeue dead letters from this source type',
+        )
+
+    def handle(self, *args, **options):
+        letters = DeadLetter.objects.filter(status='pending')
+        if options['kind']:
+            letters = letters.filter(kind=options['kind'])
+        if options['stage']:
+            letters = letters.filter(stage=options['stage'])
+        if options['source']:
+            letters = letters.filter(source__source_type=options['source'])
+
+        self.stdout.write('Requeueing dead letters...')
+        result = DeadLetterQueue().requeue(letters)
+
+        failed = result['requeued'] - result['resolved']
+        style = self.style.SUCCESS if not failed else self.style.WARNING
+        self.stdout.write(
+            style(f"Requeued {result['requeued']} dead letters: {result['resolved']} resolved, {failed} failed again")
+        )
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-19 07:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss_feeds', '0002_rename_rss_feeds_r_publish_8b8c8c_idx_rss_feeds_r_publish_967bff_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedPayload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('content_hash', models.CharField(max_length=64, unique=True)),
+                ('data', models.BinaryField()),
+                ('size', models.PositiveIntegerField(help_text='Uncompressed size in bytes')),
+                ('compressed_size', models.PositiveIntegerField(help_text='Compressed size in bytes')),
+            ],
+            options={
+                'verbose_name': 'Feed Payload',
+                'verbose_name_plural': 'Feed Payloads',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='feedfetchlog',
+            name='payload',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='fetch_logs', to='rss_feeds.feedpayload'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-19 07:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss_feeds', '0003_feedpayload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feedfetchlog',
+            name='items_updated',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='rssfeeditem',
+            name='content_hash',
+            field=models.CharField(blank=True, help_text='Hash of the normalized fields, used to detect updates', max_length=32),
+        ),
+    ]
@@ -0,0 +1,124 @@
+# Generated by Django 4.2.7 on 2026-10-19 07:09
+
+import hashlib
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+# Frozen copies of apps.rss_feeds.parsing.canonicalize_url and key_digest as
+# they were when this migration was written; later changes to those must not
+# change what it does
+SLASHES_RE = re.compile(r'/{2,}')
+TRACKING_PARAM_PREFIXES = ('utm_',)
+TRACKING_PARAMS = {'fbclid', 'gclid', 'dclid', 'msclkid', 'igshid', 'mc_cid', 'mc_eid', 'ocid', 'cmpid', 'at_medium', 'at_campaign'}
+
+
+def canonicalize_url(url):
+    url = (url or '').strip()
+    if not url:
+        return ''
+
+    parts = urlsplit(url)
+    if parts.scheme.lower() not in ('http', 'https'):
+        return url
+
+    try:
+        port = parts.port
+    except ValueError:
+        return url
+
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    if port and port not in (80, 443):
+        host = f"{host}:{port}"
+
+    path = SLASHES_RE.sub('/', parts.path) or '/'
+    if len(path) > 1:
+        path = path.rstrip('/')
+
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PARAM_PREFIXES)
+    )
+    return urlunsplit(('https', host, path, urlencode(query), ''))
+
+
+def key_digest(value):
+    if not value:
+        return None
+    return hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+
+
+def backfill_hashed_keys(apps, schema_editor):
+    """Fill canonical_link, guid_hash and link_hash for existing items, in batches"""
+    RSSFeedItem = apps.get_model('rss_feeds', 'RSSFeedItem')
+    manager = RSSFeedItem._base_manager
+    seen_links = set()
+    last_id = None
+
+    while True:
+        batch = manager.order_by('id').only('id', 'guid', 'link', 'fetched_at')
+        if last_id is not None:
+            batch = batch.filter(id__gt=last_id)
+        batch = list(batch[:BATCH_SIZE])
+        if not batch:
+            break
+
+        for item in batch:
+            item.canonical_link = canonicalize_url(item.link)
+            item.guid_hash = key_digest(item.guid)
+            link_hash = key_digest(item.canonical_link)
+            # Rows that already duplicate an article keep a NULL link key
+            if link_hash in seen_links:
+                link_hash = None
+            elif link_hash is not None:
+                seen_links.add(link_hash)
+            item.link_hash = link_hash
+
+        manager.bulk_update(batch, ['canonical_link', 'guid_hash', 'link_hash'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss_feeds', '0004_rssfeeditem_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rssfeeditem',
+            name='canonical_link',
+            field=models.URLField(blank=True, help_text='Link without tracking parameters, used for dedupe', max_length=1000),
+        ),
+        migrations.AddField(
+            model_name='rssfeeditem',
+            name='guid_hash',
+            field=models.BinaryField(editable=False, max_length=16, null=True),
+        ),
+        migrations.AddField(
+            model_name='rssfeeditem',
+            name='link_hash',
+            field=models.BinaryField(editable=False, max_length=16, null=True),
+        ),
+        migrations.RunPython(backfill_hashed_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='rssfeeditem',
+            name='guid_hash',
+            field=models.BinaryField(editable=False, max_length=16, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='rssfeeditem',
+            name='link_hash',
+            field=models.BinaryField(editable=False, max_length=16, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='rssfeeditem',
+            name='guid',
+            field=models.CharField(max_length=500),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-19 07:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss_feeds', '0005_rssfeeditem_hashed_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeadLetter',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('kind', models.CharField(choices=[('entry', 'Entry'), ('fetch', 'Fetch')], max_length=10)),
+                ('stage', models.CharField(choices=[('fetch', 'Fetch'), ('parse', 'Parse'), ('store', 'Store')], max_length=10)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('requeued', 'Requeued'), ('resolved', 'Resolved')], default='pending', max_length=10)),
+                ('fingerprint', models.CharField(help_text='Hash of the raw entry (or feed URL), used to skip known-bad input', max_length=32)),
+                ('error_message', models.TextField(blank=True)),
+                ('payload', models.TextField(blank=True, help_text='Raw entry, normalized entry or response fragment')),
+                ('attempts', models.PositiveIntegerField(default=1)),
+                ('last_failed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dead_letters', to='rss_feeds.rssfeedsource')),
+            ],
+            options={
+                'verbose_name': 'Dead Letter',
+                'verbose_name_plural': 'Dead Letters',
+                'ordering': ['-last_failed_at'],
+                'indexes': [models.Index(fields=['status', 'kind'], name='rss_feeds_d_status_d42b96_idx')],
+                'unique_together': {('source', 'kind', 'fingerprint')},
+            },
+        ),
+    ]
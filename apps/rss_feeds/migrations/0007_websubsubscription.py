@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-19 07:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss_feeds', '0006_deadletter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebSubSubscription',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('hub_url', models.URLField(max_length=500)),
+                ('topic_url', models.URLField(max_length=500)),
+                ('secret', models.CharField(editable=False, help_text='HMAC key the hub signs pushed payloads with', max_length=64)),
+                ('state', models.CharField(choices=[('pending', 'Pending Verification'), ('active', 'Active'), ('denied', 'Denied'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('last_requested_at', models.DateTimeField(blank=True, null=True)),
+                ('last_push_at', models.DateTimeField(blank=True, null=True)),
+                ('pushes_received', models.PositiveIntegerField(default=0)),
+                ('error_message', models.TextField(blank=True)),
+                ('source', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='websub', to='rss_feeds.rssfeedsource')),
+            ],
+            options={
+                'verbose_name': 'WebSub Subscription',
+                'verbose_name_plural': 'WebSub Subscriptions',
+                'ordering': ['source__name'],
+            },
+        ),
+    ]
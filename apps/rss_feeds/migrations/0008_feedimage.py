@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-19 07:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss_feeds', '0007_websubsubscription'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedImage',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('content_hash', models.CharField(help_text='SHA-256 of the downloaded image', max_length=64, unique=True)),
+                ('thumbnail', models.FileField(upload_to='rss_thumbnails/')),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('original_size', models.PositiveIntegerField(help_text='Size of the downloaded image in bytes')),
+            ],
+            options={
+                'verbose_name': 'Feed Image',
+                'verbose_name_plural': 'Feed Images',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='rssfeeditem',
+            name='image_checked_at',
+            field=models.DateTimeField(blank=True, help_text='When the thumbnail stage handled image_url', null=True),
+        ),
+        migrations.AddField(
+            model_name='rssfeeditem',
+            name='image_url',
+            field=models.URLField(blank=True, help_text='From media:thumbnail, media:content or an enclosure', max_length=1000),
+        ),
+        migrations.AddField(
+            model_name='rssfeeditem',
+            name='image',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='items', to='rss_feeds.feedimage'),
+        ),
+    ]
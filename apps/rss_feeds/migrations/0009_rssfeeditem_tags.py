@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-19 07:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('story', '0004_storytag_aliases'),
+        ('rss_feeds', '0008_feedimage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rssfeeditem',
+            name='tags',
+            field=models.ManyToManyField(blank=True, related_name='rss_items', to='story.storytag'),
+        ),
+    ]
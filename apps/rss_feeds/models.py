@@ -1,7 +1,10 @@
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 import uuid
 from apps.utils.models import CoreModel
+from apps.utils.page_cache import invalidate
 
 
 class RSSFeedSource(CoreModel):
@@ -33,6 +36,23 @@ class RSSFeedSource(CoreModel):
         return self.feed_items.count()
 
 
+class FeedImage(CoreModel):
+    """WebP thumbnail of an item image, deduplicated by the hash of the original"""
+    content_hash = models.CharField(max_length=64, unique=True, help_text='SHA-256 of the downloaded image')
+    thumbnail = models.FileField(upload_to='rss_thumbnails/')
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    original_size = models.PositiveIntegerField(help_text='Size of the downloaded image in bytes')
+    
+    class Meta:
+        verbose_name = 'Feed Image'
+        verbose_name_plural = 'Feed Images'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.content_hash[:12]} ({self.width}x{self.height})"
+
+
 class RSSFeedItem(CoreModel):
     """Model to store individual RSS feed items"""
     source = models.ForeignKey(RSSFeedSource, on_delete=models.CASCADE, related_name='feed_items')
@@ -40,9 +60,18 @@ class RSSFeedItem(CoreModel):
     description = models.TextField(blank=True)
     content = models.TextField(blank=True)
     link = models.URLField(max_length=1000)
+    canonical_link = models.URLField(max_length=1000, blank=True, help_text='Link without tracking parameters, used for dedupe')
     author = models.CharField(max_length=200, blank=True)
     category = models.CharField(max_length=100, blank=True)
-    guid = models.CharField(max_length=500, unique=True)
+    guid = models.CharField(max_length=500)
+    # Fixed-width digests of guid and canonical_link; all dedupe lookups use these
+    guid_hash = models.BinaryField(max_length=16, unique=True, editable=False)
+    link_hash = models.BinaryField(max_length=16, unique=True, null=True, editable=False)
+    content_hash = models.CharField(max_length=32, blank=True, help_text='Hash of the normalized fields, used to detect updates')
+    image_url = models.URLField(max_length=1000, blank=True, help_text='From media:thumbnail, media:content or an enclosure')
+    image = models.ForeignKey(FeedImage, on_delete=models.SET_NULL, null=True, blank=True, related_name='items')
+    image_checked_at = models.DateTimeField(null=True, blank=True, help_text='When the thumbnail stage handled image_url')
+    tags = models.ManyToManyField('story.StoryTag', related_name='rss_items', blank=True)
     published_date = models.DateTimeField()
     fetched_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
@@ -83,6 +112,22 @@ class RSSFeedItem(CoreModel):
         self.save(update_fields=['is_archived'])
 
 
+class FeedPayload(CoreModel):
+    """Raw fetched payload, zlib-compressed and deduplicated by content hash"""
+    content_hash = models.CharField(max_length=64, unique=True)
+    data = models.BinaryField()
+    size = models.PositiveIntegerField(help_text='Uncompressed size in bytes')
+    compressed_size = models.PositiveIntegerField(help_text='Compressed size in bytes')
+    
+    class Meta:
+        verbose_name = 'Feed Payload'
+        verbose_name_plural = 'Feed Payloads'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.content_hash[:12]} ({self.size} bytes)"
+
+
 class FeedFetchLog(CoreModel):
     """Model to log RSS feed fetching activities"""
     STATUS_CHOICES = [
@@ -95,8 +140,10 @@ class FeedFetchLog(CoreModel):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES)
     items_fetched = models.PositiveIntegerField(default=0)
     items_new = models.PositiveIntegerField(default=0)
+    items_updated = models.PositiveIntegerField(default=0)
     error_message = models.TextField(blank=True)
     fetch_duration = models.FloatField(help_text='Duration in seconds', null=True, blank=True)
+    payload = models.ForeignKey(FeedPayload, on_delete=models.SET_NULL, null=True, blank=True, related_name='fetch_logs')
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -106,3 +153,86 @@ class FeedFetchLog(CoreModel):
     
     def __str__(self):
         return f"{self.source.name} - {self.status} - {self.created_at}"
+
+
+class DeadLetter(CoreModel):
+    """Entry or fetch that failed processing, kept for inspection and requeueing"""
+    KIND_CHOICES = [
+        ('entry', 'Entry'),
+        ('fetch', 'Fetch'),
+    ]
+    STAGE_CHOICES = [
+        ('fetch', 'Fetch'),
+        ('parse', 'Parse'),
+        ('store', 'Store'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('requeued', 'Requeued'),
+        ('resolved', 'Resolved'),
+    ]
+    
+    source = models.ForeignKey(RSSFeedSource, on_delete=models.CASCADE, related_name='dead_letters')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    stage = models.CharField(max_length=10, choices=STAGE_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    fingerprint = models.CharField(max_length=32, help_text='Hash of the raw entry (or feed URL), used to skip known-bad input')
+    error_message = models.TextField(blank=True)
+    payload = models.TextField(blank=True, help_text='Raw entry, normalized entry or response fragment')
+    attempts = models.PositiveIntegerField(default=1)
+    last_failed_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        verbose_name = 'Dead Letter'
+        verbose_name_plural = 'Dead Letters'
+        ordering = ['-last_failed_at']
+        unique_together = [('source', 'kind', 'fingerprint')]
+        indexes = [
+            models.Index(fields=['status', 'kind']),
+        ]
+    
+    def __str__(self):
+        return f"{self.source.name} - {self.kind} - {self.status} ({self.attempts} attempts)"
+
+
+class WebSubSubscription(CoreModel):
+    """WebSub (PubSubHubbub) subscription of a source to the hub it advertises"""
+    STATE_CHOICES = [
+        ('pending', 'Pending Verification'),
+        ('active', 'Active'),
+        ('denied', 'Denied'),
+        ('failed', 'Failed'),
+    ]
+    
+    source = models.OneToOneField(RSSFeedSource, on_delete=models.CASCADE, related_name='websub')
+    hub_url = models.URLField(max_length=500)
+    topic_url = models.URLField(max_length=500)
+    secret = models.CharField(max_length=64, editable=False, help_text='HMAC key the hub signs pushed payloads with')
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default='pending')
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    last_requested_at = models.DateTimeField(null=True, blank=True)
+    last_push_at = models.DateTimeField(null=True, blank=True)
+    pushes_received = models.PositiveIntegerField(default=0)
+    error_message = models.TextField(blank=True)
+    
+    class Meta:
+        verbose_name = 'WebSub Subscription'
+        verbose_name_plural = 'WebSub Subscriptions'
+        ordering = ['source__name']
+    
+    def __str__(self):
+        return f"{self.source.name} via {self.hub_url} ({self.state})"
+    
+    @property
+    def is_live(self):
+        """Whether the hub is currently pushing updates for this source"""
+        return (self.state == 'active' and self.lease_expires_at is not None
+                and self.lease_expires_at > timezone.now())
+
+
+"""===== PAGE CACHE SIGNALS ====="""
+# Bulk ingestion bypasses these; RSSFeedFetcher.publish_changed covers it
+@receiver(post_save, sender=RSSFeedItem)
+@receiver(post_delete, sender=RSSFeedItem)
+def invalidate_feed_pages(sender, instance, **kwargs):
+    invalidate('rss')
@@ -0,0 +1,325 @@
+"""
+Pure parsing and normalization helpers for RSS payloads.
+
+Nothing in this module touches the ORM, so the functions can run in worker
+processes and in offline replays of archived payloads.
+"""
+import hashlib
+import json
+import logging
+import re
+import time
+import zlib
+from datetime import datetime
+from html import unescape
+from typing import AbstractSet, List, NamedTuple, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import feedparser
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+TAG_RE = re.compile(r'<[^>]+>')
+WHITESPACE_RE = re.compile(r'\s+')
+SLASHES_RE = re.compile(r'/{2,}')
+
+# Query parameters that only identify the referrer, not the article
+TRACKING_PARAM_PREFIXES = ('utm_',)
+# Longest raw entry kept with a dead letter
+MAX_FRAGMENT_LENGTH = 65536
+
+# Preferred width of the image picked among several media:content sizes
+IMAGE_TARGET_WIDTH = 320
+# Longest URL RSSFeedItem.image_url can hold
+MAX_IMAGE_URL_LENGTH = 1000
+
+TRACKING_PARAMS = {'fbclid', 'gclid', 'dclid', 'msclkid', 'igshid', 'mc_cid', 'mc_eid', 'ocid', 'cmpid', 'at_medium', 'at_campaign'}
+
+
+class ParsedEntry(NamedTuple):
+    """Normalized feed entry, ready to be written to RSSFeedItem"""
+    guid: str
+    title: str
+    description: str
+    content: str
+    link: str
+    author: str
+    category: str
+    published_date: Optional[datetime]
+    content_hash: str
+    canonical_link: str
+    guid_hash: bytes
+    link_hash: Optional[bytes]
+    fingerprint: str = ''
+    image_url: str = ''
+
+
+class EntryFailure(NamedTuple):
+    """Entry that could not be normalized, destined for the dead-letter queue"""
+    fingerprint: str
+    error_message: str
+    fragment: str
+
+
+class ParsedFeed(NamedTuple):
+    """Result of parsing one raw payload"""
+    entries: List[ParsedEntry]
+    items_fetched: int
+    bozo_message: str
+    failures: List[EntryFailure]
+    skipped: int
+    hub_url: str = ''
+    self_url: str = ''
+
+
+def clean_text(text: str) -> str:
+    """Clean and normalize text content"""
+    if not text:
+        return ""
+
+    # Unescape HTML entities
+    text = unescape(text)
+
+    # Remove HTML tags
+    text = TAG_RE.sub('', text)
+
+    # Normalize whitespace
+    return WHITESPACE_RE.sub(' ', text).strip()
+
+
+def parse_date(date_string: str) -> Optional[datetime]:
+    """Parse date string to datetime object"""
+    if not date_string:
+        return None
+
+    try:
+        parsed_time = time.strptime(date_string, '%a, %d %b %Y %H:%M:%S %z')
+        return datetime.fromtimestamp(time.mktime(parsed_time), tz=timezone.utc)
+    except (ValueError, TypeError):
+        try:
+            # Try alternative date formats
+            from dateutil import parser
+            parsed = parser.parse(date_string)
+        except (ValueError, TypeError, OverflowError):
+            logger.warning(f"Could not parse date: {date_string}")
+            return None
+        # Dates without an offset are taken as UTC, like stored ones, so that
+        # hashing and comparing them gives the same result every time
+        return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed, timezone.utc)
+
+
+def extract_guid(entry) -> Optional[str]:
+    """Extract GUID from feed entry"""
+    # Try different possible GUID fields
+    guid = entry.get('id') or entry.get('guid') or entry.get('link')
+    return str(guid) if guid else None
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Normalize a link so that the same article always maps to the same URL
+
+    Forces https, lowercases the host, drops "www.", default ports, fragments
+    and tracking parameters, and sorts the remaining query parameters.
+    """
+    url = (url or '').strip()
+    if not url:
+        return ''
+
+    parts = urlsplit(url)
+    if parts.scheme.lower() not in ('http', 'https'):
+        return url
+
+    try:
+        port = parts.port
+    except ValueError:
+        return url
+
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    if port and port not in (80, 443):
+        host = f"{host}:{port}"
+
+    path = SLASHES_RE.sub('/', parts.path) or '/'
+    if len(path) > 1:
+        path = path.rstrip('/')
+
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PARAM_PREFIXES)
+    )
+    return urlunsplit(('https', host, path, urlencode(query), ''))
+
+
+def key_digest(value: str) -> Optional[bytes]:
+    """Fixed-width digest used as a dedupe key"""
+    if not value:
+        return None
+    return hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+
+
+def entry_hash(title: str, description: str, content: str, link: str,
+               author: str, category: str, published_date: Optional[datetime]) -> str:
+    """Stable hash of the normalized fields, used to detect updated entries"""
+    digest = hashlib.blake2b(digest_size=16)
+    published = published_date.isoformat() if published_date else ''
+    for value in (title, description, content, link, author, category, published):
+        digest.update(value.encode('utf-8'))
+        digest.update(b'\x1f')
+    return digest.hexdigest()
+
+
+def extract_image_url(entry) -> str:
+    """
+    Pick the image of a feed entry from media:thumbnail, media:content or enclosures
+
+    Thumbnails win; among several media:content sizes the smallest one that is
+    at least IMAGE_TARGET_WIDTH wide is preferred, to keep downloads small.
+    """
+    candidates = [thumbnail.get('url') for thumbnail in entry.get('media_thumbnail') or []]
+
+    sized = []
+    for media in entry.get('media_content') or []:
+        medium, media_type = media.get('medium', ''), media.get('type', '')
+        if medium == 'image' or media_type.startswith('image/') or not (medium or media_type):
+            try:
+                width = int(media.get('width') or 0)
+            except ValueError:
+                width = 0
+            sized.append((width, media.get('url')))
+    large_enough = sorted(item for item in sized if item[0] >= IMAGE_TARGET_WIDTH)
+    candidates += [url for _, url in large_enough]
+    candidates += [url for _, url in sorted(sized, reverse=True)]
+
+    candidates += [
+        enclosure.get('href') for enclosure in entry.get('enclosures') or []
+        if enclosure.get('type', '').startswith('image/')
+    ]
+
+    for url in candidates:
+        if url and url.startswith(('http://', 'https://')) and len(url) <= MAX_IMAGE_URL_LENGTH:
+            return url
+    return ''
+
+
+def serialize_entry(entry) -> str:
+    """Serialize a raw feedparser entry to JSON, for fingerprints and dead letters"""
+    return json.dumps(entry, sort_keys=True, default=str, ensure_ascii=False)
+
+
+def entry_fingerprint(serialized_entry: str) -> str:
+    """Identify a raw entry, so that known-bad entries can be skipped cheaply"""
+    return hashlib.blake2b(serialized_entry.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def restore_raw_entry(serialized_entry: str):
+    """Rebuild a feedparser entry from its serialized form, keeping key aliases working"""
+    return feedparser.FeedParserDict(json.loads(serialized_entry))
+
+
+def dump_parsed_entry(entry: ParsedEntry) -> str:
+    """Serialize a normalized entry, so that a failed write can be retried later"""
+    fields = entry._asdict()
+    del fields['guid_hash'], fields['link_hash']
+    if entry.published_date is not None:
+        fields['published_date'] = entry.published_date.isoformat()
+    return json.dumps(fields, ensure_ascii=False)
+
+
+def load_parsed_entry(serialized_entry: str) -> ParsedEntry:
+    """Inverse of dump_parsed_entry"""
+    fields = json.loads(serialized_entry)
+    if fields.get('published_date'):
+        fields['published_date'] = datetime.fromisoformat(fields['published_date'])
+    return ParsedEntry(
+        guid_hash=key_digest(fields['guid']),
+        link_hash=key_digest(fields['canonical_link']),
+        **fields
+    )
+
+
+def normalize_entry(entry, fingerprint: str = '') -> Optional[ParsedEntry]:
+    """
+    Turn a feedparser entry into a ParsedEntry
+
+    Returns None when the entry has no usable GUID.
+    """
+    guid = extract_guid(entry)
+    if not guid:
+        logger.warning(f"No GUID found for entry: {entry.get('title', 'Unknown')}")
+        return None
+
+    content = entry.get('content')
+    fields = dict(
+        title=clean_text(entry.get('title', '')),
+        description=clean_text(entry.get('description', '')),
+        content=clean_text(content[0].get('value', '')) if content else '',
+        link=entry.get('link', ''),
+        author=clean_text(entry.get('author', '')),
+        category=clean_text(entry.get('category', '')),
+        published_date=parse_date(entry.get('published', '')),
+    )
+    canonical_link = canonicalize_url(fields['link'])
+    return ParsedEntry(
+        guid=guid,
+        content_hash=entry_hash(**fields),
+        canonical_link=canonical_link,
+        guid_hash=key_digest(guid),
+        link_hash=key_digest(canonical_link),
+        fingerprint=fingerprint,
+        image_url=extract_image_url(entry),
+        **fields
+    )
+
+
+def parse_payload(content: bytes, poison: AbstractSet[str] = frozenset()) -> ParsedFeed:
+    """
+    Parse a raw RSS/Atom payload into normalized entries
+
+    Entries whose fingerprint is in ``poison`` are known to fail and are
+    skipped; entries that fail now are returned as failures instead of
+    aborting the whole payload.
+    """
+    feed = feedparser.parse(content)
+    entries = []
+    failures = []
+    skipped = 0
+    for raw_entry in feed.entries:
+        serialized = serialize_entry(raw_entry)
+        fingerprint = entry_fingerprint(serialized)
+        if fingerprint in poison:
+            skipped += 1
+            continue
+
+        try:
+            entry = normalize_entry(raw_entry, fingerprint)
+        except Exception as e:
+            failures.append(EntryFailure(
+                fingerprint=fingerprint,
+                error_message=f"{type(e).__name__}: {e}",
+                fragment=serialized[:MAX_FRAGMENT_LENGTH],
+            ))
+            continue
+
+        if entry is not None:
+            entries.append(entry)
+
+    # WebSub discovery: <atom:link rel="hub"> and rel="self" on the channel
+    links = {link.get('rel'): link.get('href', '') for link in feed.feed.get('links', [])}
+    bozo_message = str(feed.bozo_exception) if feed.bozo else ''
+    return ParsedFeed(
+        entries=entries,
+        items_fetched=len(feed.entries),
+        bozo_message=bozo_message,
+        failures=failures,
+        skipped=skipped,
+        hub_url=links.get('hub') or '',
+        self_url=links.get('self') or '',
+    )
+
+
+def parse_compressed_payloads(blobs: List[bytes]) -> List[ParsedFeed]:
+    """Decompress and parse a chunk of archived payloads (process pool entry point)"""
+    return [parse_payload(zlib.decompress(blob)) for blob in blobs]
@@ -0,0 +1,137 @@
+"""
+Outgoing RSS/Atom feeds of the items we ingest.
+
+Feeds are rendered once after an ingest and kept in the cache as gzipped
+bytes together with their validators, so serving them (or answering a
+conditional request with 304) needs no database query.
+"""
+import gzip
+import hashlib
+import logging
+from datetime import datetime
+from typing import Iterable, NamedTuple, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.feedgenerator import Atom1Feed, Rss201rev2Feed
+
+from .models import RSSFeedSource, RSSFeedItem
+
+logger = logging.getLogger(__name__)
+
+FEED_FORMATS = {
+    'rss': Rss201rev2Feed,
+    'atom': Atom1Feed,
+}
+
+# Cache key of the combined feed, in place of a source type
+COMBINED = 'all'
+
+CACHE_KEY = 'rss_feeds:outgoing:{scope}:{fmt}'
+# Feeds rendered on a cache miss by a web process go stale without the next
+# ingest reaching them (e.g. with a per-process cache), so they expire
+MISS_TIMEOUT = 300
+
+
+class RenderedFeed(NamedTuple):
+    """Precompressed feed body with its HTTP validators"""
+    body: bytes
+    etag: str
+    last_modified: datetime
+    content_type: str
+
+    def decompressed(self) -> bytes:
+        return gzip.decompress(self.body)
+
+
+def render_feed(items: Iterable[RSSFeedItem], fmt: str, source: Optional[RSSFeedSource] = None) -> RenderedFeed:
+    """Render items into a gzipped RSS or Atom document"""
+    items = list(items)
+    name = source.name if source else 'All sources'
+    scope = source.source_type if source else COMBINED
+    site_url = getattr(settings, 'SITE_URL', '').rstrip('/')
+    feed = FEED_FORMATS[fmt](
+        title=f"Goal Line Report - {name}",
+        link=site_url + reverse('rss_feeds:feed_list'),
+        description=f"Latest football news from {name}",
+        feed_url=site_url + reverse('rss_feeds:outgoing_feed', args=[scope, fmt]),
+        language='en',
+    )
+    for item in items:
+        feed.add_item(
+            title=item.title,
+            link=item.link,
+            description=item.description,
+            unique_id=item.guid,
+            unique_id_is_permalink=False,
+            pubdate=item.published_date,
+            updateddate=item.updated_at,
+            author_name=item.author or None,
+            categories=[item.category] if item.category else None,
+        )
+
+    body = feed.writeString('utf-8').encode('utf-8')
+    last_modified = max((item.updated_at for item in items), default=None) or timezone.now()
+    return RenderedFeed(
+        # mtime=0 keeps the bytes, and so the ETag, stable across renders
+        body=gzip.compress(body, compresslevel=9, mtime=0),
+        etag='"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest(),
+        last_modified=last_modified.replace(microsecond=0),
+        content_type=feed.content_type,
+    )
+
+
+class FeedSyndicator:
+    """Renders the outgoing feeds and keeps them in the cache"""
+
+    def __init__(self, item_count: Optional[int] = None):
+        self.item_count = item_count or getattr(settings, 'RSS_FEEDS_OUTGOING_ITEMS', 50)
+
+    def get(self, scope: str, fmt: str) -> Optional[RenderedFeed]:
+        """
+        Return a rendered feed, rendering it if the cache has none
+
+        Returns:
+            The feed, or None if the source does not exist
+        """
+        rendered = cache.get(CACHE_KEY.format(scope=scope, fmt=fmt))
+        if rendered is None:
+            rendered = self.publish(scope, formats=[fmt], timeout=MISS_TIMEOUT).get(fmt)
+        return rendered
+
+    def publish(self, scope: str, formats: Iterable[str] = FEED_FORMATS,
+                timeout: Optional[int] = None) -> dict:
+        """
+        Render a feed in every format and store it
+
+        Returns:
+            Dictionary mapping formats to rendered feeds (empty for unknown sources)
+        """
+        items = RSSFeedItem.objects.select_related('source').filter(is_archived=False, source__is_active=True)
+        source = None
+        if scope != COMBINED:
+            source = RSSFeedSource.objects.filter(source_type=scope, is_active=True).first()
+            if source is None:
+                # Gone or deactivated: stop serving what was published before
+                cache.delete_many([CACHE_KEY.format(scope=scope, fmt=fmt) for fmt in FEED_FORMATS])
+                return {}
+            items = items.filter(source=source)
+        items = list(items.order_by('-published_date')[:self.item_count])
+
+        rendered = {fmt: render_feed(items, fmt, source) for fmt in formats}
+        cache.set_many(
+            {CACHE_KEY.format(scope=scope, fmt=fmt): feed for fmt, feed in rendered.items()},
+            timeout=timeout
+        )
+        return rendered
+
+    def publish_sources(self, sources: Iterable[RSSFeedSource]):
+        """Re-render the feeds of sources that received new or updated items, and the combined feed"""
+        scopes = {source.source_type for source in sources}
+        if not scopes:
+            return
+        for scope in sorted(scopes) + [COMBINED]:
+            self.publish(scope)
+        logger.info(f"Published outgoing feeds for {', '.join(sorted(scopes))} and the combined feed")
@@ -0,0 +1,65 @@
+"""
+Clubs and competitions the tagger recognises under other names.
+
+Keys are tag names (matched to StoryTag by slug); values are the aliases
+wire copy uses for them. Aliases stored on a StoryTag are used as well, so
+this only needs the common ones. Nicknames shared by several clubs ("City",
+"United", "the Reds") are left out on purpose: a wrong tag is worse than a
+missing one. `python manage.py init_tag_dictionary` creates the tags listed
+here.
+"""
+
+TAG_DICTIONARY = {
+    # Competitions
+    'Premier League': ['EPL', 'English Premier League', 'Premiership'],
+    'Championship': ['EFL Championship', 'Sky Bet Championship'],
+    'FA Cup': ['Emirates FA Cup'],
+    'Carabao Cup': ['League Cup', 'EFL Cup'],
+    'Champions League': ['UEFA Champions League', 'UCL'],
+    'Europa League': ['UEFA Europa League', 'UEL'],
+    'Conference League': ['UEFA Conference League', 'Europa Conference League', 'UECL'],
+    'La Liga': ['LaLiga', 'Primera Division'],
+    'Serie A': [],
+    'Bundesliga': [],
+    'Ligue 1': [],
+    'Scottish Premiership': ['SPFL'],
+    "Women's Super League": ['WSL', 'Barclays WSL'],
+    'World Cup': ['FIFA World Cup'],
+    'Euros': ['Euro 2024', 'European Championship', 'UEFA Euro'],
+
+    # Premier League clubs
+    'Arsenal': ['Gunners', 'Arsenal FC'],
+    'Aston Villa': ['AVFC'],
+    'Bournemouth': ['AFC Bournemouth', 'Cherries'],
+    'Brentford': [],
+    'Brighton': ['Brighton & Hove Albion', 'Brighton and Hove Albion', 'Seagulls'],
+    'Chelsea': ['Chelsea FC', 'CFC'],
+    'Crystal Palace': ['CPFC'],
+    'Everton': ['Toffees'],
+    'Fulham': ['Cottagers'],
+    'Ipswich Town': ['Ipswich', 'Tractor Boys'],
+    'Leicester City': ['Leicester', 'Foxes'],
+    'Liverpool': ['Liverpool FC', 'LFC'],
+    'Manchester City': ['Man City', 'MCFC'],
+    'Manchester United': ['Man Utd', 'Man United', 'MUFC'],
+    'Newcastle United': ['Newcastle', 'Magpies', 'NUFC'],
+    'Nottingham Forest': ["Nott'm Forest", 'Notts Forest'],
+    'Southampton': [],
+    'Tottenham Hotspur': ['Tottenham', 'Spurs', 'THFC'],
+    'West Ham United': ['West Ham', 'Hammers'],
+    'Wolverhampton Wanderers': ['Wolves'],
+
+    # Other clubs in the headlines
+    'Celtic': ['Celtic FC'],
+    'Rangers': ['Rangers FC', 'Gers'],
+    'Real Madrid': ['Los Blancos'],
+    'Barcelona': ['Barca', 'Barça', 'FC Barcelona'],
+    'Atletico Madrid': ['Atlético Madrid', 'Atletico', 'Atleti'],
+    'Bayern Munich': ['Bayern', 'Bayern München', 'FC Bayern'],
+    'Borussia Dortmund': ['Dortmund', 'BVB'],
+    'Paris Saint-Germain': ['PSG', 'Paris St-Germain'],
+    'Juventus': ['Juve'],
+    'Inter Milan': ['Internazionale', 'Inter Milano'],
+    'AC Milan': ['Milan'],
+    'Napoli': [],
+}
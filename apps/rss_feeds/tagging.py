@@ -0,0 +1,176 @@
+"""
+Ingest-time tagging of feed items.
+
+Tag names, their aliases and the club/competition dictionary are compiled
+into one Aho-Corasick automaton over words, so an item is matched against
+every pattern in a single pass over its title and description, however many
+patterns there are. The automaton is cached per process and only rebuilt when
+the tags change.
+"""
+import logging
+import re
+import threading
+import unicodedata
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+
+from django.db.models import Count, Max
+from django.utils.text import slugify
+
+from apps.story.models import StoryTag
+
+from .models import RSSFeedItem
+from .tag_dictionary import TAG_DICTIONARY
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r'[^\W_]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """Casefolded words of text without accents, so "Barça" matches "barca" """
+    text = unicodedata.normalize('NFKD', text.casefold())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return WORD_RE.findall(text)
+
+
+class Match(NamedTuple):
+    start: int
+    end: int
+    tag_ids: FrozenSet
+
+
+class TagAutomaton:
+    """Aho-Corasick automaton whose alphabet is words rather than characters"""
+
+    def __init__(self, patterns: Dict[Tuple[str, ...], set]):
+        # State 0 is the root; goto[state] maps a word to the next state
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        # Patterns ending in a state (its own and those reached by fail
+        # links), as (length in words, tag ids), longest first
+        self.outputs: List[List[Tuple[int, FrozenSet]]] = [[]]
+        self.vocabulary = set()
+
+        for words, tag_ids in patterns.items():
+            state = 0
+            for word in words:
+                next_state = self.goto[state].get(word)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][word] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.outputs.append([])
+                state = next_state
+            self.outputs[state].append((len(words), frozenset(tag_ids)))
+            self.vocabulary.update(words)
+
+        # Breadth-first, so fail targets are complete before they are used
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for word, next_state in self.goto[state].items():
+                fallback = self.fail[state]
+                while fallback and word not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(word, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.outputs[next_state] = self.outputs[next_state] + self.outputs[self.fail[next_state]]
+                queue.append(next_state)
+
+        self.pattern_count = len(patterns)
+
+    def matches(self, words: List[str]) -> List[Match]:
+        """Every pattern occurrence in words"""
+        goto, fail, outputs, vocabulary = self.goto, self.fail, self.outputs, self.vocabulary
+        found = []
+        state = 0
+        for position, word in enumerate(words):
+            if word not in vocabulary:
+                # No pattern contains this word, so nothing can continue past it
+                state = 0
+                continue
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            for length, tag_ids in outputs[state]:
+                found.append(Match(position - length + 1, position + 1, tag_ids))
+        return found
+
+    def tag_ids(self, text: str) -> set:
+        """
+        Tags mentioned in text
+
+        Where matches overlap the longest wins, so "Inter Milan" does not also
+        tag "AC Milan" by its alias "Milan".
+        """
+        tag_ids = set()
+        covered_until = 0
+        for match in sorted(self.matches(tokenize(text)), key=lambda match: (match.start, -match.end)):
+            if match.start < covered_until:
+                continue
+            covered_until = match.end
+            tag_ids |= match.tag_ids
+        return tag_ids
+
+
+def compile_patterns(tags: Iterable[StoryTag]) -> Dict[Tuple[str, ...], set]:
+    """Word sequences to match, mapped to the ids of the tags they stand for"""
+    dictionary = {slugify(name): aliases for name, aliases in TAG_DICTIONARY.items()}
+    patterns = {}
+    for tag in tags:
+        for name in [tag.name, *tag.alias_list, *dictionary.get(tag.slug, [])]:
+            words = tuple(tokenize(name))
+            if words:
+                patterns.setdefault(words, set()).add(tag.id)
+    return patterns
+
+
+class RSSTagger:
+    """Links feed items to the StoryTags their title and description mention"""
+
+    _lock = threading.Lock()
+    _automaton: Optional[TagAutomaton] = None
+    _version = None
+
+    def automaton(self) -> TagAutomaton:
+        """The compiled automaton, rebuilt if tags were added, edited or removed since"""
+        version = tuple(StoryTag.objects.aggregate(count=Count('id'), changed=Max('updated_at')).values())
+        cls = type(self)
+        if cls._version != version:
+            with cls._lock:
+                if cls._version != version:
+                    automaton = TagAutomaton(compile_patterns(StoryTag.objects.only('id', 'name', 'slug', 'aliases')))
+                    cls._automaton, cls._version = automaton, version
+                    logger.info(f"Compiled tag automaton with {automaton.pattern_count} patterns")
+        return cls._automaton
+
+    def tag_items(self, items: List[RSSFeedItem], replace: bool = False) -> int:
+        """
+        Store the tags of items in one bulk insert
+
+        Args:
+            items: Saved feed items
+            replace: Drop existing links first, for items whose text changed
+
+        Returns:
+            Number of links stored
+        """
+        if not items:
+            return 0
+        automaton = self.automaton()
+        Link = RSSFeedItem.tags.through
+        links = [
+            Link(rssfeeditem_id=item.id, storytag_id=tag_id)
+            for item in items
+            for tag_id in automaton.tag_ids(f"{item.title}\n{item.description}")
+        ]
+        if replace:
+            Link.objects.filter(rssfeeditem_id__in=[item.id for item in items]).delete()
+        Link.objects.bulk_create(links, batch_size=1000, ignore_conflicts=True)
+        return len(links)
+
+    @classmethod
+    def reset(cls):
+        """Forget the compiled automaton"""
+        with cls._lock:
+            cls._automaton = cls._version = None
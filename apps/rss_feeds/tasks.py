@@ -1,8 +1,10 @@
 from celery import shared_task
 from django.utils import timezone
 import logging
-from .services import RSSFeedManager
-from .models import RSSFeedSource, RSSFeedItem
+from apps.utils.page_cache import invalidate
+from .services import RSSFeedFetcher, RSSFeedManager
+from .models import RSSFeedSource, RSSFeedItem, DeadLetter
+from .thumbnails import ThumbnailGenerator
 
 logger = logging.getLogger(__name__)
 
@@ -86,6 +88,58 @@ def fetch_specific_source_task(self, source_type: str):
         }
 
 
+@shared_task(bind=True, name='rss_feeds.generate_thumbnails')
+def generate_thumbnails_task(self, item_ids=None):
+    """
+    Celery task to make thumbnails for feed item images
+    
+    Without item_ids, sweeps items whose images were never handled (e.g. when
+    queueing failed during ingest).
+    """
+    try:
+        generator = ThumbnailGenerator()
+        if item_ids:
+            items = RSSFeedItem.objects.filter(id__in=item_ids, image_checked_at__isnull=True)
+        else:
+            items = generator.pending_items()
+        stats = generator.process(items)
+        
+        logger.info(f"Thumbnails: {stats['items']} items, {stats['created']} new images, {stats['failed']} failed")
+        return {
+            'status': 'success',
+            **stats
+        }
+        
+    except Exception as e:
+        logger.error(f"Error generating thumbnails: {e}")
+        return {
+            'status': 'error',
+            'error': str(e)
+        }
+
+
+@shared_task(name='rss_feeds.renew_websub_leases')
+def renew_websub_leases_task():
+    """
+    Celery task to renew WebSub leases before they expire
+    """
+    try:
+        renewed = RSSFeedFetcher().websub.renew_expiring()
+        logger.info(f"WebSub renewal requested for {renewed} subscriptions")
+        
+        return {
+            'status': 'success',
+            'subscriptions_renewed': renewed
+        }
+        
+    except Exception as e:
+        logger.error(f"Error renewing WebSub leases: {e}")
+        return {
+            'status': 'error',
+            'error': str(e)
+        }
+
+
 @shared_task(name='rss_feeds.initialize_sources')
 def initialize_sources_task():
     """
@@ -132,6 +186,7 @@ def cleanup_old_feeds_task(days_to_keep: int = 30):
         
         items_to_archive = old_items.count()
         old_items.update(is_archived=True)
+        invalidate('rss')
         
         # Delete very old archived items (older than 90 days)
         very_old_cutoff = timezone.now() - timedelta(days=90)
@@ -143,14 +198,22 @@ def cleanup_old_feeds_task(days_to_keep: int = 30):
         items_to_delete = very_old_items.count()
         very_old_items.delete()
         
+        # Drop dead letters that were resolved long ago
+        dead_letters_deleted, _ = DeadLetter.objects.filter(
+            status='resolved',
+            updated_at__lt=very_old_cutoff
+        ).delete()
+        
         logger.info(f"Cleanup completed. "
                    f"Archived: {items_to_archive} items, "
-                   f"Deleted: {items_to_delete} items")
+                   f"Deleted: {items_to_delete} items, "
+                   f"Dead letters deleted: {dead_letters_deleted}")
         
         return {
             'status': 'success',
             'items_archived': items_to_archive,
-            'items_deleted': items_to_delete
+            'items_deleted': items_to_delete,
+            'dead_letters_deleted': dead_letters_deleted
         }
         
     except Exception as e:
@@ -0,0 +1,913 @@
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
+import shutil
+import socket
+import tempfile
+import threading
+from contextlib import contextmanager
+from importlib import import_module
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+from urllib.parse import urlsplit
+
+import feedparser
+import requests
+from django.apps import apps as django_apps
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from apps.story.models import StoryTag
+from apps.utils.broadcast import Broadcaster, CacheLogBackend
+from apps.utils.throttle import RETURN_SCRIPT, TAKE_SCRIPT, _redis, return_token, take_token
+
+from . import events, parsing, services
+from .models import DeadLetter, FeedFetchLog, FeedPayload, RSSFeedSource, RSSFeedItem, WebSubSubscription, FeedImage
+from .parsing import extract_image_url
+from .services import DeadLetterQueue, FeedPayloadArchive, RSSFeedFetcher
+from .tagging import RSSTagger, TagAutomaton, compile_patterns
+from .thumbnails import PublicHostAdapter, ThumbnailGenerator
+from .views import thumbnail
+
+FEED_URL = 'https://feeds.example.com/football.xml'
+HUB_URL = 'https://hub.example.com/'
+
+
+def make_feed(*titles, hub_url=HUB_URL):
+    """Build an RSS payload advertising a hub"""
+    items = ''.join(
+        f'<item><title>{title}</title><link>https://example.com/{title}</link><guid>{title}</guid></item>'
+        for title in titles
+    )
+    hub_link = f'<atom:link rel="hub" href="{hub_url}"/>' if hub_url else ''
+    return (
+        '<?xml version="1.0"?><rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom"><channel>'
+        f'<title>Football</title>{hub_link}<atom:link rel="self" href="{FEED_URL}"/>{items}'
+        '</channel></rss>'
+    ).encode()
+
+
+class LocalHub:
+    """
+    Stand-in for a WebSub hub and the publisher's feed server
+
+    Plugged in as the fetcher's HTTP session. Like most real hubs, it verifies
+    a subscription by calling the callback before answering the request.
+    """
+
+    def __init__(self, client, feed=b''):
+        self.client = client
+        self.feed = feed
+        self.subscriptions = {}
+        self.polls = 0
+
+    def get(self, url, timeout=None):
+        self.polls += 1
+        return mock.Mock(content=self.feed, links={}, raise_for_status=lambda: None)
+
+    def post(self, url, data=None, timeout=None):
+        callback = urlsplit(data['hub.callback']).path
+        response = self.client.get(callback, {
+            'hub.mode': data['hub.mode'],
+            'hub.topic': data['hub.topic'],
+            'hub.challenge': 'challenge-token',
+            'hub.lease_seconds': data['hub.lease_seconds'],
+        })
+        if response.status_code == 200 and response.content == b'challenge-token':
+            self.subscriptions[data['hub.topic']] = (callback, data['hub.secret'])
+        return mock.Mock(status_code=202, raise_for_status=lambda: None)
+
+    def publish(self, topic, body, secret=None):
+        """Push new content to the subscriber, signed like a real hub would"""
+        callback, subscribed_secret = self.subscriptions[topic]
+        digest = hmac.new((secret or subscribed_secret).encode(), body, hashlib.sha256).hexdigest()
+        return self.client.post(callback, body, content_type='application/rss+xml',
+                                HTTP_X_HUB_SIGNATURE=f'sha256={digest}')
+
+
+@override_settings(RSS_FEEDS_WEBSUB_CALLBACK_BASE_URL='http://testserver', RSS_FEEDS_ARCHIVE_PAYLOADS=False)
+class WebSubTests(TestCase):
+
+    def setUp(self):
+        self.source = RSSFeedSource.objects.create(name='Example', source_type='bbc_sport', feed_url=FEED_URL)
+        self.hub = LocalHub(Client(), make_feed('first'))
+        self.fetcher = RSSFeedFetcher(parse_workers=1)
+        self.fetcher.session = self.hub
+
+    def test_poll_discovers_hub_and_subscription_is_verified(self):
+        self.fetcher.fetch_feed(self.source)
+
+        subscription = WebSubSubscription.objects.get(source=self.source)
+        self.assertEqual(subscription.hub_url, HUB_URL)
+        self.assertEqual(subscription.topic_url, FEED_URL)
+        self.assertEqual(subscription.state, 'active')
+        self.assertTrue(subscription.is_live)
+        self.assertIn(FEED_URL, self.hub.subscriptions)
+
+    def test_pushed_payload_is_ingested(self):
+        self.fetcher.fetch_feed(self.source)
+
+        response = self.hub.publish(FEED_URL, make_feed('first', 'second'))
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(set(RSSFeedItem.objects.values_list('title', flat=True)), {'first', 'second'})
+        subscription = WebSubSubscription.objects.get(source=self.source)
+        self.assertEqual(subscription.pushes_received, 1)
+        self.assertIsNotNone(subscription.last_push_at)
+
+    def test_push_with_bad_signature_is_ignored(self):
+        self.fetcher.fetch_feed(self.source)
+
+        response = self.hub.publish(FEED_URL, make_feed('forged'), secret='not-the-secret')
+
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(RSSFeedItem.objects.filter(title='forged').exists())
+
+    def test_verification_for_another_topic_is_refused(self):
+        self.fetcher.fetch_feed(self.source)
+        subscription = WebSubSubscription.objects.get(source=self.source)
+
+        response = Client().get(urlsplit(self.fetcher.websub.callback_url(subscription)).path, {
+            'hub.mode': 'subscribe',
+            'hub.topic': 'https://elsewhere.example.com/feed',
+            'hub.challenge': 'x',
+        })
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_pushed_sources_only_get_a_safety_net_poll(self):
+        self.fetcher.fetch_all_active_sources()
+        self.assertEqual(self.hub.polls, 1)
+
+        self.fetcher.fetch_all_active_sources()
+        self.assertEqual(self.hub.polls, 1)
+
+        RSSFeedSource.objects.filter(id=self.source.id).update(last_fetched=timezone.now() - timedelta(hours=7))
+        self.fetcher.fetch_all_active_sources()
+        self.assertEqual(self.hub.polls, 2)
+
+    def test_expiring_leases_are_renewed(self):
+        self.fetcher.fetch_feed(self.source)
+        self.assertEqual(self.fetcher.websub.renew_expiring(), 0)
+
+        WebSubSubscription.objects.filter(source=self.source).update(lease_expires_at=timezone.now() + timedelta(hours=1))
+        self.assertEqual(self.fetcher.websub.renew_expiring(), 1)
+        self.assertGreater(WebSubSubscription.objects.get(source=self.source).lease_expires_at,
+                           timezone.now() + timedelta(days=9))
+
+    def test_unreachable_hub_falls_back_to_polling(self):
+        self.hub.post = mock.Mock(side_effect=requests.ConnectionError('hub down'))
+
+        success, _, _, _ = self.fetcher.fetch_feed(self.source)
+
+        self.assertTrue(success)
+        self.assertEqual(WebSubSubscription.objects.get(source=self.source).state, 'failed')
+        self.fetcher.fetch_all_active_sources()
+        self.assertEqual(self.hub.polls, 2)
+
+    @override_settings(RSS_FEEDS_WEBSUB_CALLBACK_BASE_URL='')
+    def test_disabled_without_callback_url(self):
+        self.fetcher.fetch_feed(self.source)
+
+        self.assertFalse(WebSubSubscription.objects.exists())
+
+
+@override_settings(RSS_FEEDS_WEBSUB_CALLBACK_BASE_URL='', RSS_FEEDS_ARCHIVE_PAYLOADS=False)
+class OutgoingFeedTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.source = RSSFeedSource.objects.create(name='Example', source_type='bbc_sport', feed_url=FEED_URL)
+        self.server = LocalHub(Client(), make_feed('first', hub_url=None))
+        self.fetcher = RSSFeedFetcher(parse_workers=1)
+        self.fetcher.session = self.server
+        self.fetcher.fetch_feed(self.source)
+
+    def test_feeds_are_rendered_after_ingest(self):
+        for url in ('/rss/syndication/all.rss', '/rss/syndication/bbc_sport.atom'):
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertIn(b'first', gzip.decompress(response.content))
+
+    def test_conditional_request_costs_no_query(self):
+        response = self.client.get('/rss/syndication/all.rss')
+        self.assertNotIn('Content-Encoding', response)
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/rss/syndication/all.rss', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/rss/syndication/all.rss', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_new_items_change_the_etag(self):
+        etag = self.client.get('/rss/syndication/bbc_sport.rss')['ETag']
+
+        self.server.feed = make_feed('first', 'second', hub_url=None)
+        self.fetcher.fetch_feed(self.source)
+
+        response = self.client.get('/rss/syndication/bbc_sport.rss', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'second', response.content)
+
+    def test_unknown_source_or_format(self):
+        self.assertEqual(self.client.get('/rss/syndication/espn_soccer.rss').status_code, 404)
+        self.assertEqual(self.client.get('/rss/syndication/all.json').status_code, 404)
+
+
+def append_events(items):
+    CacheLogBackend().append(events.ITEMS_CHANNEL, [json.dumps(item) for item in items])
+
+
+class EventStreamTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.broker = Broadcaster(buffer_size=3, poll_interval=0.01)
+        patcher = mock.patch.object(events, 'broker', self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def stream(self, count, last_event_id=None, publish=()):
+        """Open the stream, publish events, and collect `count` of them"""
+        disconnect = asyncio.Event()
+        received = []
+
+        async def receive():
+            if not received:
+                received.append(None)
+                return {'type': 'http.request', 'body': b''}
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        chunks = []
+
+        async def send(message):
+            chunks.append(message.get('body', b''))
+            if b''.join(chunks).count(b'event: item') >= count:
+                disconnect.set()
+
+        headers = [(b'last-event-id', str(last_event_id).encode())] if last_event_id is not None else []
+        scope = {'type': 'http', 'method': 'GET', 'path': '/rss/events/', 'headers': headers, 'query_string': b''}
+        task = asyncio.create_task(events.sse_application(scope, receive, send))
+        await asyncio.sleep(0.05)
+        for event in publish:
+            append_events([event])
+        await asyncio.wait_for(task, timeout=2)
+        return [line[4:] for line in b''.join(chunks).decode().splitlines() if line.startswith('id: ')]
+
+    async def test_new_events_are_pushed(self):
+        append_events([{'title': 'old'}])
+
+        ids = await self.stream(2, publish=[{'title': 'a'}, {'title': 'b'}])
+
+        self.assertEqual(ids, ['2', '3'])
+
+    async def test_resume_from_last_event_id(self):
+        append_events([{'title': str(n)} for n in range(5)])
+
+        self.assertEqual(await self.stream(2, last_event_id=3), ['4', '5'])
+
+    async def test_resume_beyond_the_ring_buffer_gets_what_is_left(self):
+        append_events([{'title': str(n)} for n in range(5)])
+
+        self.assertEqual(await self.stream(3, last_event_id=0), ['3', '4', '5'])
+
+
+@override_settings(RSS_FEEDS_WEBSUB_CALLBACK_BASE_URL='', RSS_FEEDS_ARCHIVE_PAYLOADS=False)
+class ItemEventTests(TestCase):
+
+    def test_ingest_publishes_events_after_commit(self):
+        cache.clear()
+        source = RSSFeedSource.objects.create(name='Example', source_type='bbc_sport', feed_url=FEED_URL)
+        fetcher = RSSFeedFetcher(parse_workers=1)
+        fetcher.session = LocalHub(Client(), make_feed('first', 'second', hub_url=None))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            fetcher.fetch_feed(source)
+
+        self.assertEqual(cache.get(CacheLogBackend.SEQUENCE_KEY.format(events.ITEMS_CHANNEL)), 2)
+        published = [json.loads(cache.get(CacheLogBackend.EVENT_KEY.format(events.ITEMS_CHANNEL, seq))) for seq in (1, 2)]
+        self.assertEqual({event['title'] for event in published}, {'first', 'second'})
+        self.assertEqual(published[0]['source'], 'bbc_sport')
+
+
+hashed_keys_migration = import_module('apps.rss_feeds.migrations.0005_rssfeeditem_hashed_keys')
+
+
+@override_settings(RSS_FEEDS_WEBSUB_CALLBACK_BASE_URL='', RSS_FEEDS_ARCHIVE_PAYLOADS=False)
+class HashedKeyTests(TestCase):
+
+    URLS = {
+        'HTTP://WWW.Example.com:80//news//match/?utm_source=x&b=2&a=1&fbclid=y#comments': 'https://example.com/news/match?a=1&b=2',
+        'https://example.com:8443/': 'https://example.com:8443/',
+        'https://example.com/live/': 'https://example.com/live',
+        'mailto:desk@example.com': 'mailto:desk@example.com',
+        '  ': '',
+    }
+
+    def setUp(self):
+        self.source = RSSFeedSource.objects.create(name='Example', source_type='bbc_sport', feed_url=FEED_URL)
+        self.fetcher = RSSFeedFetcher(parse_workers=1)
+
+    def fetch(self, entries):
+        items = ''.join(f'<item><title>{title}</title><link>{link}</link><guid>{guid}</guid></item>' for guid, title, link in entries)
+        self.fetcher.session = LocalHub(Client(), f'<rss version="2.0"><channel><title>x</title>{items}</channel></rss>'.encode())
+        return self.fetcher.fetch_feed(self.source)[3]
+
+    def test_links_are_canonicalized(self):
+        for url, canonical in self.URLS.items():
+            self.assertEqual(parsing.canonicalize_url(url), canonical, url)
+            # The migration's frozen copy agrees with today's
+            self.assertEqual(hashed_keys_migration.canonicalize_url(url), canonical, url)
+        self.assertEqual(len(parsing.key_digest('guid')), 16)
+        self.assertIsNone(parsing.key_digest(''))
+
+    def test_items_are_deduplicated_on_guid_and_canonical_link(self):
+        self.assertEqual(self.fetch([('1', 'Match report', 'https://www.example.com/match?utm_medium=rss')]), 1)
+        # Same GUID under a new link, then a new GUID for the same canonical link
+        self.assertEqual(self.fetch([('1', 'Match report', 'https://example.com/match-report')]), 0)
+        self.assertEqual(self.fetch([('2', 'Match report', 'http://example.com/match-report/')]), 0)
+        self.assertEqual(self.fetch([('3', 'Reaction', 'https://example.com/reaction')]), 1)
+
+        self.assertEqual(RSSFeedItem.objects.count(), 2)
+        item = RSSFeedItem.objects.get(guid='1')
+        self.assertEqual(bytes(item.guid_hash), parsing.key_digest('1'))
+        self.assertEqual(bytes(item.link_hash), parsing.key_digest(item.canonical_link))
+
+    def test_backfill_fills_keys_and_leaves_duplicate_links_without_one(self):
+        for guid, link in (('a', 'https://www.example.com/a?utm_source=x'), ('b', 'https://example.com/a'),
+                           ('c', 'https://example.com/c')):
+            RSSFeedItem.objects.create(source=self.source, title=guid, guid=guid, link=link,
+                                       guid_hash=f'old-{guid}'.encode(), published_date=timezone.now())
+
+        hashed_keys_migration.backfill_hashed_keys(django_apps, None)
+
+        items = {item.guid: item for item in RSSFeedItem.objects.all()}
+        self.assertEqual({guid: bytes(item.guid_hash) for guid, item in items.items()},
+                         {guid: parsing.key_digest(guid) for guid in 'abc'})
+        self.assertEqual({guid: item.canonical_link for guid, item in items.items()},
+                         {'a': 'https://example.com/a', 'b': 'https://example.com/a', 'c': 'https://example.com/c'})
+        # One of the two copies of an article keeps the link key
+        self.assertEqual({items[guid].link_hash and bytes(items[guid].link_hash) for guid in 'ab'},
+                         {parsing.key_digest('https://example.com/a'), None})
+        self.assertEqual(bytes(items['c'].link_hash), parsing.key_digest('https://example.com/c'))
+
+
+@override_settings(RSS_FEEDS_WEBSUB_CALLBACK_BASE_URL='', RSS_FEEDS_ARCHIVE_PAYLOADS=False)
+class UpdatedItemTests(TestCase):
+
+    def setUp(self):
+        self.source = RSSFeedSource.objects.create(name='Example', source_type='bbc_sport', feed_url=FEED_URL)
+        self.fetcher = RSSFeedFetcher(parse_workers=1)
+        self.fetcher.session = LocalHub(Client(), make_tagged_feed(('a', 'Kick-off', ''), ('b', 'Half-time', '')))
+        self.fetcher.fetch_feed(self.source)
+
+    def fetch(self, *entries):
+        self.fetcher.session.feed = make_tagged_feed(*entries)
+        _, message, _, items_new = self.fetcher.fetch_feed(self.source)
+        return items_new, FeedFetchLog.objects.latest('created_at').items_updated, message
+
+    def test_only_changed_entries_count_as_updated(self):
+        self.assertEqual(self.fetch(('a', 'Kick-off', ''), ('b', 'Half-time', '')), (0, 0, mock.ANY))
+
+        items_new, items_updated, message = self.fetch(('a', 'Kick-off', ''), ('b', 'Full-time', 'Late winner'))
+        self.assertEqual((items_new, items_updated), (0, 1))
+        self.assertIn('0 new, 1 updated', message)
+        self.assertEqual(RSSFeedItem.objects.get(guid='b').description, 'Late winner')
+
+        self.assertEqual(self.fetch(('a', 'Kick-off', ''), ('b', 'Full-time', 'Late winner'), ('c', 'Reaction', ''))[:2], (1, 0))
+
+    def test_items_stored_before_hashing_are_not_counted_as_updated(self):
+        RSSFeedItem.objects.update(content_hash='')
+
+        self.assertEqual(self.fetch(('a', 'Kick-off', ''), ('b', 'Half-time', ''))[:2], (0, 0))
+        self.assertFalse(RSSFeedItem.objects.filter(content_hash='').exists())
+        self.assertEqual(self.fetch(('a', 'Kick-off', ''), ('b', 'Full-time', ''))[:2], (0, 1))
+
+
+class FeedServer:
+    """Stand-in for several publishers' feed servers, by URL"""
+
+    def __init__(self, feeds):
+        self.feeds = feeds
+
+    def get(self, url, timeout=None):
+        content = self.feeds.get(url)
+        if content is None:
+            raise requests.ConnectionError(f'{url} unreachable')
+        return mock.Mock(content=content, links={}, raise_for_status=lambda: None)
+
+
+@override_settings(RSS_FEEDS_WEBSUB_CALLBACK_BASE_URL='', RSS_FEEDS_ARCHIVE_PAYLOADS=False)
+class StagedFetchTests(TestCase):
+
+    def setUp(self):
+        self.sources = [
+            RSSFeedSource.objects.create(name=name, source_type=source_type, feed_url=f'https://{source_type}.example.com/rss')
+            for name, source_type in (('BBC', 'bbc_sport'), ('ESPN', 'espn_soccer'), ('Sky', 'sky_sports'))
+        ]
+        self.server = FeedServer({
+            'https://bbc_sport.example.com/rss': make_feed('a', 'b', hub_url=None),
+            # Lists one article twice
+            'https://espn_soccer.example.com/rss': make_feed('c', 'd', 'c', hub_url=None),
+        })
+
+    def ingest(self, **workers):
+        fetcher = RSSFeedFetcher(**workers)
+        fetcher.session = self.server
+        results = fetcher.fetch_sources(self.sources)
+        stored = set(RSSFeedItem.objects.values_list('source__name', 'guid', 'title'))
+        logs = set(FeedFetchLog.objects.values_list('source__name', 'status', 'items_fetched', 'items_new'))
+        RSSFeedItem.objects.all().delete()
+        FeedFetchLog.objects.all().delete()
+        return results, stored, logs
+
+    def test_parallel_stages_store_what_one_thread_would(self):
+        staged = self.ingest(fetch_workers=3, parse_workers=2)
+        serial = self.ingest(fetch_workers=1, parse_workers=1)
+
+        self.assertEqual(staged, serial)
+        results, stored, _ = staged
+        self.assertEqual({name: result[2:] for name, result in results.items()},
+                         {'BBC': (2, 2), 'ESPN': (3, 2), 'Sky': (0, 0)})
+        self.assertFalse(results['Sky'][0])
+        self.assertEqual(len(stored), 4)
+
+
+def make_dated_feed(*entries):
+    """Build an RSS payload of (guid, title, pubDate) entries"""
+    items = ''.join(
+        f'<item><title>{title}</title><link>https://example.com/{guid}</link><guid>{guid}</guid>'
+        f'<pubDate>{published}</pubDate></item>'
+        for guid, title, published in entries
+    )
+    return f'<?xml version="1.0"?><rss version="2.0"><channel><title>Football</title>{items}</channel></rss>'.encode()
+
+
+@override_settings(RSS_FEEDS_WEBSUB_CALLBACK_BASE_URL='', RSS_FEEDS_ARCHIVE_PAYLOADS=True)
+class PayloadReplayTests(TestCase):
+
+    def setUp(self):
+        self.source = RSSFeedSource.objects.create(name='Example', source_type='bbc_sport', feed_url=FEED_URL)
+        self.fetcher = RSSFeedFetcher(parse_workers=1)
+        self.fetcher.session = LocalHub(Client(), make_feed('first', hub_url=None))
+
+    def replay(self, **options):
+        out = StringIO()
+        call_command('replay_rss_payloads', stdout=out, **options)
+        return out.getvalue()
+
+    def test_payloads_are_archived_once_per_content(self):
+        self.fetcher.fetch_feed(self.source)
+        self.fetcher.fetch_feed(self.source)
+
+        payload = FeedPayload.objects.get()
+        self.assertEqual(FeedFetchLog.objects.filter(payload=payload).count(), 2)
+        self.assertEqual(FeedPayloadArchive.load(payload), make_feed('first', hub_url=None))
+        self.assertLess(payload.compressed_size, payload.size)
+        self.assertIsNone(FeedPayloadArchive(enabled=False).store(b'<rss/>'))
+
+    def test_replay_repairs_derived_fields_from_the_archive(self):
+        self.fetcher.fetch_feed(self.source)
+        # As if normalization had been buggy when the item was stored
+        RSSFeedItem.objects.update(title='garbled', content_hash='stale')
+
+        self.assertIn('would update 1 items', self.replay(workers=1, dry_run=True))
+        self.assertEqual(RSSFeedItem.objects.get().title, 'garbled')
+
+        self.assertIn('updated 1 items', self.replay(workers=1))
+        self.assertEqual(RSSFeedItem.objects.get().title, 'first')
+        self.assertIn('updated 0 items', self.replay(workers=1))
+
+    def test_parallel_replay_applies_only_the_newest_version(self):
+        self.fetcher.session.feed = make_dated_feed(('a', 'Draft', '2024-05-01 12:00'))
+        self.fetcher.fetch_feed(self.source)
+        for n in range(1, 6):
+            self.fetcher.session.feed = make_dated_feed(('a', f'Edit {n}', '2024-05-01 12:00'))
+            self.fetcher.fetch_feed(self.source)
+        RSSFeedItem.objects.update(title='garbled', content_hash='stale')
+
+        self.assertIn('1 entries, updated 1 items', self.replay(workers=2, chunk_size=1))
+        item = RSSFeedItem.objects.get()
+        self.assertEqual(item.title, 'Edit 5')
+        # Dates without an offset are taken as UTC, and replays agree with the fetch
+        self.assertEqual(item.published_date, datetime(2024, 5, 1, 12, tzinfo=dt_timezone.utc))
+        self.assertIn('updated 0 items', self.replay(workers=2, chunk_size=1))
+
+
+@contextmanager
+def failing_on(title):
+    """Make normalize_entry fail on the entry with this title, like a parser bug would"""
+    normalize_entry = parsing.normalize_entry
+
+    def normalize(entry, fingerprint=''):
+        if entry.get('title') == title:
+            raise ValueError(f'cannot parse {title}')
+        return normalize_entry(entry, fingerprint)
+    with mock.patch.object(parsing, 'normalize_entry', normalize), \
+            mock.patch.object(services, 'normalize_entry', normalize):
+        yield
+
+
+@override_settings(RSS_FEEDS_WEBSUB_CALLBACK_BASE_URL='', RSS_FEEDS_ARCHIVE_PAYLOADS=False)
+class DeadLetterTests(TestCase):
+
+    def setUp(self):
+        self.source = RSSFeedSource.objects.create(name='Example', source_type='bbc_sport', feed_url=FEED_URL)
+        self.fetcher = RSSFeedFetcher(parse_workers=1)
+        self.fetcher.session = LocalHub(Client(), make_feed('good', 'bad', hub_url=None))
+        with failing_on('bad'):
+            self.fetcher.fetch_feed(self.source)
+
+    def test_failed_entries_are_skipped_until_requeued(self):
+        letter = DeadLetter.objects.get()
+        self.assertEqual((letter.kind, letter.stage, letter.status, letter.attempts), ('entry', 'parse', 'pending', 1))
+        self.assertEqual(list(RSSFeedItem.objects.values_list('guid', flat=True)), ['good'])
+
+        # Known-bad entries are not even normalized again
+        with mock.patch.object(parsing, 'normalize_entry', wraps=parsing.normalize_entry) as normalize:
+            _, message, _, _ = self.fetcher.fetch_feed(self.source)
+        self.assertIn('1 skipped', message)
+        self.assertEqual(normalize.call_count, 1)
+
+        # The parser was fixed
+        self.assertEqual(DeadLetterQueue().requeue(DeadLetter.objects.all(), self.fetcher), {'requeued': 1, 'resolved': 1})
+        self.assertEqual(DeadLetter.objects.get().status, 'resolved')
+        self.assertTrue(RSSFeedItem.objects.filter(guid='bad').exists())
+        self.assertEqual(DeadLetterQueue().requeue(DeadLetter.objects.all(), self.fetcher), {'requeued': 0, 'resolved': 0})
+
+    def test_entries_failing_again_stay_pending(self):
+        with failing_on('bad'):
+            result = DeadLetterQueue().requeue(DeadLetter.objects.all(), self.fetcher)
+
+        self.assertEqual(result, {'requeued': 1, 'resolved': 0})
+        letter = DeadLetter.objects.get()
+        self.assertEqual((letter.status, letter.attempts), ('pending', 2))
+
+    def test_interrupted_requeue_puts_letters_back(self):
+        with mock.patch.object(self.fetcher, '_store_entries', side_effect=RuntimeError('database gone')):
+            with self.assertRaises(RuntimeError):
+                DeadLetterQueue().requeue(DeadLetter.objects.all(), self.fetcher)
+
+        letter = DeadLetter.objects.get()
+        self.assertEqual((letter.status, letter.attempts), ('pending', 2))
+        self.assertEqual(DeadLetterQueue().requeue(DeadLetter.objects.all(), self.fetcher), {'requeued': 1, 'resolved': 1})
+
+
+def make_image(color, size=(1200, 800)):
+    output = BytesIO()
+    Image.new('RGB', size, color).save(output, 'JPEG')
+    return output.getvalue()
+
+
+class ImageServer:
+    """Stand-in for publishers' image hosts"""
+
+    def __init__(self, images, redirects=None):
+        self.images = images
+        self.redirects = redirects or {}
+        self.requests = []
+
+    def get(self, url, timeout=None, stream=False, allow_redirects=True):
+        self.requests.append(url)
+        if url in self.redirects:
+            return mock.MagicMock(is_redirect=True, headers={'Location': self.redirects[url]})
+        data = self.images.get(url)
+        response = mock.MagicMock(is_redirect=False, headers={'Content-Type': 'image/jpeg'})
+        response.__enter__.return_value = response
+        if data is None:
+            response.raise_for_status.side_effect = requests.HTTPError('404')
+        response.iter_content = lambda chunk_size: [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+        return response
+
+
+class ThumbnailTests(TestCase):
+
+    def generator(self, server):
+        generator = ThumbnailGenerator()
+        generator.session = server
+        return generator
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, RSS_FEEDS_IMAGE_MAX_BYTES=200_000)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.source = RSSFeedSource.objects.create(name='Example', source_type='bbc_sport', feed_url=FEED_URL)
+        resolver = mock.patch('apps.rss_feeds.thumbnails.socket.getaddrinfo', side_effect=self.resolve)
+        resolver.start()
+        self.addCleanup(resolver.stop)
+
+    @staticmethod
+    def resolve(host, port, *args, **kwargs):
+        """Publishers' hosts are public, internal.example.com is not, and IP literals are themselves"""
+        address = {'internal.example.com': '10.0.0.5'}.get(host, '93.184.216.34' if host.endswith('example.com') else host)
+        return [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', (address, port or 0))]
+
+    def make_item(self, title, image_url):
+        return RSSFeedItem.objects.create(
+            source=self.source, title=title, link=f'https://example.com/{title}', guid=title,
+            guid_hash=title.encode().ljust(16, b'-'), image_url=image_url, published_date=timezone.now()
+        )
+
+    def test_image_url_extraction(self):
+        feed = feedparser.parse(
+            '<rss version="2.0" xmlns:media="http://search.yahoo.com/mrss/"><channel>'
+            '<item><title>a</title><media:thumbnail url="https://img.example.com/thumb.jpg"/></item>'
+            '<item><title>b</title><media:content url="https://img.example.com/big.jpg" width="2000" medium="image"/>'
+            '<media:content url="https://img.example.com/small.jpg" width="460" medium="image"/></item>'
+            '<item><title>c</title><enclosure url="https://img.example.com/e.png" type="image/png" length="1"/></item>'
+            '<item><title>d</title><enclosure url="https://audio.example.com/e.mp3" type="audio/mpeg" length="1"/></item>'
+            '</channel></rss>'
+        )
+        self.assertEqual([extract_image_url(entry) for entry in feed.entries], [
+            'https://img.example.com/thumb.jpg',
+            'https://img.example.com/small.jpg',
+            'https://img.example.com/e.png',
+            '',
+        ])
+
+    def test_thumbnails_are_made_and_deduplicated_by_content(self):
+        red = make_image('red')
+        server = ImageServer({'https://a.example.com/1.jpg': red, 'https://b.example.com/2.jpg': red,
+                              'https://a.example.com/3.jpg': make_image('blue')})
+        items = [self.make_item(str(n), url) for n, url in enumerate(sorted(server.images))]
+
+        stats = self.generator(server).process(items)
+
+        self.assertEqual(stats, {'items': 3, 'created': 2, 'failed': 0})
+        self.assertEqual(FeedImage.objects.count(), 2)
+        image = FeedImage.objects.get(content_hash=hashlib.sha256(red).hexdigest())
+        self.assertEqual((image.width, image.height), (320, 213))
+        self.assertTrue(image.thumbnail.name.endswith('.webp'))
+        self.assertEqual(RSSFeedItem.objects.filter(image=image).count(), 2)
+
+        # Only routed under DEBUG; the web server serves MEDIA_URL in production
+        response = thumbnail(RequestFactory().get(image.thumbnail.url), image.thumbnail.name.split('/', 1)[1])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+
+        # Another item with a known URL reuses the thumbnail without a download
+        server.requests.clear()
+        self.generator(server).process([self.make_item('again', 'https://a.example.com/1.jpg')])
+        self.assertEqual(server.requests, [])
+        self.assertEqual(RSSFeedItem.objects.get(guid='again').image, image)
+
+    def test_oversized_and_broken_images_are_skipped(self):
+        noise = Image.frombytes('RGB', (400, 400), bytes(range(256)) * 1875)
+        output = BytesIO()
+        noise.save(output, 'BMP')
+        server = ImageServer({'https://a.example.com/huge.bmp': output.getvalue(),
+                              'https://a.example.com/broken.jpg': b'not an image'})
+        items = [self.make_item('huge', 'https://a.example.com/huge.bmp'),
+                 self.make_item('broken', 'https://a.example.com/broken.jpg'),
+                 self.make_item('missing', 'https://a.example.com/missing.jpg')]
+
+        stats = self.generator(server).process(items)
+
+        self.assertEqual(stats['failed'], 3)
+        self.assertFalse(FeedImage.objects.exists())
+        # Handled, so the sweep does not retry them forever
+        self.assertFalse(ThumbnailGenerator().pending_items().exists())
+
+    def test_only_public_hosts_are_fetched(self):
+        server = ImageServer(
+            {'https://a.example.com/ok.jpg': make_image('red')},
+            redirects={'https://a.example.com/moved.jpg': 'http://169.254.169.254/latest/meta-data/',
+                       'https://a.example.com/hop.jpg': '/ok.jpg'},
+        )
+        urls = ['http://127.0.0.1/a.jpg', 'http://[::1]/a.jpg', 'ftp://a.example.com/a.jpg',
+                'https://internal.example.com/a.jpg', 'https://a.example.com/moved.jpg', 'https://a.example.com/hop.jpg']
+        items = [self.make_item(str(n), url) for n, url in enumerate(urls)]
+
+        stats = self.generator(server).process(items)
+
+        self.assertEqual(stats, {'items': 6, 'created': 1, 'failed': 5})
+        self.assertEqual(sorted(server.requests), [
+            'https://a.example.com/hop.jpg', 'https://a.example.com/moved.jpg', 'https://a.example.com/ok.jpg'
+        ])
+        self.assertIsNotNone(RSSFeedItem.objects.get(guid='5').image)
+
+    def test_connections_go_to_the_checked_address(self):
+        adapter = PublicHostAdapter()
+        pool = adapter.get_connection('https://img.example.com/a.jpg')
+        self.assertEqual((pool.host, pool.port), ('93.184.216.34', 443))
+        self.assertEqual(pool.conn_kw['server_hostname'], 'img.example.com')
+        with self.assertRaises(requests.exceptions.InvalidURL):
+            adapter.get_connection('https://internal.example.com/a.jpg')
+
+        # Asked again, DNS would now send img.example.com elsewhere; the download
+        # still reaches the address that was checked, naming the host in Host
+        hosts = []
+        image = make_image('red')
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                hosts.append(self.headers['Host'])
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Content-Length', str(len(image)))
+                self.end_headers()
+                self.wfile.write(image)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = f'http://img.example.com:{server.server_port}/a.jpg'
+        with mock.patch('apps.rss_feeds.thumbnails.public_address', return_value='127.0.0.1'):
+            self.assertEqual(ThumbnailGenerator(timeout=2)._download(url), image)
+        self.assertEqual(hosts, [f'img.example.com:{server.server_port}'])
+
+    @override_settings(RSS_FEEDS_WEBSUB_CALLBACK_BASE_URL='', RSS_FEEDS_ARCHIVE_PAYLOADS=False)
+    def test_a_new_image_url_is_picked_up_on_update(self):
+        def feed(image):
+            return (
+                '<rss version="2.0" xmlns:media="http://search.yahoo.com/mrss/"><channel><title>x</title>'
+                '<item><title>a</title><link>https://example.com/a</link><guid>a</guid>'
+                f'<media:thumbnail url="https://img.example.com/{image}"/></item>'
+                '</channel></rss>'
+            ).encode()
+        fetcher = RSSFeedFetcher(parse_workers=1)
+        fetcher.session = LocalHub(Client(), feed('old.jpg'))
+        with mock.patch('apps.rss_feeds.tasks.generate_thumbnails_task.delay'):
+            with self.captureOnCommitCallbacks(execute=True):
+                fetcher.fetch_feed(self.source)
+        self.generator(ImageServer({'https://img.example.com/old.jpg': make_image('red')})).process(
+            RSSFeedItem.objects.all()
+        )
+
+        fetcher.session.feed = feed('new.jpg')
+        with mock.patch('apps.rss_feeds.tasks.generate_thumbnails_task.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                fetcher.fetch_feed(self.source)
+
+        item = RSSFeedItem.objects.get(guid='a')
+        self.assertEqual(FeedFetchLog.objects.latest('created_at').items_updated, 1)
+        self.assertEqual(item.image_url, 'https://img.example.com/new.jpg')
+        self.assertEqual((item.image, item.image_checked_at), (None, None))
+        delay.assert_called_once_with([str(item.id)])
+
+    @override_settings(RSS_FEEDS_WEBSUB_CALLBACK_BASE_URL='', RSS_FEEDS_ARCHIVE_PAYLOADS=False)
+    def test_ingest_queues_thumbnails_after_commit(self):
+        feed = (
+            '<rss version="2.0" xmlns:media="http://search.yahoo.com/mrss/"><channel><title>x</title>'
+            '<item><title>a</title><link>https://example.com/a</link><guid>a</guid>'
+            '<media:thumbnail url="https://img.example.com/a.jpg"/></item>'
+            '<item><title>b</title><link>https://example.com/b</link><guid>b</guid></item>'
+            '</channel></rss>'
+        ).encode()
+        fetcher = RSSFeedFetcher(parse_workers=1)
+        fetcher.session = LocalHub(Client(), feed)
+
+        with mock.patch('apps.rss_feeds.tasks.generate_thumbnails_task.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                fetcher.fetch_feed(self.source)
+
+        item = RSSFeedItem.objects.get(guid='a')
+        self.assertEqual(item.image_url, 'https://img.example.com/a.jpg')
+        delay.assert_called_once_with([str(item.id)])
+
+
+def make_tagged_feed(*entries):
+    """Build an RSS payload of (guid, title, description) entries"""
+    items = ''.join(
+        f'<item><title>{title}</title><description>{description}</description>'
+        f'<link>https://example.com/{guid}</link><guid>{guid}</guid></item>'
+        for guid, title, description in entries
+    )
+    return f'<?xml version="1.0"?><rss version="2.0"><channel><title>Football</title>{items}</channel></rss>'.encode()
+
+
+class TaggingTests(TestCase):
+
+    def setUp(self):
+        RSSTagger.reset()
+        self.arsenal = StoryTag.objects.create(name='Arsenal')
+        self.spurs = StoryTag.objects.create(name='Tottenham Hotspur')
+        self.league = StoryTag.objects.create(name='Premier League', aliases='Prem\nTop flight')
+        self.source = RSSFeedSource.objects.create(name='Example', source_type='bbc_sport', feed_url=FEED_URL)
+        self.fetcher = RSSFeedFetcher(parse_workers=1)
+
+    def tags(self, guid):
+        return set(RSSFeedItem.objects.get(guid=guid).tags.values_list('name', flat=True))
+
+    def test_names_aliases_and_dictionary_are_matched_in_one_pass(self):
+        automaton = TagAutomaton(compile_patterns(StoryTag.objects.all()))
+
+        # "Spurs" comes from the club dictionary, "Prem" from the tag's own aliases
+        self.assertEqual(
+            automaton.tag_ids("Gunners edge Spurs as the PREM title race tightens"),
+            {self.arsenal.id, self.spurs.id, self.league.id}
+        )
+        # Whole words only, and accents and case do not matter
+        self.assertEqual(automaton.tag_ids("Arsenalistas celebrate; premier LEAGUE leaders"), {self.league.id})
+        self.assertEqual(automaton.tag_ids("Nothing to see here"), set())
+
+    def test_overlapping_patterns_prefer_the_longest(self):
+        inter = StoryTag.objects.create(name='Inter Milan')
+        milan = StoryTag.objects.create(name='AC Milan')
+        automaton = TagAutomaton(compile_patterns(StoryTag.objects.all()))
+
+        self.assertEqual(automaton.tag_ids("Inter Milan win the derby"), {inter.id})
+        self.assertEqual(automaton.tag_ids("Milan reply late"), {milan.id})
+
+    def test_ingest_stores_tags_in_bulk(self):
+        self.fetcher.session = LocalHub(Client(), make_tagged_feed(
+            ('a', 'Arsenal beat Tottenham', 'North London derby'),
+            ('b', 'Transfer news', 'Premier League clubs spend big'),
+            ('c', 'Cricket', 'Nothing about football'),
+        ))
+
+        with mock.patch.object(RSSTagger, 'automaton', wraps=self.fetcher.tagger.automaton) as automaton:
+            self.fetcher.fetch_feed(self.source)
+
+        automaton.assert_called_once()
+        self.assertEqual(self.tags('a'), {'Arsenal', 'Tottenham Hotspur'})
+        self.assertEqual(self.tags('b'), {'Premier League'})
+        self.assertEqual(self.tags('c'), set())
+
+    def test_automaton_is_rebuilt_only_when_tags_change(self):
+        tagger = RSSTagger()
+        automaton = tagger.automaton()
+        self.assertIs(tagger.automaton(), automaton)
+
+        chelsea = StoryTag.objects.create(name='Chelsea')
+        rebuilt = tagger.automaton()
+        self.assertIsNot(rebuilt, automaton)
+        self.assertEqual(rebuilt.tag_ids('Chelsea FC sign a keeper'), {chelsea.id})
+
+        chelsea.deactivate()
+        self.assertEqual(tagger.automaton().tag_ids('Chelsea sign a keeper'), set())
+
+    def test_updated_items_are_retagged(self):
+        self.fetcher.session = LocalHub(Client(), make_tagged_feed(('a', 'Arsenal win', '')))
+        self.fetcher.fetch_feed(self.source)
+        self.assertEqual(self.tags('a'), {'Arsenal'})
+
+        self.fetcher.session.feed = make_tagged_feed(('a', 'Spurs win', 'Correction: it was Tottenham'))
+        self.fetcher.fetch_feed(self.source)
+        self.assertEqual(self.tags('a'), {'Tottenham Hotspur'})
+
+
+class FetchThrottleTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(THROTTLE_RATES={'fetch_feeds': '2/h', 'fetch_feeds_all': '3/h'})
+    @mock.patch('apps.rss_feeds.views.fetch_all_feeds_task')
+    def test_fetches_are_limited_per_address_and_in_total(self, task):
+        task.delay.return_value.id = 'task'
+        url = '/rss/fetch/'
+        first = [Client(REMOTE_ADDR='10.0.0.1').post(url).status_code for _ in range(3)]
+        second = Client(REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(first, [200, 200, 429])
+        self.assertEqual(second.post(url).status_code, 200)
+
+        response = second.post(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(task.delay.call_count, 3)
+        # Refused by the shared bucket, so the address keeps its own token
+        tokens, _ = cache.get('throttle:fetch_feeds:ip:10.0.0.2')
+        self.assertAlmostEqual(tokens, 1, places=2)
+
+    @override_settings(CACHE_URL='redis://localhost:6379/1', CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost:6379/1'
+    }})
+    def test_redis_buckets_are_taken_and_returned_by_script(self):
+        client = mock.Mock()
+        _redis.cache_clear()
+        self.addCleanup(_redis.cache_clear)
+        with mock.patch('redis.Redis.from_url', return_value=client) as from_url:
+            # Redis hands the script's string result back as bytes
+            client.eval.return_value = b'2.5'
+            self.assertEqual(take_token('fetch_feeds', 'ip:10.0.0.1', 0.5, 2), 2.5)
+            client.eval.return_value = b'0'
+            self.assertEqual(take_token('fetch_feeds', 'ip:10.0.0.1', 0.5, 2), 0.0)
+            return_token('fetch_feeds', 'ip:10.0.0.1', 0.5, 2)
+
+        # One client for the process, built from CACHE_URL
+        from_url.assert_called_once_with('redis://localhost:6379/1')
+        full_key = caches['default'].make_key('throttle:fetch_feeds:ip:10.0.0.1')
+        self.assertEqual(client.eval.call_args_list, [
+            mock.call(TAKE_SCRIPT, 1, full_key, 0.5, 2),
+            mock.call(TAKE_SCRIPT, 1, full_key, 0.5, 2),
+            mock.call(RETURN_SCRIPT, 1, full_key, 2),
+        ])
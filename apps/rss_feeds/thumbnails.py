@@ -0,0 +1,259 @@
+"""
+Thumbnail stage for item images.
+
+Runs in Celery after ingest, never inline: images are downloaded with bounded
+concurrency and a size cap, shrunk to small WebP files with Pillow and stored
+under MEDIA_ROOT, named by the hash of the original so that every image is
+stored once however many items (or URLs) point at it.
+
+Image URLs come from feeds, so only public http(s) hosts are fetched: every
+hop of a download, redirects included, is refused when its host resolves to
+a private, loopback, link-local or otherwise non-global address. The host is
+resolved once per hop and the connection goes to the address that was
+checked (PublicHostAdapter), so a host whose DNS answer changes in between
+(DNS rebinding) cannot reach an internal one.
+"""
+import hashlib
+import ipaddress
+import logging
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from PIL import Image
+
+from .models import FeedImage, RSSFeedItem
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_DIR = 'rss_thumbnails'
+THUMBNAIL_QUALITY = 80
+# Refuse images that would decode to more pixels than this (decompression bombs)
+MAX_PIXELS = 40_000_000
+MAX_REDIRECTS = 3
+
+
+def public_address(url: str) -> Optional[str]:
+    """Address to connect to for url, if it is http(s) on a host that resolves only to public addresses"""
+    try:
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            return None
+        infos = socket.getaddrinfo(parts.hostname, parts.port or None, proto=socket.IPPROTO_TCP)
+    except (ValueError, UnicodeError, OSError):
+        return None
+    addresses = [ipaddress.ip_address(info[4][0].split('%')[0]) for info in infos]
+    if not addresses or not all(address.is_global and not address.is_multicast for address in addresses):
+        return None
+    return str(addresses[0])
+
+
+def is_public_url(url: str) -> bool:
+    """Whether url is http(s) on a host that resolves only to public addresses"""
+    return public_address(url) is not None
+
+
+class PublicHostAdapter(HTTPAdapter):
+    """
+    Transport that connects to a checked public address of the host
+
+    The request still names the host, in its Host header and, over https, in
+    SNI and the certificate check.
+    """
+
+    def get_connection(self, url, proxies=None):
+        address = public_address(url)
+        if address is None:
+            raise requests.exceptions.InvalidURL(f"not a public http(s) URL ({url})")
+        parts = urlsplit(url)
+        pool_kwargs = {}
+        if parts.scheme == 'https':
+            pool_kwargs = {'server_hostname': parts.hostname, 'assert_hostname': parts.hostname}
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        return self.poolmanager.connection_from_host(address, port, parts.scheme, pool_kwargs=pool_kwargs)
+
+    def add_headers(self, request, **kwargs):
+        # The connection is to an address, which http.client would otherwise send as the Host
+        request.headers.setdefault('Host', urlsplit(request.url).netloc.rpartition('@')[2])
+
+
+class ThumbnailGenerator:
+    """Downloads item images and turns them into deduplicated WebP thumbnails"""
+
+    def __init__(self, timeout: int = 10):
+        self.width = getattr(settings, 'RSS_FEEDS_THUMBNAIL_WIDTH', 320)
+        self.max_bytes = getattr(settings, 'RSS_FEEDS_IMAGE_MAX_BYTES', 5 * 1024 * 1024)
+        self.workers = max(1, getattr(settings, 'RSS_FEEDS_IMAGE_WORKERS', 4))
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({
+            'User-Agent': 'GoalLineReport-RSS-Fetcher/1.0'
+        })
+        # Proxies from the environment would resolve the host again themselves
+        self.session.trust_env = False
+        self.session.mount('http://', PublicHostAdapter())
+        self.session.mount('https://', PublicHostAdapter())
+
+    def pending_items(self, limit: int = 200):
+        """Items with an image URL that the thumbnail stage has not handled yet"""
+        return (RSSFeedItem.objects.filter(image_checked_at__isnull=True)
+                .exclude(image_url='').order_by('-fetched_at')[:limit])
+
+    def process(self, items: Iterable[RSSFeedItem]) -> Dict[str, int]:
+        """
+        Attach thumbnails to items
+
+        Returns:
+            Dictionary with the number of items handled, images created and failures
+        """
+        items = [item for item in items if item.image_url]
+        stats = {'items': len(items), 'created': 0, 'failed': 0}
+        if not items:
+            return stats
+
+        urls = {item.image_url for item in items}
+        images_by_url = self._known_images(urls)
+        missing = sorted(url for url in urls if url not in images_by_url)
+
+        # Only network and Pillow work runs in the threads; the ORM stays here.
+        # Chunks bound how many downloaded originals are held in memory.
+        chunk_size = self.workers * 4
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for start in range(0, len(missing), chunk_size):
+                chunk = missing[start:start + chunk_size]
+                downloads = {
+                    url: data for url, data in zip(chunk, executor.map(self._download, chunk)) if data is not None
+                }
+                stats['failed'] += len(chunk) - len(downloads)
+                hashes = {url: hashlib.sha256(data).hexdigest() for url, data in downloads.items()}
+
+                # The same picture under another URL is not decoded again
+                images = {image.content_hash: image for image in FeedImage.objects.filter(content_hash__in=hashes.values())}
+                originals = {hashes[url]: data for url, data in downloads.items() if hashes[url] not in images}
+                for content_hash, thumbnail in zip(originals, executor.map(self._resize, originals.values())):
+                    if thumbnail is None:
+                        stats['failed'] += 1
+                        continue
+                    images[content_hash], created = self._store(content_hash, len(originals[content_hash]), *thumbnail)
+                    stats['created'] += created
+
+                for url, content_hash in hashes.items():
+                    if content_hash in images:
+                        images_by_url[url] = images[content_hash]
+
+        now = timezone.now()
+        for item in items:
+            item.image = images_by_url.get(item.image_url)
+            item.image_checked_at = now
+        RSSFeedItem.objects.bulk_update(items, ['image', 'image_checked_at'], batch_size=500)
+        return stats
+
+    def _known_images(self, urls) -> Dict[str, FeedImage]:
+        """Reuse thumbnails already made for the same URL by other items"""
+        known = {}
+        for item in RSSFeedItem.objects.filter(image_url__in=urls, image__isnull=False).select_related('image'):
+            known[item.image_url] = item.image
+        return known
+
+    def _download(self, url: str) -> Optional[bytes]:
+        """Fetch an image from a public host, giving up as soon as it exceeds the size cap"""
+        try:
+            return self._fetch(url)
+        except (requests.RequestException, ValueError) as e:
+            logger.warning(f"Could not download image {url}: {e}")
+            return None
+
+    def _fetch(self, url: str) -> bytes:
+        """_download without the error handling; redirects are followed here, so that each hop is checked"""
+        for _ in range(MAX_REDIRECTS + 1):
+            if not is_public_url(url):
+                raise ValueError(f"not a public http(s) URL ({url})")
+            response = self.session.get(url, timeout=self.timeout, stream=True, allow_redirects=False)
+            if response.is_redirect:
+                response.close()
+                url = urljoin(url, response.headers['Location'])
+                continue
+            with response:
+                response.raise_for_status()
+                content_type = response.headers.get('Content-Type', '')
+                if content_type and not content_type.startswith('image/'):
+                    raise ValueError(f"not an image ({content_type})")
+                if int(response.headers.get('Content-Length') or 0) > self.max_bytes:
+                    raise ValueError('image too large')
+
+                chunks = []
+                size = 0
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise ValueError('image too large')
+                    chunks.append(chunk)
+                return b''.join(chunks)
+        raise ValueError('too many redirects')
+
+    def _resize(self, data: bytes) -> Optional[Tuple[bytes, int, int]]:
+        """Shrink an image to a WebP thumbnail"""
+        try:
+            with Image.open(BytesIO(data)) as image:
+                if image.width * image.height > MAX_PIXELS:
+                    raise ValueError('image has too many pixels')
+                # Lets JPEG decode at a reduced scale, which is much faster
+                image.draft('RGB', (self.width, self.width))
+                image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+                image.thumbnail((self.width, self.width * 2))
+
+                output = BytesIO()
+                image.save(output, 'WEBP', quality=THUMBNAIL_QUALITY, method=4)
+                return output.getvalue(), image.width, image.height
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            logger.warning(f"Could not make a thumbnail: {e}")
+            return None
+
+    def _store(self, content_hash: str, original_size: int, data: bytes, width: int, height: int):
+        """
+        Save a new thumbnail
+
+        Returns:
+            Tuple of (FeedImage, created)
+        """
+        name = f"{THUMBNAIL_DIR}/{content_hash[:2]}/{content_hash}.webp"
+        if not default_storage.exists(name):
+            name = default_storage.save(name, ContentFile(data))
+        try:
+            with transaction.atomic():
+                image = FeedImage.objects.create(
+                    content_hash=content_hash,
+                    thumbnail=name,
+                    width=width,
+                    height=height,
+                    original_size=original_size
+                )
+            return image, True
+        except IntegrityError:
+            # Made concurrently by another worker
+            return FeedImage.objects.get(content_hash=content_hash), False
+
+
+def queue_thumbnails(items: List[RSSFeedItem]) -> None:
+    """Hand new items with images to the thumbnail task once the ingest commits"""
+    item_ids = [str(item.id) for item in items if item.image_url]
+    if item_ids:
+        transaction.on_commit(lambda: _enqueue(item_ids))
+
+
+def _enqueue(item_ids: List[str]) -> None:
+    from .tasks import generate_thumbnails_task
+    try:
+        generate_thumbnails_task.delay(item_ids)
+    except Exception as e:
+        # Ingest must not fail because the broker is down; the sweep picks these up
+        logger.error(f"Could not queue thumbnails for {len(item_ids)} items: {e}")
@@ -1,11 +1,12 @@
 from django.urls import path
+from apps.utils.read_views import read_view
 from . import views
 
 app_name = 'rss_feeds'
 
 urlpatterns = [
     # Main feed views
-    path('', views.rss_feed_list, name='feed_list'),
+    path('', read_view(views.rss_feed_list, views.arss_feed_list), name='feed_list'),
     path('feed/<uuid:feed_id>/', views.rss_feed_detail, name='feed_detail'),
     
     # Management views (require login)
@@ -18,5 +19,14 @@ urlpatterns = [
     path('fetch/', views.fetch_feeds_ajax, name='fetch_feeds'),
     
     # API endpoint
-    path('api/feeds/', views.rss_feed_api, name='feed_api'),
+    path('api/feeds/', read_view(views.rss_feed_api, views.arss_feed_api), name='feed_api'),
+    
+    # Outgoing RSS/Atom feeds, e.g. all.rss or bbc_sport.atom
+    path('syndication/<slug:scope>.<slug:fmt>', views.outgoing_feed, name='outgoing_feed'),
+    
+    # Server-Sent Events of new items (streamed by core.asgi)
+    path('events/', views.rss_events, name='events'),
+    
+    # WebSub hub callback
+    path('websub/<uuid:subscription_id>/', views.websub_callback, name='websub_callback'),
 ]
@@ -1,75 +1,119 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+import os
+import re
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse
 from django.core.paginator import Paginator
-from django.db.models import Q
+from django.db.models import Count, Q
 from django.utils import timezone
-from .models import RSSFeedSource, RSSFeedItem, FeedFetchLog
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from django.views.decorators.csrf import csrf_exempt
+from django.views.static import serve
+from apps.utils.page_cache import anonymous_page_cache
+from apps.utils.pagination import aget_page
+from apps.utils.throttle import everyone, throttle
+from apps.utils.users import auser
+from .models import RSSFeedSource, RSSFeedItem, FeedFetchLog, WebSubSubscription
 from .services import RSSFeedManager
+from .syndication import FEED_FORMATS
+from .thumbnails import THUMBNAIL_DIR
 from .tasks import fetch_all_feeds_task, mark_as_read_task, archive_feed_item_task
 
 manager = RSSFeedManager()
 
+ACCEPTS_GZIP_RE = re.compile(r'\bgzip\b')
 
-def rss_feed_list(request):
-    """Display list of RSS feed items"""
+
+def feed_list_filters(request):
+    """Unarchived items left by the request's filters, newest first, and the filters"""
     # Get filter parameters
-    source_type = request.GET.get('source')
-    category = request.GET.get('category')
-    search = request.GET.get('search')
-    unread_only = request.GET.get('unread') == 'true'
+    filters = {
+        'current_source': request.GET.get('source'),
+        'current_category': request.GET.get('category'),
+        'current_tag': request.GET.get('tag'),
+        'current_search': request.GET.get('search'),
+        'unread_only': request.GET.get('unread') == 'true',
+    }
     
     # Build queryset
-    queryset = RSSFeedItem.objects.select_related('source').filter(is_archived=False)
+    queryset = RSSFeedItem.objects.select_related('source', 'image').prefetch_related('tags').filter(is_archived=False)
     
     # Apply filters
-    if source_type:
-        queryset = queryset.filter(source__source_type=source_type)
+    if filters['current_source']:
+        queryset = queryset.filter(source__source_type=filters['current_source'])
     
-    if category:
-        queryset = queryset.filter(category__icontains=category)
+    if filters['current_category']:
+        queryset = queryset.filter(category__icontains=filters['current_category'])
     
-    if search:
+    if filters['current_tag']:
+        queryset = queryset.filter(tags__slug=filters['current_tag'])
+    
+    if filters['current_search']:
+        search = filters['current_search']
         queryset = queryset.filter(
             Q(title__icontains=search) |
             Q(description__icontains=search) |
             Q(author__icontains=search)
         )
     
-    if unread_only:
+    if filters['unread_only']:
         queryset = queryset.filter(is_read=False)
     
     # Order by published date
-    queryset = queryset.order_by('-published_date')
-    
-    # Pagination
-    paginator = Paginator(queryset, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
-    # Get available sources and categories for filters
-    sources = RSSFeedSource.objects.filter(is_active=True)
-    categories = RSSFeedItem.objects.filter(
+    return queryset.order_by('-published_date'), filters
+
+
+def feed_list_sources():
+    """Sources offered as filters"""
+    return RSSFeedSource.objects.filter(is_active=True)
+
+
+def feed_list_categories():
+    """Categories offered as filters"""
+    return RSSFeedItem.objects.filter(
         is_archived=False
     ).values_list('category', flat=True).distinct().exclude(category='')
+
+
+# Total and unread items, in one query
+FEED_LIST_STATS = {'total_feeds': Count('id'), 'unread_feeds': Count('id', filter=Q(is_read=False))}
+
+
+@anonymous_page_cache('rss', personalized=True)
+def rss_feed_list(request):
+    """Display list of RSS feed items"""
+    queryset, filters = feed_list_filters(request)
     
-    # Get stats
-    total_feeds = RSSFeedItem.objects.filter(is_archived=False).count()
-    unread_feeds = RSSFeedItem.objects.filter(is_archived=False, is_read=False).count()
+    context = {
+        # Pagination
+        'page_obj': Paginator(queryset, 20).get_page(request.GET.get('page')),
+        # Available sources and categories for filters
+        'sources': feed_list_sources(),
+        'categories': feed_list_categories(),
+        **RSSFeedItem.objects.filter(is_archived=False).aggregate(**FEED_LIST_STATS),
+        **filters,
+    }
+    return render(request, 'rss_feeds/feed_list.html', context)
+
+
+@anonymous_page_cache('rss', personalized=True)
+async def arss_feed_list(request):
+    """rss_feed_list for the ASGI stack, see settings.ASYNC_READ_VIEWS"""
+    queryset, filters = feed_list_filters(request)
     
     context = {
-        'page_obj': page_obj,
-        'sources': sources,
-        'categories': categories,
-        'total_feeds': total_feeds,
-        'unread_feeds': unread_feeds,
-        'current_source': source_type,
-        'current_category': category,
-        'current_search': search,
-        'unread_only': unread_only,
+        'page_obj': await aget_page(queryset, 20, request.GET.get('page')),
+        'sources': [source async for source in feed_list_sources()],
+        'categories': [category async for category in feed_list_categories()],
+        **await RSSFeedItem.objects.filter(is_archived=False).aaggregate(**FEED_LIST_STATS),
+        **filters,
     }
     
+    # The templates ask who the user is, which they may not look up themselves
+    await auser(request)
     return render(request, 'rss_feeds/feed_list.html', context)
 
 
@@ -116,6 +160,7 @@ def rss_feed_sources(request):
                 source.is_active = not source.is_active
                 source.save()
                 status = 'activated' if source.is_active else 'deactivated'
+                manager.fetcher.syndicator.publish_sources([source])
                 messages.success(request, f'Source "{source.name}" {status}.')
             except RSSFeedSource.DoesNotExist:
                 messages.error(request, 'Source not found.')
@@ -197,6 +242,11 @@ def archive_feed_ajax(request, feed_id):
     return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=405)
 
 
+# Every fetch refreshes all feeds for everyone, so they are limited in total too.
+# The per-address bucket is checked first, so that one client cannot drain the
+# shared one; a request the shared one refuses gets its per-address token back.
+@throttle('fetch_feeds', '6/h', burst=2)
+@throttle('fetch_feeds_all', '30/h', burst=5, key=everyone)
 def fetch_feeds_ajax(request):
     """AJAX endpoint to trigger RSS feed fetching"""
     if request.method == 'POST':
@@ -217,10 +267,11 @@ def fetch_feeds_ajax(request):
     return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=405)
 
 
-def rss_feed_api(request):
-    """API endpoint to get RSS feeds in JSON format"""
+def feed_api_query(request):
+    """Unarchived items left by the request's filters, and the requested slice of them"""
     # Get filter parameters
     source_type = request.GET.get('source')
+    tag = request.GET.get('tag')
     limit = int(request.GET.get('limit', 50))
     offset = int(request.GET.get('offset', 0))
     
@@ -230,31 +281,122 @@ def rss_feed_api(request):
     if source_type:
         queryset = queryset.filter(source__source_type=source_type)
     
-    # Apply pagination
-    feeds = queryset.order_by('-published_date')[offset:offset + limit]
-    
-    # Serialize data
-    feed_data = []
-    for feed in feeds:
-        feed_data.append({
-            'id': str(feed.id),
-            'title': feed.title,
-            'description': feed.description,
-            'link': feed.link,
-            'author': feed.author,
-            'category': feed.category,
-            'published_date': feed.published_date.isoformat(),
-            'source': {
-                'name': feed.source.name,
-                'source_type': feed.source.source_type,
-            },
-            'is_read': feed.is_read,
-        })
+    if tag:
+        queryset = queryset.filter(tags__slug=tag)
     
+    # Apply pagination
+    feeds = queryset.order_by('-published_date').prefetch_related('tags')[offset:offset + limit]
+    return queryset, feeds, limit, offset
+
+
+def feed_json(feed):
+    """Serialize one item for rss_feed_api"""
+    return {
+        'id': str(feed.id),
+        'title': feed.title,
+        'description': feed.description,
+        'link': feed.link,
+        'author': feed.author,
+        'category': feed.category,
+        'published_date': feed.published_date.isoformat(),
+        'tags': [tag.slug for tag in feed.tags.all()],
+        'source': {
+            'name': feed.source.name,
+            'source_type': feed.source.source_type,
+        },
+        'is_read': feed.is_read,
+    }
+
+
+def rss_feed_api(request):
+    """API endpoint to get RSS feeds in JSON format"""
+    queryset, feeds, limit, offset = feed_api_query(request)
     return JsonResponse({
         'status': 'success',
-        'feeds': feed_data,
+        'feeds': [feed_json(feed) for feed in feeds],
         'total': queryset.count(),
         'limit': limit,
         'offset': offset,
     })
+
+
+async def arss_feed_api(request):
+    """rss_feed_api for the ASGI stack, see settings.ASYNC_READ_VIEWS"""
+    queryset, feeds, limit, offset = feed_api_query(request)
+    return JsonResponse({
+        'status': 'success',
+        'feeds': [feed_json(feed) async for feed in feeds],
+        'total': await queryset.acount(),
+        'limit': limit,
+        'offset': offset,
+    })
+
+
+def outgoing_feed(request, scope, fmt):
+    """
+    Our own RSS/Atom feed of one source, or of all sources ("all")
+    
+    Served from the precompressed rendering in the cache; conditional
+    requests are answered with 304 without touching the database.
+    """
+    if fmt not in FEED_FORMATS:
+        raise Http404('Unknown feed format')
+    rendered = manager.fetcher.syndicator.get(scope, fmt)
+    if rendered is None:
+        raise Http404('Unknown source')
+    
+    # Each encoding is its own representation, so it gets its own strong ETag
+    gzipped = bool(ACCEPTS_GZIP_RE.search(request.headers.get('Accept-Encoding', '')))
+    etag = rendered.etag[:-1] + '-gzip"' if gzipped else rendered.etag
+    last_modified = int(rendered.last_modified.timestamp())
+    
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        if gzipped:
+            response = HttpResponse(rendered.body, content_type=rendered.content_type)
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(rendered.decompressed(), content_type=rendered.content_type)
+    
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'public, max-age=60'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+def thumbnail(request, path):
+    """Serve an item thumbnail from MEDIA_ROOT in development; names are content hashes, so they never change"""
+    response = serve(request, path, document_root=os.path.join(settings.MEDIA_ROOT, THUMBNAIL_DIR))
+    patch_cache_control(response, public=True, max_age=31536000, immutable=True)
+    return response
+
+
+def rss_events(request):
+    """
+    Placeholder for the Server-Sent Events stream
+    
+    The stream itself is served by core.asgi before requests reach Django;
+    under WSGI this answers 204, which tells EventSource to stop reconnecting.
+    """
+    return HttpResponse(status=204)
+
+
+@csrf_exempt
+def websub_callback(request, subscription_id):
+    """WebSub callback: hubs verify subscriptions with GET and push content with POST"""
+    subscription = get_object_or_404(WebSubSubscription.objects.select_related('source'), id=subscription_id)
+    subscriber = manager.fetcher.websub
+    
+    if request.method == 'GET':
+        challenge = subscriber.verify(subscription, request.GET)
+        if challenge is None:
+            return HttpResponse(status=404)
+        return HttpResponse(challenge, content_type='text/plain')
+    
+    if request.method == 'POST':
+        subscriber.receive(subscription, request.body, request.headers.get('X-Hub-Signature', ''))
+        # Always 2xx, so that a forged push learns nothing about the signature check
+        return HttpResponse(status=202)
+    
+    return HttpResponse(status=405)
@@ -2,7 +2,10 @@
 from django.contrib import admin, messages
 from django.utils import timezone
 from django.http import HttpResponseRedirect
-from .models import Story, StoryChapter, StoryLike, StoryView, StoryTag
+from datetime import timedelta
+from .counters import unique_visitors
+from .models import Story, StoryChapter, StoryLike, StoryView, StoryTag, StoryViewSeries
+from .series import total_views, unpack_counts
 
 
 """===== INLINE CHAPTERS ====="""
@@ -31,8 +34,9 @@ class StoryAdmin(admin.ModelAdmin):
         ("=== Tags ===", {"fields": ("tags",), "classes": ("collapse",)}),
         ("=== Review Workflow ===", {"fields": ("reviewed_by", "reviewed_at", "review_notes"), "classes": ("collapse",)}),
         ("=== Publishing ===", {"fields": ("published_at",), "classes": ("collapse",)}),
-        ("=== Engagement ===", {"fields": ("views_count", "likes_count"), "classes": ("collapse",)}),
+        ("=== Engagement ===", {"fields": ("views_count", "likes_count", "recent_views", "unique_visitors"), "classes": ("collapse",)}),
     )
+    readonly_fields = ["recent_views", "unique_visitors"]
 
     """===== QUERYSET RULES ====="""
     def get_queryset(self, request):
@@ -69,6 +73,22 @@ class StoryAdmin(admin.ModelAdmin):
             ro += ["status", "reviewed_by", "reviewed_at", "published_at"]
         return ro
 
+    """===== ENGAGEMENT ====="""
+    @admin.display(description="Views (30 days)")
+    def recent_views(self, obj):
+        if not obj.pk:
+            return "-"
+        end = timezone.localdate()
+        return total_views([obj.pk], end - timedelta(days=29), end).get(str(obj.pk), 0)
+
+    @admin.display(description="Unique visitors (30 days)")
+    def unique_visitors(self, obj):
+        if not obj.pk:
+            return "-"
+        end = timezone.localdate()
+        estimate = unique_visitors([obj.pk], end - timedelta(days=29), end).get(str(obj.pk), 0)
+        return f"~{estimate}"
+
     """===== SAVE HOOK ====="""
     def save_model(self, request, obj, form, change):
         if not obj.pk:
@@ -164,10 +184,36 @@ class StoryLikeAdmin(admin.ModelAdmin):
 class StoryViewAdmin(admin.ModelAdmin):
     list_display = ["story", "user", "ip_address", "created_at"]
     search_fields = ["story__title", "user__username", "ip_address"]
+    list_select_related = ["story", "user"]
+    # Raw rows are only kept for STORY_VIEW_RETENTION_DAYS; counting them all is not worth it
+    show_full_result_count = False
+
+
+"""===== STORY VIEW SERIES ADMIN ====="""
+@admin.register(StoryViewSeries)
+class StoryViewSeriesAdmin(admin.ModelAdmin):
+    list_display = ["story", "month", "total_views", "updated_at"]
+    list_select_related = ["story"]
+    search_fields = ["story__title"]
+    date_hierarchy = "month"
+    readonly_fields = ["story", "month", "daily_counts"]
+    exclude = ["counts"]
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.display(description="Views")
+    def total_views(self, obj):
+        return sum(unpack_counts(obj.counts))
+
+    @admin.display(description="Views per day")
+    def daily_counts(self, obj):
+        return ", ".join(f"{day}: {views}" for day, views in enumerate(unpack_counts(obj.counts), start=1) if views)
 
 
 """===== STORY TAG ADMIN ====="""
 @admin.register(StoryTag)
 class StoryTagAdmin(admin.ModelAdmin):
     list_display = ["name", "slug", "created_at"]
+    search_fields = ["name", "aliases"]
     prepopulated_fields = {"slug": ("name",)}
@@ -0,0 +1,111 @@
+"""
+Cached story card fragments.
+
+A card's static part (image, title, author, tags, excerpt) is rendered once
+and cached under the story's id and updated_at, which signals in models.py
+move forward whenever the story, its tags or a tag it carries change; a
+changed story simply misses, and stale entries expire on their own. Counters
+and per-user state stay out of the fragment and are rendered live from the
+page's own rows, so likes and views never invalidate a card.
+
+List views page through a light queryset (card_page_queryset) and only load
+the full card data, tags included, for the stories whose fragment missed.
+"""
+from typing import Callable, Dict, Iterable, Optional
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .models import Story, story_cards
+
+CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Templates of the cached part of each kind of card
+CARD_TEMPLATES = {
+    'home': 'story/cards/home_card.html',
+    'list': 'story/cards/list_card.html',
+    'my_stories': 'story/cards/my_story_card.html',
+}
+
+# Fields the live part of a card and keyset pagination need
+CARD_PAGE_FIELDS = (
+    'id', 'slug', 'status', 'review_notes', 'created_at', 'updated_at', 'published_at',
+    'views_count', 'likes_count', 'comments_count',
+)
+
+
+def card_page_queryset(queryset):
+    """Stories with only what pages need when their cards are cached"""
+    return queryset.only(*CARD_PAGE_FIELDS)
+
+
+def card_key(kind: str, story: Story) -> str:
+    return f'story:card:{kind}:{story.id.hex}:{story.updated_at.timestamp():.6f}'
+
+
+def attach_cards(stories: Iterable[Story], kind: str, load: Optional[Callable] = None, cached: bool = True) -> None:
+    """
+    Set card_html on each story, from the cache where possible
+
+    Args:
+        stories: Stories of the page, from card_page_queryset or complete
+        kind: Key of CARD_TEMPLATES
+        load: Callable taking the ids of the stories to render and returning
+            them as card data keyed by id; the stories themselves are rendered
+            when it is None
+        cached: False renders every card afresh and caches nothing, for cards
+            that vary per request such as search results with snippets
+    """
+    stories = list(stories)
+    keys = {story.id: card_key(kind, story) for story in stories}
+    hits = cache.get_many(list(keys.values())) if cached else {}
+
+    missing = [story.id for story in stories if keys[story.id] not in hits]
+    rendered: Dict[str, str] = {}
+    if missing:
+        full = load(missing) if load is not None else {story.id: story for story in stories}
+        rendered = _render(kind, keys, missing, full)
+        if cached:
+            cache.set_many(rendered, CARD_CACHE_TIMEOUT)
+    _attach(stories, keys, hits, rendered)
+
+
+async def aattach_cards(stories: Iterable[Story], kind: str, aload: Optional[Callable] = None) -> None:
+    """attach_cards for async views; aload is a coroutine function such as aload_cards"""
+    stories = list(stories)
+    keys = {story.id: card_key(kind, story) for story in stories}
+    hits = await cache.aget_many(list(keys.values()))
+
+    missing = [story.id for story in stories if keys[story.id] not in hits]
+    rendered: Dict[str, str] = {}
+    if missing:
+        full = await aload(missing) if aload is not None else {story.id: story for story in stories}
+        rendered = _render(kind, keys, missing, full)
+        await cache.aset_many(rendered, CARD_CACHE_TIMEOUT)
+    _attach(stories, keys, hits, rendered)
+
+
+def _render(kind: str, keys: Dict, missing, full: Dict) -> Dict[str, str]:
+    rendered = {}
+    for story_id in missing:
+        story = full.get(story_id)
+        if story is not None:
+            rendered[keys[story_id]] = render_to_string(CARD_TEMPLATES[kind], {'story': story})
+    return rendered
+
+
+def _attach(stories, keys: Dict, hits: Dict, rendered: Dict) -> None:
+    for story in stories:
+        key = keys[story.id]
+        story.card_html = mark_safe(hits.get(key) or rendered.get(key, ''))
+
+
+def load_cards(story_ids) -> Dict:
+    """Full card data of the stories with these ids"""
+    return story_cards(Story.objects.filter(id__in=story_ids)).in_bulk()
+
+
+async def aload_cards(story_ids) -> Dict:
+    """load_cards for async views"""
+    return await story_cards(Story.objects.filter(id__in=story_ids)).ain_bulk()
@@ -0,0 +1,250 @@
+"""
+Buffered story view counting.
+
+A page view only appends a small event to a numbered log in the shared
+cache; no database write happens on the request. The flush task turns the
+log into StoryView rows with bulk inserts and bumps Story.views_count with
+one F() update per distinct increment, so the cost of a popular story does
+not grow with its view count. Bots and repeat views of the same story by the
+same user or address within STORY_VIEW_REPEAT_WINDOW are dropped up front.
+
+The log is only useful in a cache every process shares: with a per-process
+one (LocMem, when CACHE_URL is unset) the flush task never sees the views of
+the web processes. A single-process deployment without CACHE_URL can set
+STORY_VIEW_BUFFERED=False to write views as they come instead, one small
+transaction each.
+
+The same flush folds each view's visitor into a HyperLogLog sketch per story
+and day, from which unique visitors over any date range are estimated
+without touching StoryView.
+"""
+import logging
+import re
+from collections import Counter, defaultdict
+from datetime import date
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .hll import HyperLogLog
+from .models import Story, StoryView, StoryVisitorSketch
+
+logger = logging.getLogger(__name__)
+
+SEQUENCE_KEY = 'story:views:seq'
+EVENT_KEY = 'story:views:{}'
+# Last sequence number flushed, and the last one allocated at that time
+CURSOR_KEY = 'story:views:cursor'
+HORIZON_KEY = 'story:views:horizon'
+SEEN_KEY = 'story:viewed:{story_id}:{viewer}'
+FLUSH_LOCK_KEY = 'story:views:flush-lock'
+# Unflushed events outlive several missed flushes
+EVENT_TIMEOUT = 86400
+FLUSH_LOCK_TIMEOUT = 300
+FLUSH_CHUNK_SIZE = 1000
+
+# Crawlers, link previewers, monitors and HTTP libraries
+BOT_USER_AGENT_RE = re.compile(
+    r'bot|crawl|spider|slurp|archiver|facebookexternalhit|embedly|preview|headless|lighthouse|'
+    r'pingdom|uptime|monitor|curl|wget|python-requests|httpx|aiohttp|go-http-client|java/|okhttp',
+    re.IGNORECASE
+)
+
+
+def is_bot(request) -> bool:
+    user_agent = request.headers.get('User-Agent', '')
+    return not user_agent or bool(BOT_USER_AGENT_RE.search(user_agent))
+
+
+def visitor_key(user_id, ip_address) -> str:
+    return f"u{user_id}" if user_id else f"ip{ip_address}"
+
+
+class ViewCounter:
+    """Accumulates story views in the cache and flushes them in bulk"""
+
+    def __init__(self, repeat_window: Optional[int] = None, buffered: Optional[bool] = None):
+        self.repeat_window = repeat_window or getattr(settings, 'STORY_VIEW_REPEAT_WINDOW', 1800)
+        self._buffered = buffered
+
+    @property
+    def buffered(self) -> bool:
+        """Whether views go to the cache log for the flush task, as by default, or straight to the database"""
+        if self._buffered is None:
+            return getattr(settings, 'STORY_VIEW_BUFFERED', True)
+        return self._buffered
+
+    def record(self, request, story: Story) -> bool:
+        """
+        Count a view of story, unless it comes from a bot or repeats a recent one
+
+        Returns:
+            True if the view was counted
+        """
+        return self.record_id(request, story.id)
+
+    def record_id(self, request, story_id) -> bool:
+        """record() for when only the story's id is at hand, as on page cache hits"""
+        if request.method != 'GET' or is_bot(request):
+            return False
+        user_id = request.user.id if request.user.is_authenticated else None
+        ip_address = request.META.get('REMOTE_ADDR')
+        viewer = visitor_key(user_id, ip_address)
+        if not cache.add(SEEN_KEY.format(story_id=story_id, viewer=viewer), 1, timeout=self.repeat_window):
+            return False
+
+        event = (str(story_id), user_id, ip_address, timezone.localdate().isoformat())
+        try:
+            if not self.buffered:
+                self._store([event])
+                return True
+            cache.add(SEQUENCE_KEY, 0, timeout=None)
+            seq = cache.incr(SEQUENCE_KEY)
+            cache.set(EVENT_KEY.format(seq), event, timeout=EVENT_TIMEOUT)
+        except Exception as e:
+            # A lost view is better than a failed page
+            logger.error(f"Could not record view of story {story_id}: {e}")
+            return False
+        return True
+
+    def flush(self) -> Dict[str, int]:
+        """
+        Write buffered views to the database
+
+        Returns:
+            Dictionary with the number of views stored, stories updated and events lost
+        """
+        stats = {'views': 0, 'stories': 0, 'lost': 0}
+        if not cache.add(FLUSH_LOCK_KEY, 1, timeout=FLUSH_LOCK_TIMEOUT):
+            logger.info("Another flush of story views is running")
+            return stats
+        try:
+            last = cache.get(SEQUENCE_KEY) or 0
+            cursor = cache.get(CURSOR_KEY) or 0
+            horizon = cache.get(HORIZON_KEY) or 0
+            if last < cursor:
+                # The cache was cleared; the log starts over
+                cursor = horizon = 0
+
+            while cursor < last:
+                wanted = range(cursor + 1, min(last, cursor + FLUSH_CHUNK_SIZE) + 1)
+                keys = [EVENT_KEY.format(seq) for seq in wanted]
+                found = cache.get_many(keys)
+                events = []
+                for seq, key in zip(wanted, keys):
+                    event = found.get(key)
+                    if event is None:
+                        if seq > horizon:
+                            # Allocated since the last flush and maybe not written yet
+                            break
+                        # Still missing one flush later: evicted or never written
+                        stats['lost'] += 1
+                    else:
+                        events.append(event)
+                    cursor = seq
+
+                views, stories = self._store(events)
+                stats['views'] += views
+                stats['stories'] += stories
+                cache.set(CURSOR_KEY, cursor, timeout=None)
+                cache.delete_many(keys[:cursor - wanted[0] + 1])
+                if cursor < wanted[-1]:
+                    break
+
+            cache.set(HORIZON_KEY, last, timeout=None)
+        finally:
+            cache.delete(FLUSH_LOCK_KEY)
+
+        if stats['lost']:
+            logger.warning(f"{stats['lost']} buffered story views were lost before they were flushed")
+        return stats
+
+    def _store(self, events) -> tuple:
+        """Insert view rows, bump the counters of their stories and update visitor sketches"""
+        if not events:
+            return 0, 0
+        counts = Counter(story_id for story_id, _, _, _ in events)
+        # Stories deleted since they were viewed have nothing to count
+        existing = {str(story_id) for story_id in Story.objects.filter(id__in=counts).values_list('id', flat=True)}
+        user_ids = set(User.objects.filter(
+            id__in={user_id for _, user_id, _, _ in events if user_id}
+        ).values_list('id', flat=True))
+        views = [
+            StoryView(story_id=story_id, user_id=user_id if user_id in user_ids else None, ip_address=ip_address)
+            for story_id, user_id, ip_address, _ in events if story_id in existing
+        ]
+
+        sketches = defaultdict(HyperLogLog)
+        for story_id, user_id, ip_address, day in events:
+            if story_id in existing:
+                sketches[story_id, date.fromisoformat(day)].add(visitor_key(user_id, ip_address))
+
+        # One UPDATE per distinct increment rather than per story
+        stories_by_increment = defaultdict(list)
+        for story_id in existing:
+            stories_by_increment[counts[story_id]].append(story_id)
+
+        with transaction.atomic():
+            StoryView.objects.bulk_create(views, batch_size=500)
+            for increment, story_ids in stories_by_increment.items():
+                Story.objects.filter(id__in=story_ids).update(views_count=F('views_count') + increment)
+            self._merge_sketches(sketches)
+        return len(views), len(existing)
+
+    def _merge_sketches(self, sketches: Dict[tuple, HyperLogLog]) -> None:
+        """Fold new visitors into the stored sketches of their story and day"""
+        # Rows for new days first, so that writers racing to create the same one
+        # both merge into whichever row wins instead of failing on the constraint
+        StoryVisitorSketch.objects.bulk_create([
+            StoryVisitorSketch(story_id=story_id, day=day, registers=HyperLogLog().to_bytes())
+            for story_id, day in sketches
+        ], batch_size=500, ignore_conflicts=True)
+        stored = StoryVisitorSketch.objects.select_for_update().filter(
+            story_id__in={story_id for story_id, _ in sketches},
+            day__in={day for _, day in sketches}
+        )
+        now = timezone.now()
+        changed = []
+        for row in stored:
+            sketch = sketches.get((str(row.story_id), row.day))
+            if sketch is None:
+                continue
+            sketch.merge(HyperLogLog.from_bytes(row.registers))
+            row.registers = sketch.to_bytes()
+            row.updated_at = now
+            changed.append(row)
+
+        StoryVisitorSketch.objects.bulk_update(changed, ['registers', 'updated_at'], batch_size=500)
+
+
+def unique_visitors(story_ids: Iterable, start: date, end: date) -> Dict[str, int]:
+    """
+    Estimated distinct visitors of each story between start and end, inclusive
+
+    Returns:
+        Dictionary mapping story ids (as strings) to visitor estimates
+    """
+    merged = defaultdict(HyperLogLog)
+    for story_id, registers in StoryVisitorSketch.objects.filter(
+        story_id__in=story_ids, day__range=(start, end)
+    ).values_list('story_id', 'registers'):
+        merged[str(story_id)].merge(HyperLogLog.from_bytes(registers))
+    return {story_id: sketch.count() for story_id, sketch in merged.items()}
+
+
+def unique_visitors_total(story_ids: Iterable, start: date, end: date) -> int:
+    """Estimated distinct visitors of any of the stories between start and end"""
+    return HyperLogLog.union(
+        HyperLogLog.from_bytes(registers)
+        for registers in StoryVisitorSketch.objects.filter(
+            story_id__in=story_ids, day__range=(start, end)
+        ).values_list('registers', flat=True)
+    ).count()
+
+
+view_counter = ViewCounter()
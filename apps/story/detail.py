@@ -0,0 +1,108 @@
+"""
+Story page loader.
+
+Everything the story page shows is fetched in a fixed number of queries: the
+story with its author, its tags, its chapters, the first page of its active
+comments in thread order with their authors, and for signed-in readers
+whether they like the story and which of those comments. Comment threads are
+assembled in Python and later pages come from comments:get_comments, so the
+page costs the same whether the story has no comments or thousands.
+"""
+from collections import defaultdict
+from typing import List, Optional
+
+from apps.comments.models import COMMENTS_PER_PAGE, THREAD_ORDER, Comment, CommentLike
+from apps.utils.likes import aliked_ids, liked_ids
+from apps.utils.pagination import apaginate_keyset, paginate_keyset
+
+from .models import Story
+
+# Queries load_story_detail takes at most: story, tags, chapters, comments,
+# and the reader's story and comment likes
+DETAIL_QUERY_BUDGET = 6
+
+
+class StoryDetail:
+    """A story with what its page shows"""
+
+    def __init__(self, story: Story, comments: List[Comment], comments_cursor: Optional[str],
+                 user_liked: bool, liked_comment_ids: set):
+        self.story = story
+        self.comments = comments
+        # Cursor of the next page of comments, if there is one
+        self.comments_cursor = comments_cursor
+        self.user_liked = user_liked
+        self.liked_comment_ids = liked_comment_ids
+
+    @property
+    def comment_count(self) -> int:
+        return self.story.comments_count
+
+    @property
+    def chapters(self):
+        return self.story.chapters.all()
+
+
+def load_story_detail(slug: str, user) -> Optional[StoryDetail]:
+    """
+    Story with this slug and its page data, or None if there is none
+
+    Args:
+        slug: Slug of the story
+        user: Reader, whose likes are looked up when signed in; whether they
+            may see the story is left to Story.can_view
+    """
+    story = _stories(slug).first()
+    if story is None:
+        return None
+
+    page = paginate_keyset(_comments(story), THREAD_ORDER, per_page=COMMENTS_PER_PAGE)
+    user_liked = False
+    liked_comment_ids = set()
+    if user.is_authenticated:
+        user_liked = story.story_likes.filter(user=user).exists()
+        if page:
+            liked_comment_ids = liked_ids(CommentLike, Comment, user, [comment.id for comment in page])
+
+    return StoryDetail(story, comment_tree(page.object_list), page.next_cursor, user_liked, liked_comment_ids)
+
+
+async def aload_story_detail(slug: str, user) -> Optional[StoryDetail]:
+    """load_story_detail for async views, in as many queries"""
+    story = await _stories(slug).afirst()
+    if story is None:
+        return None
+
+    page = await apaginate_keyset(_comments(story), THREAD_ORDER, per_page=COMMENTS_PER_PAGE)
+    user_liked = False
+    liked_comment_ids = set()
+    if user.is_authenticated:
+        user_liked = await story.story_likes.filter(user=user).aexists()
+        if page:
+            liked_comment_ids = await aliked_ids(CommentLike, Comment, user, [comment.id for comment in page])
+
+    return StoryDetail(story, comment_tree(page.object_list), page.next_cursor, user_liked, liked_comment_ids)
+
+
+def _stories(slug: str):
+    return Story.objects.filter(slug=slug).select_related('author').prefetch_related('tags', 'chapters')
+
+
+def _comments(story: Story):
+    return Comment.objects.filter(story=story).select_related('author')
+
+
+def comment_tree(comments: List[Comment]) -> List[Comment]:
+    """
+    Top-level comments, each with its replies in reply_list
+
+    Replies keep the order of comments; those whose parent is not among them
+    (deactivated threads) are left out, as their parent is. A page in thread
+    order starting at the first comment holds the parent of every reply on it.
+    """
+    children = defaultdict(list)
+    for comment in comments:
+        children[comment.parent_id].append(comment)
+    for comment in comments:
+        comment.reply_list = children.get(comment.id, [])
+    return children.get(None, [])
@@ -0,0 +1,126 @@
+"""
+Live comments and like counts of story pages.
+
+Views publish compact events to the story's broadcast channel once their
+transaction commits: new comments, and the like counts of the story and of
+its comments as absolute values, so that a missed or repeated event never
+leaves a page wrong. story_socket_application serves them over WebSockets at
+/ws/stories/?story=<id>, resuming after &last_event_id= on reconnection.
+"""
+import asyncio
+from typing import Optional
+from urllib.parse import parse_qs
+
+from django.core.exceptions import ValidationError
+
+from apps.utils.broadcast import Broadcaster, publish
+
+from .models import Story
+
+# Close codes in the application range, for clients that should not reconnect
+CLOSE_UNKNOWN_STORY = 4404
+
+broker = Broadcaster()
+
+
+def story_channel(story_id) -> str:
+    return f'story:{story_id}'
+
+
+def publish_comment(comment) -> None:
+    publish(story_channel(comment.story_id), [{
+        'type': 'comment',
+        'id': str(comment.id),
+        'parent_id': str(comment.parent_id) if comment.parent_id else None,
+        'depth': comment.depth,
+        'author': comment.author.username,
+        'text': comment.text,
+        'created_at': comment.created_at.isoformat(),
+    }])
+
+
+def publish_story_likes(story) -> None:
+    publish(story_channel(story.id), [{'type': 'story_likes', 'likes_count': story.likes_count}])
+
+
+def publish_comment_likes(comment) -> None:
+    publish(story_channel(comment.story_id), [{
+        'type': 'comment_likes', 'id': str(comment.id), 'likes_count': comment.likes_count,
+    }])
+
+
+def format_message(seq: int, data: str) -> str:
+    # data is already JSON; no need to parse it again
+    return f'{{"id":{seq},"event":{data}}}'
+
+
+def _query(scope) -> dict:
+    return parse_qs(scope.get('query_string', b'').decode('latin-1'))
+
+
+def _last_event_id(query) -> Optional[int]:
+    try:
+        return int(query.get('last_event_id', [''])[0])
+    except ValueError:
+        return None
+
+
+async def _published_story_id(query) -> Optional[str]:
+    story_id = query.get('story', [''])[0]
+    try:
+        exists = await Story.objects.filter(id=story_id, status=Story.StoryStatus.PUBLISHED).aexists()
+    except ValidationError:
+        return None
+    return story_id if exists else None
+
+
+async def story_socket_application(scope, receive, send):
+    """ASGI application pushing a published story's live events to WebSocket clients"""
+    if scope['type'] != 'websocket':
+        return
+    if (await receive())['type'] != 'websocket.connect':
+        return
+
+    query = _query(scope)
+    story_id = await _published_story_id(query)
+    if story_id is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_UNKNOWN_STORY})
+        return
+
+    name = story_channel(story_id)
+    channel = await broker.subscribe(name)
+    try:
+        last_id = _last_event_id(query)
+        if last_id is None or last_id > channel.last_id:
+            last_id = channel.last_id
+        await send({'type': 'websocket.accept'})
+
+        disconnected = asyncio.create_task(_wait_for_disconnect(receive))
+        try:
+            while True:
+                events = channel.since(last_id)
+                if events:
+                    for seq, data in events:
+                        await send({'type': 'websocket.send', 'text': format_message(seq, data)})
+                        last_id = seq
+                    # More may have arrived while sending
+                    continue
+
+                waiting = asyncio.create_task(channel.wait())
+                await asyncio.wait({disconnected, waiting}, return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    waiting.cancel()
+                    break
+        finally:
+            disconnected.cancel()
+    except OSError:
+        # Client went away mid-write
+        pass
+    finally:
+        broker.unsubscribe(name)
+
+
+async def _wait_for_disconnect(receive):
+    # Clients have nothing to say; whatever they send is ignored
+    while (await receive())['type'] != 'websocket.disconnect':
+        pass
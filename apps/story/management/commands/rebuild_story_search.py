@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.story.search import is_supported, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of published stories'
+
+    def handle(self, *args, **options):
+        if not is_supported():
+            raise CommandError('Full-text search needs SQLite (FTS5) or PostgreSQL; searches fall back to icontains.')
+
+        self.stdout.write(f'Indexed {rebuild_index()} published stories.')
+        self.stdout.write(self.style.SUCCESS('Successfully rebuilt the story search index!'))
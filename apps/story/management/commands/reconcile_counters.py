@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from apps.comments.models import Comment, CommentLike
+from apps.story.models import Story, StoryLike
+from apps.utils.counters import RECONCILE_BATCH_SIZE, count_of, reconcile_counter
+
+
+class Command(BaseCommand):
+    help = 'Recount the denormalized comment, reply and like counters where they have drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=RECONCILE_BATCH_SIZE,
+                            help='Rows checked per query')
+
+    def handle(self, *args, **options):
+        counters = [
+            (Story, 'comments_count', count_of(Comment.objects.all(), 'story')),
+            (Story, 'likes_count', count_of(StoryLike.objects.all(), 'story')),
+            (Comment, 'replies_count', count_of(Comment.objects.all(), 'parent')),
+            (Comment, 'likes_count', count_of(CommentLike.objects.all(), 'comment')),
+        ]
+        for model, counter, actual in counters:
+            repaired = reconcile_counter(model, counter, actual, options['batch_size'])
+            self.stdout.write(f'{model.__name__}.{counter}: repaired {repaired} rows.')
+        self.stdout.write(self.style.SUCCESS('Successfully reconciled counters!'))
@@ -0,0 +1,46 @@
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+from apps.story.models import StoryView
+from apps.story.series import purge_raw_views, rollup_views
+
+
+class Command(BaseCommand):
+    help = 'Roll raw story views up into daily series (the hourly task only covers the last two days)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            help='First day to roll up, as YYYY-MM-DD (default: the oldest raw view)',
+        )
+        parser.add_argument(
+            '--purge',
+            action='store_true',
+            help='Purge raw views older than STORY_VIEW_RETENTION_DAYS afterwards',
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        if options['since']:
+            try:
+                start = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError(f"Invalid date: {options['since']}")
+        else:
+            oldest = StoryView.objects.aggregate(oldest=Min('created_at'))['oldest']
+            start = timezone.localtime(oldest).date() if oldest else today
+
+        # A month at a time keeps each GROUP BY small
+        days = 0
+        day = start
+        while day <= today:
+            end = min(day + timedelta(days=30), today)
+            days += rollup_views(day, end)
+            day = end + timedelta(days=1)
+        self.stdout.write(f'Rolled up {days} story-days of views since {start}.')
+
+        if options['purge']:
+            self.stdout.write(f'Purged {purge_raw_views()} raw views.')
+
+        self.stdout.write(self.style.SUCCESS('Successfully rolled up story views!'))
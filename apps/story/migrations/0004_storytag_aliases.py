@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-19 07:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Renamed when the unrelated change of Story.image moved to its own migration
+    replaces = [
+        ('story', '0004_storytag_aliases_alter_story_image'),
+    ]
+
+    dependencies = [
+        ('story', '0003_story_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storytag',
+            name='aliases',
+            field=models.TextField(blank=True, help_text='Other names for the tag, one per line, used to tag RSS items'),
+        ),
+    ]
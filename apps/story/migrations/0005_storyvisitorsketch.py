@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-19 07:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('story', '0004_storytag_aliases'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoryVisitorSketch',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('day', models.DateField()),
+                ('registers', models.BinaryField(help_text='zlib-compressed HyperLogLog registers (see apps/story/hll.py)')),
+                ('story', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='visitor_sketches', to='story.story')),
+            ],
+            options={
+                'ordering': ['-day'],
+                'unique_together': {('story', 'day')},
+            },
+        ),
+    ]
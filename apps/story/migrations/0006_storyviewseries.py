@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-19 07:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('story', '0005_storyvisitorsketch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoryViewSeries',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('counts', models.BinaryField(help_text='31 little-endian uint32 day counts (see apps/story/series.py)')),
+                ('story', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='view_series', to='story.story')),
+            ],
+            options={
+                'verbose_name_plural': 'Story View Series',
+                'ordering': ['-month'],
+                'unique_together': {('story', 'month')},
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.7 on 2026-10-19 07:40
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """
+    Full-text index of published stories (see apps/story/search.py)
+
+    This is the only copy of the index DDL; change it in a new migration.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS story_search USING fts5("
+            "story_id UNINDEXED, title, summary, content, chapters, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            "INSERT INTO story_search (story_id, title, summary, content, chapters) "
+            "SELECT s.id, s.title, s.summary, s.content, COALESCE(("
+            "SELECT group_concat(c.title || char(10) || c.content, char(10)) "
+            "FROM story_storychapter c WHERE c.story_id = s.id AND c.is_active), '') "
+            "FROM story_story s WHERE s.status = 'published' AND s.is_active"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE TABLE IF NOT EXISTS story_search ("
+            "story_id uuid PRIMARY KEY REFERENCES story_story (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            "summary text NOT NULL, content text NOT NULL, document tsvector NOT NULL)"
+        )
+        schema_editor.execute("CREATE INDEX IF NOT EXISTS story_search_document_idx ON story_search USING gin (document)")
+        schema_editor.execute(
+            "INSERT INTO story_search (story_id, summary, content, document) "
+            "SELECT s.id, s.summary, s.content, "
+            "setweight(to_tsvector('english', s.title), 'A') || setweight(to_tsvector('english', s.summary), 'B') || "
+            "setweight(to_tsvector('english', s.content), 'C') || setweight(to_tsvector('english', COALESCE(("
+            "SELECT string_agg(c.title || E'\\n' || c.content, E'\\n') "
+            "FROM story_storychapter c WHERE c.story_id = s.id AND c.is_active), '')), 'D') "
+            "FROM story_story s WHERE s.status = 'published' AND s.is_active"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute("DROP TABLE IF EXISTS story_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('story', '0006_storyviewseries'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:05
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_comments(apps, schema_editor):
+    Story = apps.get_model('story', 'Story')
+    Comment = apps.get_model('comments', 'Comment')
+    comments = Comment.objects.filter(story=OuterRef('pk'), is_active=True).values('story').annotate(n=Count('pk')).values('n')
+    Story.objects.update(comments_count=Coalesce(Subquery(comments), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('story', '0007_story_search'),
+        ('comments', '0004_comment_replies_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='story',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_comments, migrations.RunPython.noop),
+    ]
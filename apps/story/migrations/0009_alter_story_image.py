@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 07:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('story', '0008_story_comments_count'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='story',
+            name='image',
+            field=models.ImageField(blank=True, null=True, upload_to='stories/'),
+        ),
+    ]
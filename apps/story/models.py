@@ -1,9 +1,13 @@
 from django.db import models
+from django.db.models.functions import Left
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.urls import reverse
 from django.utils.text import slugify
 from apps.utils.models import CoreModel
+from apps.utils.page_cache import invalidate
 
 
 """===== STORY MODEL ====="""
@@ -44,6 +48,8 @@ class Story(CoreModel):
     # Engagement Metrics
     views_count = models.PositiveIntegerField(default=0)
     likes_count = models.PositiveIntegerField(default=0)
+    # Active comments, replies included; kept by signals in apps.comments.models
+    comments_count = models.PositiveIntegerField(default=0)
 
     """--- META INFO ---"""
     class Meta:
@@ -101,6 +107,26 @@ class Story(CoreModel):
     def tag_list(self):
         return self.tags.all()
 
+    @property
+    def excerpt(self):
+        """Summary, or the start of the content; card querysets only load that start"""
+        if self.summary:
+            return self.summary
+        if hasattr(self, 'content_excerpt'):
+            return self.content_excerpt
+        return self.content
+
+
+# Characters of content loaded for the excerpt of a story card
+CARD_EXCERPT_LENGTH = 500
+
+
+def story_cards(queryset):
+    """Stories for list cards: author and tags in two queries, and no full content"""
+    return queryset.select_related('author').prefetch_related('tags').defer('content').annotate(
+        content_excerpt=Left('content', CARD_EXCERPT_LENGTH)
+    )
+
 
 """===== STORY CHAPTER ====="""
 class StoryChapter(CoreModel):
@@ -152,6 +178,7 @@ class StoryTag(CoreModel):
     """Model for tags for stories"""
     name = models.CharField(max_length=50)
     slug = models.SlugField(unique=True, blank=True)
+    aliases = models.TextField(blank=True, help_text="Other names for the tag, one per line, used to tag RSS items")
 
     class Meta:
         ordering = ['name']
@@ -164,3 +191,148 @@ class StoryTag(CoreModel):
 
     def __str__(self):
         return self.name
+
+    @property
+    def alias_list(self):
+        return [alias.strip() for alias in self.aliases.splitlines() if alias.strip()]
+
+
+"""===== STORY VISITOR SKETCH ====="""
+class StoryVisitorSketch(CoreModel):
+    """HyperLogLog sketch of the distinct visitors of a story on one day"""
+    story = models.ForeignKey(Story, on_delete=models.CASCADE, related_name='visitor_sketches')
+    day = models.DateField()
+    registers = models.BinaryField(help_text="zlib-compressed HyperLogLog registers (see apps/story/hll.py)")
+
+    class Meta:
+        ordering = ['-day']
+        unique_together = ['story', 'day']
+
+    def __str__(self):
+        return f'Visitors of {self.story.title} on {self.day}'
+
+
+"""===== STORY VIEW SERIES ====="""
+class StoryViewSeries(CoreModel):
+    """Daily view counts of a story for one month, packed into a small binary array"""
+    story = models.ForeignKey(Story, on_delete=models.CASCADE, related_name='view_series')
+    month = models.DateField(help_text="First day of the month")
+    counts = models.BinaryField(help_text="31 little-endian uint32 day counts (see apps/story/series.py)")
+
+    class Meta:
+        ordering = ['-month']
+        unique_together = ['story', 'month']
+        verbose_name_plural = 'Story View Series'
+
+    def __str__(self):
+        return f'Views of {self.story.title} in {self.month:%B %Y}'
+
+
+"""===== SEARCH INDEX SIGNALS ====="""
+# Fields of a story that its search index row is built from
+SEARCH_FIELDS = ('title', 'summary', 'content', 'status', 'is_active')
+
+
+@receiver(post_save, sender=Story)
+def index_saved_story(sender, instance, created=False, update_fields=None, **kwargs):
+    """Refresh the search index row of a story when an indexed field changed"""
+    if update_fields and not set(SEARCH_FIELDS) & set(update_fields):
+        return
+    if not created and getattr(instance, '_previous_search_values', None) == search_values(instance):
+        return
+    from .search import index_story
+    index_story(instance)
+
+
+def search_values(story: Story) -> tuple:
+    return tuple(getattr(story, field) for field in SEARCH_FIELDS)
+
+
+@receiver(post_delete, sender=Story)
+def unindex_deleted_story(sender, instance, **kwargs):
+    from .search import remove_story
+    remove_story(instance.id)
+
+
+@receiver([post_save, post_delete], sender=StoryChapter)
+def index_chapter_story(sender, instance, **kwargs):
+    """Chapter text is indexed with its story"""
+    from .search import index_story
+    story = Story.objects.filter(id=instance.story_id).first()
+    if story is not None:
+        index_story(story)
+
+
+"""===== CARD VERSION SIGNALS ====="""
+# Cached story cards are keyed on updated_at (see cards.py), so it has to move
+# whenever something a card shows changes, not only on full saves
+
+
+@receiver(post_save, sender=Story)
+def touch_partially_saved_story(sender, instance, update_fields=None, **kwargs):
+    """save(update_fields=[...]) leaves updated_at out unless it is listed"""
+    if update_fields and 'updated_at' not in update_fields:
+        instance.updated_at = timezone.now()
+        Story._base_manager.filter(pk=instance.pk).update(updated_at=instance.updated_at)
+
+
+@receiver(m2m_changed, sender=Story.tags.through)
+def touch_retagged_stories(sender, instance, action, reverse, pk_set, **kwargs):
+    now = timezone.now()
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            Story._base_manager.filter(pk=instance.pk).update(updated_at=now)
+    elif action in ('post_add', 'post_remove'):
+        Story._base_manager.filter(pk__in=pk_set).update(updated_at=now)
+    elif action == 'pre_clear':
+        # Afterwards there is no telling which stories had the tag
+        Story._base_manager.filter(tags=instance).update(updated_at=now)
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate('stories')
+
+
+@receiver(post_save, sender=StoryTag)
+@receiver(pre_delete, sender=StoryTag)
+def touch_stories_of_tag(sender, instance, created=False, **kwargs):
+    """A renamed or deleted tag changes the cards of every story carrying it"""
+    if not created:
+        Story._base_manager.filter(tags=instance).update(updated_at=timezone.now())
+        invalidate('stories')
+
+
+"""===== PAGE CACHE SIGNALS ====="""
+# Anonymous pages are cached per group (see apps/utils/page_cache.py): lists
+# depend on 'stories', a story's page on 'story:<slug>'
+
+
+@receiver(pre_save, sender=Story)
+def remember_previous_state(sender, instance, **kwargs):
+    """The stored slug and indexed fields, for this and the search index signals, in one query"""
+    instance._previous_slug = instance._previous_search_values = None
+    if not instance._state.adding:
+        stored = Story._base_manager.filter(pk=instance.pk).values_list('slug', *SEARCH_FIELDS).first()
+        if stored is not None:
+            instance._previous_slug, instance._previous_search_values = stored[0], stored[1:]
+
+
+@receiver(post_save, sender=Story)
+@receiver(post_delete, sender=Story)
+def invalidate_story_pages(sender, instance, **kwargs):
+    groups = {'stories', f'story:{instance.slug}'}
+    previous = getattr(instance, '_previous_slug', None)
+    if previous:
+        groups.add(f'story:{previous}')
+    invalidate(*groups)
+
+
+@receiver(post_save, sender=StoryChapter)
+@receiver(post_delete, sender=StoryChapter)
+def invalidate_chapter_story_page(sender, instance, **kwargs):
+    invalidate_story_page(instance.story_id)
+
+
+def invalidate_story_page(story_id) -> None:
+    """Invalidate the page of the story with this id, for changes to what it shows besides the story"""
+    slug = Story._base_manager.filter(pk=story_id).values_list('slug', flat=True).first()
+    if slug:
+        invalidate(f'story:{slug}')
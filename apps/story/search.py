@@ -0,0 +1,201 @@
+"""
+Ranked full-text search over published stories.
+
+The index is one row per published story holding its title, summary,
+content and chapter text, in an FTS5 table on SQLite or a weighted tsvector
+with a GIN index on PostgreSQL. Signals in models.py keep it current as
+stories and chapters are saved or deleted. Other backends fall back to
+unranked icontains filtering.
+
+The table is created by migrations/0007_story_search.py, which holds the only
+copy of its DDL; change it there, in a new migration.
+"""
+import re
+from typing import List, Optional
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Story, StoryChapter, story_cards
+
+TABLE = 'story_search'
+# Private-use characters marking matches in snippets until they are escaped
+MARK_START = '\ue000'
+MARK_END = '\ue001'
+SNIPPET_WORDS = 24
+WORD_RE = re.compile(r'\w+')
+
+# Column weights: title, summary, content, chapters
+SQLITE_RANK = f"bm25({TABLE}, 0, 10.0, 4.0, 1.0, 1.0)"
+
+
+def is_supported(vendor: Optional[str] = None) -> bool:
+    return (vendor or connection.vendor) in ('sqlite', 'postgresql')
+
+
+def _db_id(story_id):
+    """Story id as the database stores it (SQLite keeps UUIDs as 32 hex digits)"""
+    return story_id.hex if connection.vendor == 'sqlite' else story_id
+
+
+def index_story(story: Story) -> None:
+    """Add, refresh or drop the index row of a story"""
+    if not is_supported():
+        return
+    remove_story(story.id)
+    if story.status != Story.StoryStatus.PUBLISHED or not story.is_active:
+        return
+    chapters = '\n'.join(
+        f"{title}\n{content}"
+        for title, content in StoryChapter.objects.filter(story=story).values_list('title', 'content')
+    )
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                f"INSERT INTO {TABLE} (story_id, title, summary, content, chapters) VALUES (%s, %s, %s, %s, %s)",
+                [_db_id(story.id), story.title, story.summary, story.content, chapters]
+            )
+        else:
+            cursor.execute(
+                f"INSERT INTO {TABLE} (story_id, summary, content, document) VALUES (%s, %s, %s, "
+                "setweight(to_tsvector('english', %s), 'A') || setweight(to_tsvector('english', %s), 'B') || "
+                "setweight(to_tsvector('english', %s), 'C') || setweight(to_tsvector('english', %s), 'D'))",
+                [story.id, story.summary, story.content, story.title, story.summary, story.content, chapters]
+            )
+
+
+def remove_story(story_id) -> None:
+    if is_supported():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLE} WHERE story_id = %s", [_db_id(story_id)])
+
+
+def rebuild_index() -> int:
+    """Index every published story from scratch"""
+    if not is_supported():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+    count = 0
+    for story in Story.objects.filter(status=Story.StoryStatus.PUBLISHED).iterator(chunk_size=500):
+        index_story(story)
+        count += 1
+    return count
+
+
+def _highlight(snippet: str):
+    return mark_safe(escape(snippet).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+def _fts5_query(text: str) -> str:
+    """Every word must match, the last one as a prefix; FTS5 syntax in the input is not honoured"""
+    words = WORD_RE.findall(text)
+    if not words:
+        return ''
+    return ' '.join(f'"{word}"' for word in words) + '*'
+
+
+class SearchResults:
+    """
+    Ranked matches of a query among the stories of a queryset
+
+    Sliceable and countable, so it pages with django.core.paginator.Paginator;
+    only the stories of the requested page are loaded and highlighted. Each
+    has `search_rank` and a `search_snippet` with matches in <mark>.
+    """
+
+    def __init__(self, text: str, queryset=None):
+        self.text = text.strip()
+        self.queryset = queryset if queryset is not None else Story.objects.filter(status=Story.StoryStatus.PUBLISHED)
+        self._count = None
+
+    def _scope(self):
+        """Restriction of the matches to the queryset, as SQL and params"""
+        sql, params = self.queryset.order_by().values('id').query.sql_with_params()
+        return f"story_id IN ({sql})", list(params)
+
+    def count(self) -> int:
+        if self._count is None:
+            self._count = self._count_matches()
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        stop = index.stop if index.stop is not None else self.count()
+        return self._page(start, max(0, stop - start))
+
+    def _count_matches(self) -> int:
+        if not is_supported():
+            return self._fallback().count()
+        if connection.vendor == 'sqlite':
+            match = _fts5_query(self.text)
+            if not match:
+                return 0
+            where, params = f"{TABLE} MATCH %s", [match]
+        else:
+            where, params = "document @@ websearch_to_tsquery('english', %s)", [self.text]
+        scope, scope_params = self._scope()
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {TABLE} WHERE {where} AND {scope}", params + scope_params)
+            return cursor.fetchone()[0]
+
+    def _page(self, offset: int, limit: int) -> List[Story]:
+        if not limit:
+            return []
+        if not is_supported():
+            return list(self._fallback()[offset:offset + limit])
+
+        scope, scope_params = self._scope()
+        if connection.vendor == 'sqlite':
+            match = _fts5_query(self.text)
+            if not match:
+                return []
+            sql = (
+                f"SELECT story_id, {SQLITE_RANK} AS rank, "
+                f"snippet({TABLE}, -1, %s, %s, '…', %s) "
+                f"FROM {TABLE} WHERE {TABLE} MATCH %s AND {scope} ORDER BY rank LIMIT %s OFFSET %s"
+            )
+            params = [MARK_START, MARK_END, SNIPPET_WORDS, match] + scope_params + [limit, offset]
+        else:
+            # Headlines are costly, so only the page's rows get one
+            sql = (
+                "SELECT page.story_id, page.rank, ts_headline('english', page.summary || ' ' || page.content, "
+                f"page.query, %s) FROM (SELECT story_id, summary, content, query, "
+                f"ts_rank_cd(document, query) AS rank FROM {TABLE}, websearch_to_tsquery('english', %s) query "
+                f"WHERE document @@ query AND {scope} ORDER BY rank DESC LIMIT %s OFFSET %s) page ORDER BY page.rank DESC"
+            )
+            options = f"StartSel={MARK_START}, StopSel={MARK_END}, MaxWords={SNIPPET_WORDS}, MinWords=12"
+            params = [options, self.text] + scope_params + [limit, offset]
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        field = Story._meta.pk
+        matches = [(field.to_python(story_id), rank, snippet) for story_id, rank, snippet in rows]
+        stories = story_cards(Story.objects.all()).in_bulk([story_id for story_id, _, _ in matches])
+        page = []
+        for story_id, rank, snippet in matches:
+            story = stories.get(story_id)
+            if story is not None:
+                story.search_rank = rank
+                story.search_snippet = _highlight(snippet)
+                page.append(story)
+        return page
+
+    def _fallback(self):
+        queryset = self.queryset
+        for word in WORD_RE.findall(self.text):
+            queryset = queryset.filter(Q(title__icontains=word) | Q(summary__icontains=word))
+        return queryset.order_by('-published_at')
+
+
+def search_stories(text: str, queryset=None) -> SearchResults:
+    return SearchResults(text, queryset)
@@ -0,0 +1,164 @@
+"""
+Compact daily view series.
+
+Raw StoryView rows are rolled up into one StoryViewSeries row per story and
+month holding 31 packed day counts, and are purged once older than
+STORY_VIEW_RETENTION_DAYS. Analytics read the series, so their cost and the
+table's size grow with stories and months rather than with views.
+
+A day's slot only ever grows: the rollup keeps the larger of the stored and
+recounted values. Recounting a day is then safe however often it happens,
+including after a purge was interrupted halfway through that day.
+"""
+import logging
+import sys
+from array import array
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import StoryView, StoryViewSeries
+
+logger = logging.getLogger(__name__)
+
+DAYS_PER_SERIES = 31
+PURGE_BATCH_SIZE = 5000
+
+
+def pack_counts(counts: List[int]) -> bytes:
+    values = array('I', counts)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+def unpack_counts(data: Optional[bytes]) -> List[int]:
+    values = array('I')
+    if data:
+        values.frombytes(bytes(data))
+        if sys.byteorder == 'big':
+            values.byteswap()
+    return values.tolist() + [0] * (DAYS_PER_SERIES - len(values))
+
+
+def _day_start(day: date) -> datetime:
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def rollup_views(start: date, end: date) -> int:
+    """
+    Fold raw views from start to end (inclusive) into the monthly series
+
+    Returns:
+        Number of (story, day) counts written
+    """
+    day_counts = (
+        StoryView.objects.filter(created_at__gte=_day_start(start), created_at__lt=_day_start(end + timedelta(days=1)))
+        .annotate(day=TruncDate('created_at'))
+        .values_list('story_id', 'day')
+        .annotate(views=Count('id'))
+    )
+    by_month = defaultdict(dict)
+    for story_id, day, views in day_counts:
+        by_month[story_id, day.replace(day=1)][day.day - 1] = views
+    if not by_month:
+        return 0
+
+    with transaction.atomic():
+        stored = {
+            (row.story_id, row.month): row
+            for row in StoryViewSeries.objects.select_for_update().filter(
+                story_id__in={story_id for story_id, _ in by_month},
+                month__in={month for _, month in by_month}
+            )
+        }
+        now = timezone.now()
+        changed, created = [], []
+        for (story_id, month), days in by_month.items():
+            row = stored.get((story_id, month))
+            counts = unpack_counts(row.counts if row else None)
+            for index, views in days.items():
+                counts[index] = max(counts[index], views)
+            if row is None:
+                created.append(StoryViewSeries(story_id=story_id, month=month, counts=pack_counts(counts)))
+            else:
+                row.counts = pack_counts(counts)
+                row.updated_at = now
+                changed.append(row)
+        StoryViewSeries.objects.bulk_update(changed, ['counts', 'updated_at'], batch_size=500)
+        StoryViewSeries.objects.bulk_create(created, batch_size=500)
+    return sum(len(days) for days in by_month.values())
+
+
+def purge_raw_views(retention_days: Optional[int] = None, batch_size: int = PURGE_BATCH_SIZE) -> int:
+    """
+    Delete raw views older than the retention window, a day at a time and in batches
+
+    Each day is rolled up right before its rows go, so nothing is lost even
+    for days no scheduled rollup covered.
+
+    Returns:
+        Number of rows deleted
+    """
+    retention_days = retention_days or getattr(settings, 'STORY_VIEW_RETENTION_DAYS', 90)
+    cutoff = timezone.localdate() - timedelta(days=retention_days)
+    oldest = StoryView.objects.filter(created_at__lt=_day_start(cutoff)).aggregate(oldest=Min('created_at'))['oldest']
+    if oldest is None:
+        return 0
+
+    deleted = 0
+    day = timezone.localtime(oldest).date()
+    while day < cutoff:
+        rollup_views(day, day)
+        rows = StoryView.objects.filter(created_at__gte=_day_start(day), created_at__lt=_day_start(day + timedelta(days=1)))
+        while True:
+            # Small transactions keep locks short on a table the site writes to
+            ids = list(rows.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            deleted += StoryView.objects.filter(id__in=ids).delete()[0]
+        day += timedelta(days=1)
+    return deleted
+
+
+def _months(start: date, end: date) -> List[date]:
+    months = []
+    month = start.replace(day=1)
+    while month <= end:
+        months.append(month)
+        month = (month + timedelta(days=DAYS_PER_SERIES + 1)).replace(day=1)
+    return months
+
+
+def daily_views(story_ids: Iterable, start: date, end: date) -> Dict[str, List[Tuple[date, int]]]:
+    """
+    Rolled-up views per day of each story between start and end, inclusive
+
+    Returns:
+        Dictionary mapping story ids (as strings) to (day, views) pairs, one per day
+    """
+    series = defaultdict(dict)
+    for story_id, month, counts in StoryViewSeries.objects.filter(
+        story_id__in=story_ids, month__in=_months(start, end)
+    ).values_list('story_id', 'month', 'counts'):
+        series[str(story_id)][month] = unpack_counts(counts)
+
+    days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    return {
+        story_id: [(day, months.get(day.replace(day=1), [0] * DAYS_PER_SERIES)[day.day - 1]) for day in days]
+        for story_id, months in series.items()
+    }
+
+
+def total_views(story_ids: Iterable, start: date, end: date) -> Dict[str, int]:
+    """Rolled-up views of each story between start and end, inclusive"""
+    return {
+        story_id: sum(views for _, views in days)
+        for story_id, days in daily_views(story_ids, start, end).items()
+    }
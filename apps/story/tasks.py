@@ -0,0 +1,42 @@
+from celery import shared_task
+from datetime import timedelta
+from django.utils import timezone
+import logging
+from .counters import view_counter
+from .series import purge_raw_views, rollup_views
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, name='story.flush_view_counts')
+def flush_view_counts_task(self):
+    """
+    Celery task to write buffered story views to the database
+    """
+    try:
+        stats = view_counter.flush()
+        if stats['views']:
+            logger.info(f"Flushed {stats['views']} story views across {stats['stories']} stories")
+        return {'status': 'success', **stats}
+
+    except Exception as e:
+        logger.error(f"Error flushing story views: {e}")
+        return {'status': 'error', 'message': str(e)}
+
+
+@shared_task(bind=True, name='story.rollup_story_views')
+def rollup_story_views_task(self):
+    """
+    Celery task to roll raw story views up into daily series and purge old raw rows
+    """
+    try:
+        today = timezone.localdate()
+        # Yesterday too, for views flushed after midnight
+        days = rollup_views(today - timedelta(days=1), today)
+        purged = purge_raw_views()
+        logger.info(f"Rolled up {days} story-days of views, purged {purged} raw views")
+        return {'status': 'success', 'days': days, 'purged': purged}
+
+    except Exception as e:
+        logger.error(f"Error rolling up story views: {e}")
+        return {'status': 'error', 'message': str(e)}
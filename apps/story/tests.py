@@ -1,3 +1,871 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import hashlib
+from importlib import import_module
+import re
+from datetime import date, datetime, time, timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from apps.comments.models import Comment, CommentLike
+from apps.comments.views import aget_comments, get_comments
+from apps.main.management.commands.benchmark_read_views import routed_read_views
+from apps.utils.broadcast import Broadcaster, CacheLogBackend, Channel
+from apps.utils.page_cache import LOCK_KEY, check_shared_cache, normalized_url
+from apps.utils.pagination import InvalidCursor, paginate_keyset
+
+from . import live
+from .detail import DETAIL_QUERY_BUDGET, load_story_detail
+from .counters import unique_visitors, unique_visitors_total, view_counter
+from .hll import HyperLogLog
+from .models import Story, StoryChapter, StoryLike, StoryTag, StoryView, StoryViewSeries, StoryVisitorSketch
+from .views import astory_list, story_list
+from .search import MARK_START, MARK_END, _highlight, rebuild_index, search_stories
+from .series import (
+    DAYS_PER_SERIES, daily_views, pack_counts, purge_raw_views, rollup_views, total_views, unpack_counts,
+)
+
+BROWSER = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+
+
+class ViewCountTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', password='x')
+        self.story = Story.objects.create(title='Derby day', content='...', author=self.author, status='published')
+        self.other = Story.objects.create(title='Transfer news', content='...', author=self.author, status='published')
+
+    def view(self, story, ip='10.0.0.1', user_agent=BROWSER, client=None):
+        client = client or Client()
+        response = client.get(story.get_absolute_url(), HTTP_USER_AGENT=user_agent, REMOTE_ADDR=ip)
+        self.assertEqual(response.status_code, 200)
+
+    def test_views_are_buffered_and_flushed_in_bulk(self):
+        self.view(self.story, ip='10.0.0.1')
+        self.view(self.story, ip='10.0.0.2')
+        self.view(self.other, ip='10.0.0.1')
+        self.assertEqual(StoryView.objects.count(), 0)
+
+        # Story lookup, savepoint pair, one bulk insert, one UPDATE per distinct
+        # increment, and the sketch insert, lookup and update
+        with self.assertNumQueries(9):
+            stats = view_counter.flush()
+
+        self.assertEqual(stats, {'views': 3, 'stories': 2, 'lost': 0})
+        self.story.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.story.views_count, self.other.views_count), (2, 1))
+        self.assertEqual(StoryView.objects.filter(story=self.story).count(), 2)
+
+        # Nothing is counted twice
+        self.assertEqual(view_counter.flush()['views'], 0)
+
+    def test_bots_and_repeat_views_are_not_counted(self):
+        self.view(self.story, user_agent='Googlebot/2.1 (+http://www.google.com/bot.html)')
+        self.view(self.story, user_agent='')
+        self.view(self.story, ip='10.0.0.1')
+        self.view(self.story, ip='10.0.0.1')
+
+        client = Client()
+        client.force_login(self.author)
+        self.view(self.story, ip='10.0.0.7', client=client)
+        self.view(self.story, ip='10.0.0.8', client=client)
+
+        view_counter.flush()
+        self.story.refresh_from_db()
+        self.assertEqual(self.story.views_count, 2)
+        self.assertEqual(StoryView.objects.filter(user=self.author).count(), 1)
+
+    def test_events_missing_for_a_whole_flush_are_skipped(self):
+        self.view(self.story, ip='10.0.0.1')
+        self.view(self.story, ip='10.0.0.2')
+        cache.delete('story:views:1')
+
+        # Not yet written, as far as the first flush can tell
+        self.assertEqual(view_counter.flush(), {'views': 0, 'stories': 0, 'lost': 0})
+        self.assertEqual(view_counter.flush(), {'views': 1, 'stories': 1, 'lost': 1})
+        self.story.refresh_from_db()
+        self.assertEqual(self.story.views_count, 1)
+
+
+    def test_views_are_written_at_once_when_not_buffered(self):
+        with override_settings(STORY_VIEW_BUFFERED=False):
+            self.view(self.story, ip='10.0.0.1')
+            self.view(self.story, ip='10.0.0.1')
+
+        self.story.refresh_from_db()
+        self.assertEqual(self.story.views_count, 1)
+        self.assertEqual(StoryView.objects.filter(story=self.story).count(), 1)
+        self.assertEqual(StoryVisitorSketch.objects.filter(story=self.story).count(), 1)
+        self.assertEqual(view_counter.flush()['views'], 0)
+
+    def test_a_sketch_created_meanwhile_is_merged_into(self):
+        today = timezone.localdate()
+        create = StoryVisitorSketch.objects.bulk_create
+
+        def racing_create(objs, **kwargs):
+            # Another writer stores the same (story, day) first
+            rival = HyperLogLog()
+            rival.add('ip10.9.9.9')
+            StoryVisitorSketch.objects.create(story=self.story, day=today, registers=rival.to_bytes())
+            return create(objs, **kwargs)
+
+        with override_settings(STORY_VIEW_BUFFERED=False), \
+                mock.patch.object(StoryVisitorSketch.objects, 'bulk_create', racing_create):
+            self.view(self.story, ip='10.0.0.1')
+
+        self.story.refresh_from_db()
+        self.assertEqual(self.story.views_count, 1)
+        self.assertEqual(StoryView.objects.filter(story=self.story).count(), 1)
+        self.assertEqual(unique_visitors([self.story.id], today, today), {str(self.story.id): 2})
+
+
+class HyperLogLogTests(SimpleTestCase):
+
+    def test_estimates_are_within_a_few_percent(self):
+        for distinct in (10, 1000, 50000):
+            sketch = HyperLogLog()
+            sketch.update(f"visitor-{n}" for n in range(distinct))
+            # Adding the same visitors again changes nothing
+            sketch.update(f"visitor-{n}" for n in range(distinct // 2))
+            self.assertAlmostEqual(sketch.count(), distinct, delta=max(1, distinct * 0.05))
+
+    def test_merge_is_the_union(self):
+        monday, tuesday = HyperLogLog(), HyperLogLog()
+        monday.update(f"visitor-{n}" for n in range(0, 6000))
+        tuesday.update(f"visitor-{n}" for n in range(4000, 10000))
+
+        merged = HyperLogLog.union([monday, tuesday])
+        self.assertAlmostEqual(merged.count(), 10000, delta=500)
+
+        restored = HyperLogLog.from_bytes(merged.to_bytes())
+        self.assertEqual(restored.registers, merged.registers)
+        self.assertLess(len(HyperLogLog().to_bytes()), 100)
+
+
+class UniqueVisitorTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', password='x')
+        self.story = Story.objects.create(title='Derby day', content='...', author=self.author, status='published')
+
+    def record_views(self, day, ips):
+        # Calls are hours apart, well outside the repeat window
+        cache.clear()
+        with mock.patch('apps.story.counters.timezone.localdate', return_value=day):
+            for ip in ips:
+                request = RequestFactory().get('/', HTTP_USER_AGENT=BROWSER, REMOTE_ADDR=ip)
+                request.user = AnonymousUser()
+                view_counter.record(request, self.story)
+        view_counter.flush()
+
+    def test_unique_visitors_over_a_date_range(self):
+        today = date(2026, 3, 10)
+        yesterday = today - timedelta(days=1)
+        self.record_views(yesterday, [f"10.0.0.{n}" for n in range(1, 101)])
+        self.record_views(today, [f"10.0.0.{n}" for n in range(51, 201)])
+
+        # A later flush on the same day merges into the stored sketch
+        self.record_views(today, [f"10.0.0.{n}" for n in range(151, 251)])
+
+        self.assertEqual(StoryVisitorSketch.objects.filter(story=self.story).count(), 2)
+        self.assertAlmostEqual(
+            unique_visitors([self.story.id], today, today)[str(self.story.id)], 200, delta=6
+        )
+        self.assertAlmostEqual(
+            unique_visitors([self.story.id], yesterday, today)[str(self.story.id)], 250, delta=8
+        )
+        self.assertAlmostEqual(
+            unique_visitors_total(Story.objects.values('id'), yesterday, today), 250, delta=8
+        )
+        self.assertEqual(unique_visitors([self.story.id], today + timedelta(days=1), today + timedelta(days=7)), {})
+
+    def test_author_dashboard_shows_unique_readers(self):
+        self.author.profile.user_type = 'editor'
+        self.author.profile.save()
+        self.record_views(timezone.localdate(), [f"10.0.0.{n}" for n in range(1, 41)])
+
+        client = Client()
+        client.force_login(self.author)
+        response = client.get(reverse('story:my_stories'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_unique_visitors'], 40)
+        self.assertEqual(response.context['page_obj'][0].unique_visitors, 40)
+
+
+class ViewSeriesTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='x')
+        self.story = Story.objects.create(title='Derby day', content='...', author=self.author, status='published')
+
+    def add_views(self, day, count):
+        views = StoryView.objects.bulk_create([StoryView(story=self.story) for _ in range(count)])
+        # created_at is auto_now_add, so backdate after the insert
+        StoryView.objects.filter(id__in=[view.id for view in views]).update(
+            created_at=timezone.make_aware(datetime.combine(day, time(12)))
+        )
+
+    def test_counts_round_trip_through_the_binary_format(self):
+        counts = [0] * DAYS_PER_SERIES
+        counts[0], counts[30] = 7, 2 ** 32 - 1
+        self.assertEqual(len(pack_counts(counts)), 124)
+        self.assertEqual(unpack_counts(pack_counts(counts)), counts)
+        self.assertEqual(unpack_counts(None), [0] * DAYS_PER_SERIES)
+
+    def test_rollup_is_idempotent_and_spans_months(self):
+        self.add_views(date(2026, 1, 31), 3)
+        self.add_views(date(2026, 2, 1), 5)
+        self.add_views(date(2026, 2, 3), 1)
+
+        rollup_views(date(2026, 1, 1), date(2026, 2, 28))
+        rollup_views(date(2026, 2, 1), date(2026, 2, 28))
+
+        self.assertEqual(StoryViewSeries.objects.filter(story=self.story).count(), 2)
+        days = dict(daily_views([self.story.id], date(2026, 1, 30), date(2026, 2, 3))[str(self.story.id)])
+        self.assertEqual(days, {
+            date(2026, 1, 30): 0, date(2026, 1, 31): 3, date(2026, 2, 1): 5, date(2026, 2, 2): 0, date(2026, 2, 3): 1,
+        })
+        self.assertEqual(total_views([self.story.id], date(2026, 1, 1), date(2026, 12, 31)), {str(self.story.id): 9})
+
+    @override_settings(STORY_VIEW_RETENTION_DAYS=30)
+    def test_purge_rolls_up_before_deleting_in_batches(self):
+        today = timezone.localdate()
+        old_day = today - timedelta(days=45)
+        self.add_views(old_day, 7)
+        self.add_views(today - timedelta(days=5), 2)
+
+        self.assertEqual(purge_raw_views(batch_size=3), 7)
+
+        self.assertEqual(StoryView.objects.count(), 2)
+        self.assertEqual(total_views([self.story.id], old_day, old_day), {str(self.story.id): 7})
+
+        # A recount after the purge cannot shrink the stored day
+        rollup_views(old_day, old_day)
+        self.assertEqual(total_views([self.story.id], old_day, old_day), {str(self.story.id): 7})
+
+
+class StoryLikeTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='x')
+        self.reader = User.objects.create_user('reader', password='x')
+        self.stories = [
+            Story.objects.create(title=f'Story {n}', content='...', author=self.author, status='published')
+            for n in range(3)
+        ]
+        self.client.force_login(self.reader)
+
+    def like(self, story, action=None):
+        data = {'action': action} if action else {}
+        return self.client.post(reverse('story:like_story', args=[story.slug]), data).json()
+
+    def test_like_and_unlike_are_idempotent(self):
+        story = self.stories[0]
+        self.assertEqual(self.like(story, 'like'), {'status': 'success', 'action': 'liked', 'changed': True, 'likes_count': 1})
+        self.assertEqual(self.like(story, 'like')['changed'], False)
+        story.refresh_from_db()
+        self.assertEqual(story.likes_count, 1)
+
+        self.assertEqual(self.like(story, 'unlike')['likes_count'], 0)
+        response = self.like(story, 'unlike')
+        self.assertEqual((response['changed'], response['likes_count']), (False, 0))
+
+    def test_a_deactivated_like_is_revived_and_removed(self):
+        story = self.stories[0]
+        StoryLike.objects.create(story=story, user=self.reader, is_active=False)
+        self.assertEqual(self.like(story)['action'], 'liked')
+        story.refresh_from_db()
+        self.assertEqual(story.likes_count, 1)
+        self.assertTrue(StoryLike.objects.filter(story=story, user=self.reader).exists())
+
+        other = self.stories[1]
+        StoryLike.objects.create(story=other, user=self.reader, is_active=False)
+        response = self.like(other, 'unlike')
+        self.assertEqual((response['changed'], response['likes_count']), (False, 0))
+        self.assertFalse(StoryLike._base_manager.filter(story=other).exists())
+
+    def test_request_without_action_toggles(self):
+        story = self.stories[0]
+        self.assertEqual(self.like(story)['action'], 'liked')
+        self.assertEqual(self.like(story)['action'], 'unliked')
+        story.refresh_from_db()
+        self.assertEqual(story.likes_count, 0)
+
+    def test_liked_state_of_a_page_in_one_query(self):
+        self.like(self.stories[0], 'like')
+        self.like(self.stories[2], 'like')
+        ids = ','.join(str(story.id) for story in self.stories)
+
+        with self.assertNumQueries(3):  # session, user, likes
+            response = self.client.get(reverse('story:liked_stories'), {'ids': ids})
+
+        self.assertEqual(set(response.json()['liked']), {str(self.stories[0].id), str(self.stories[2].id)})
+        self.assertEqual(self.client.get(reverse('story:liked_stories'), {'ids': 'nope'}).status_code, 400)
+
+
+@override_settings(ANONYMOUS_PAGE_CACHE=False)
+class StorySearchTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='x')
+        self.in_title = Story.objects.create(
+            title='Haaland hat-trick', content='A quiet afternoon at the Etihad.', author=self.author, status='published'
+        )
+        self.in_content = Story.objects.create(
+            title='Matchday notes', content='Three points, and Haaland scored late.', author=self.author, status='published'
+        )
+        self.draft = Story.objects.create(title='Haaland exclusive', content='...', author=self.author, status='draft')
+
+    def ids(self, text, queryset=None):
+        return [story.id for story in search_stories(text, queryset)[:10]]
+
+    def test_title_matches_rank_first_and_drafts_are_left_out(self):
+        self.assertEqual(self.ids('haaland'), [self.in_title.id, self.in_content.id])
+        self.assertEqual(search_stories('haaland').count(), 2)
+        # Prefix match on the last word, scoped to the queryset
+        self.assertEqual(self.ids('haal', Story.objects.filter(title__startswith='Match')), [self.in_content.id])
+        self.assertEqual(self.ids('"*) OR ('), [])
+
+    def test_snippets_are_escaped_and_highlighted(self):
+        snippet = _highlight(f'<b>{MARK_START}Haaland{MARK_END}</b>')
+        self.assertEqual(snippet, '&lt;b&gt;<mark>Haaland</mark>&lt;/b&gt;')
+        self.assertIn('<mark>Haaland</mark>', search_stories('haaland')[0].search_snippet)
+
+    def test_index_follows_story_and_chapter_changes(self):
+        StoryChapter.objects.create(story=self.in_content, title='Second half', content='A penalty from Foden.', order=1)
+        self.assertEqual(self.ids('foden'), [self.in_content.id])
+
+        self.draft.status = 'published'
+        self.draft.save()
+        self.assertIn(self.draft.id, self.ids('exclusive'))
+
+        self.in_content.status = 'cancelled'
+        self.in_content.save()
+        self.assertEqual(self.ids('foden'), [])
+
+        self.in_title.delete()
+        self.assertEqual(rebuild_index(), 1)
+        self.assertEqual(self.ids('haaland'), [self.draft.id])
+
+    def test_backfill_leaves_out_inactive_chapters(self):
+        StoryChapter.objects.create(story=self.in_content, title='Second half', content='A penalty from Foden.', order=1)
+        StoryChapter.objects.create(
+            story=self.in_content, title='Cut', content='A booking for Rodri.', order=2, is_active=False
+        )
+        migration = import_module('apps.story.migrations.0007_story_search')
+        # The SQLite schema editor refuses to open inside the test's transaction;
+        # the migration only needs its connection and execute()
+        with connection.cursor() as cursor:
+            schema_editor = mock.Mock(connection=connection, execute=cursor.execute)
+            migration.drop_search_index(None, schema_editor)
+            migration.create_search_index(None, schema_editor)
+
+        self.assertEqual(self.ids('foden'), [self.in_content.id])
+        self.assertEqual(self.ids('rodri'), [])
+
+    def test_saves_that_change_no_indexed_field_leave_the_index_alone(self):
+        with mock.patch('apps.story.search.index_story') as index_story:
+            self.in_title.review_notes = 'Tighten the intro'
+            self.in_title.save()
+            index_story.assert_not_called()
+
+            self.in_title.title = 'Haaland hat-trick again'
+            self.in_title.save()
+            index_story.assert_called_once_with(self.in_title)
+
+    def test_story_list_pages_ranked_results(self):
+        for n in range(12):
+            Story.objects.create(title=f'Round {n}', content='Haaland again.', author=self.author, status='published')
+
+        response = self.client.get(reverse('story:story_list'), {'search': 'haaland'})
+        page = response.context['page_obj']
+        self.assertEqual(page.paginator.count, 14)
+        self.assertEqual(page[0], self.in_title)
+        self.assertContains(response, '<mark>Haaland</mark>')
+
+        response = self.client.get(reverse('story:story_list'), {'search': 'haaland', 'page': 2})
+        self.assertEqual(len(response.context['page_obj']), 4)
+
+
+@override_settings(ANONYMOUS_PAGE_CACHE=False)
+class StoryListPaginationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', password='x')
+        tags = [StoryTag.objects.create(name=name) for name in ('IPL', 'Premier')]
+        published = timezone.now()
+        self.stories = []
+        for n in range(25):
+            story = Story.objects.create(
+                title=f'Story {n}', content='Long body ' * 200, author=self.author, status='published',
+                published_at=published - timedelta(hours=n // 2)  # pairs share a time; ties go by id
+            )
+            story.tags.set(tags)
+            self.stories.append(story)
+        self.ordered = sorted(self.stories, key=lambda story: (story.published_at, story.id), reverse=True)
+
+    def test_cursors_walk_forward_and_back(self):
+        queryset = Story.objects.filter(status='published')
+        ordering = ('-published_at', '-id')
+        seen, cursor, pages = [], None, []
+        while True:
+            page = paginate_keyset(queryset, ordering, cursor, per_page=10)
+            pages.append(page)
+            seen += page
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, self.ordered)
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertFalse(pages[0].has_previous)
+
+        back = paginate_keyset(queryset, ordering, pages[2].previous_cursor, per_page=10)
+        self.assertEqual(list(back), list(pages[1]))
+        self.assertTrue(back.has_next and back.has_previous)
+        first = paginate_keyset(queryset, ordering, back.previous_cursor, per_page=10)
+        self.assertEqual(list(first), list(pages[0]))
+        self.assertFalse(first.has_previous)
+
+        with self.assertRaises(InvalidCursor):
+            paginate_keyset(queryset, ordering, 'not-a-cursor', per_page=10)
+
+    def test_list_queries_do_not_grow_with_the_page(self):
+        url = reverse('story:story_list')
+        # Page rows, then card data and tags for the cards not cached yet
+        with self.assertNumQueries(4):  # and the count
+            self.client.get(url)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        page = response.context['page_obj']
+        self.assertEqual(list(page), self.ordered[:10])
+        self.assertEqual(response.context['total_stories'], 25)
+        self.assertNotIn('content', page[0].__dict__)
+        self.assertContains(response, '?tag=IPL"', count=10)
+
+        with self.assertNumQueries(3):
+            response = self.client.get(url + '?' + response.context['next_page_query'])
+        self.assertEqual(list(response.context['page_obj']), self.ordered[10:20])
+
+        response = self.client.get(reverse('main:home'))
+        self.assertEqual(list(response.context['page_obj']), self.ordered[:6])
+        self.assertContains(response, '25 stories')
+
+
+@override_settings(ANONYMOUS_PAGE_CACHE=False)
+class StoryCardCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', password='x')
+        self.tag = StoryTag.objects.create(name='IPL')
+        self.story = Story.objects.create(title='Final over', content='...', author=self.author, status='published')
+        self.story.tags.add(self.tag)
+
+    def card(self):
+        response = self.client.get(reverse('story:story_list'))
+        return response, str(response.context['page_obj'][0].card_html)
+
+    def version(self):
+        return Story.objects.values_list('updated_at', flat=True).get(pk=self.story.pk)
+
+    def test_counters_are_live_and_do_not_touch_the_card(self):
+        self.card()
+        version = self.version()
+        Story.objects.filter(pk=self.story.pk).update(likes_count=41)
+        with self.assertNumQueries(1):
+            response, _ = self.card()
+        self.assertContains(response, '41')
+        self.assertEqual(self.version(), version)
+
+    def test_story_and_tag_changes_move_the_version(self):
+        _, html = self.card()
+        self.assertIn('IPL', html)
+
+        version = self.version()
+        self.tag.name = 'Indian Premier League'
+        self.tag.save()
+        self.assertGreater(self.version(), version)
+        _, html = self.card()
+        self.assertIn('Indian Premier League', html)
+
+        version = self.version()
+        self.story.tags.remove(self.tag)
+        self.assertGreater(self.version(), version)
+        _, html = self.card()
+        self.assertNotIn('Indian Premier League', html)
+
+        version = self.version()
+        self.story.title = 'Super over'
+        self.story.save(update_fields=['title'])
+        self.assertGreater(self.version(), version)
+        _, html = self.card()
+        self.assertIn('Super over', html)
+
+
+
+@override_settings(ANONYMOUS_PAGE_CACHE=False)
+class StoryDetailQueryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', password='x')
+        self.reader = User.objects.create_user('reader', password='x')
+        self.story = Story.objects.create(title='Cup final', content='...', author=self.author, status='published')
+        self.story.tags.add(StoryTag.objects.create(name='IPL', slug='ipl'))
+        StoryChapter.objects.create(story=self.story, title='Kick-off', content='...', order=1)
+
+    def add_comments(self, count):
+        start = Comment.objects.filter(parent=None).count()
+        for index in range(start, start + count):
+            author = User.objects.create_user(f'fan{index}', password='x')
+            parent = Comment.objects.create(story=self.story, author=author, text=f'Comment {index}')
+            Comment.objects.create(story=self.story, author=self.reader, text=f'Reply {index}', parent=parent)
+
+    def page_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.story.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_loader_stays_within_budget_and_builds_the_tree(self):
+        self.add_comments(3)
+        liked = Comment.objects.get(text='Reply 1')
+        CommentLike.objects.create(comment=liked, user=self.reader)
+        Comment.objects.filter(text='Comment 2').update(is_active=False)
+
+        with self.assertNumQueries(DETAIL_QUERY_BUDGET):
+            detail = load_story_detail(self.story.slug, self.reader)
+            self.assertEqual([tag.name for tag in detail.story.tag_list], ['IPL'])
+            self.assertEqual([chapter.title for chapter in detail.chapters], ['Kick-off'])
+            threads = [(c.text, c.author.username, [r.text for r in c.reply_list]) for c in detail.comments]
+
+        self.assertEqual(threads, [('Comment 0', 'fan0', ['Reply 0']), ('Comment 1', 'fan1', ['Reply 1'])])
+        self.assertEqual(detail.liked_comment_ids, {liked.id})
+        self.assertIsNone(detail.comments_cursor)
+        self.assertIsNone(load_story_detail('missing', self.reader))
+
+    def test_page_shows_the_first_comments_and_a_cursor_to_the_rest(self):
+        self.add_comments(3)
+
+        with mock.patch('apps.story.detail.COMMENTS_PER_PAGE', 3):
+            detail = load_story_detail(self.story.slug, self.reader)
+            response = self.client.get(self.story.get_absolute_url())
+        threads = [(c.text, [r.text for r in c.reply_list]) for c in detail.comments]
+        self.assertEqual(threads, [('Comment 0', ['Reply 0']), ('Comment 1', [])])
+        self.assertEqual(detail.comment_count, 6)
+        self.assertContains(response, f'data-cursor="{detail.comments_cursor}"')
+        self.assertNotContains(response, 'Comment 2')
+
+        rest = self.client.get(
+            reverse('comments:get_comments', args=[self.story.id]), {'cursor': detail.comments_cursor}
+        ).json()
+        self.assertEqual([comment['text'] for comment in rest['comments']], ['Reply 1', 'Comment 2', 'Reply 2'])
+
+    def test_page_costs_the_same_however_many_comments(self):
+        self.client.force_login(self.reader)
+        self.add_comments(1)
+        few = self.page_queries()
+        self.add_comments(50)
+        self.assertEqual(self.page_queries(), few)
+
+        self.client.logout()
+        self.assertLess(self.page_queries(), few)
+
+
+@override_settings(ANONYMOUS_PAGE_CACHE=True)
+class AnonymousPageCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', password='x')
+        self.story = Story.objects.create(title='Cup final', content='...', author=self.author, status='published')
+        self.other = Story.objects.create(title='Transfer news', content='...', author=self.author, status='published')
+
+    def get(self, url, **extra):
+        return self.client.get(url, HTTP_USER_AGENT=BROWSER, **extra)
+
+    def test_hits_skip_the_database_and_carry_no_csrf_token(self):
+        url = reverse('story:story_list')
+        first = self.get(url)
+        self.assertContains(first, 'name="csrfmiddlewaretoken" value="')
+
+        with self.assertNumQueries(0):
+            hit = self.get(url + '?utm_source=x')
+        self.assertEqual(hit.content, re.sub(rb'(csrfmiddlewaretoken" value=")[^"]*', rb'\1', first.content))
+        self.assertIn('csrftoken', hit.cookies)
+
+        with self.assertNumQueries(0):
+            gzipped = self.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(gzipped.content), hit.content)
+
+    def test_signed_in_readers_share_the_page_but_never_fill_it(self):
+        url = self.story.get_absolute_url()
+        self.client.force_login(self.author)
+        own = self.get(url)
+        self.assertEqual(own.context['story'], self.story)
+        self.assertContains(own, 'data-personal-text="username">author<')
+
+        self.client.logout()
+        self.assertNotContains(self.get(url), '>author</span>')
+        shared = self.get(url)
+        self.assertIsNone(shared.context)
+        self.assertContains(shared, 'data-personal-show="authenticated" hidden')
+
+        self.client.force_login(self.author)
+        hit = self.get(url)
+        self.assertIsNone(hit.context)
+        self.assertEqual(hit.content, shared.content)
+        self.assertIn('signed_in', self.client.cookies)
+
+    def test_personal_endpoint_fills_the_holes(self):
+        reader = User.objects.create_user('reader', password='x')
+        comment = Comment.objects.create(story=self.story, author=reader, text='Great read')
+        StoryLike.objects.create(story=self.story, user=reader)
+        url = reverse('main:personal')
+        params = {'stories': f'{self.story.id},{self.other.id}', 'comments': str(comment.id)}
+
+        self.assertEqual(self.client.get(url, params).json(), {'authenticated': False})
+
+        self.client.force_login(reader)
+        response = self.client.get(url, params)
+        self.assertIn('no-store', response['Cache-Control'])
+        self.assertEqual(response.json(), {
+            'authenticated': True, 'id': reader.id, 'username': 'reader', 'is_editor': False,
+            'is_chief_editor': False, 'liked_stories': [str(self.story.id)], 'liked_comments': [],
+        })
+        self.assertEqual(self.client.get(url, {'stories': 'nope'}).status_code, 400)
+
+    def test_changes_invalidate_only_the_pages_showing_them(self):
+        list_url, story_url, other_url = (
+            reverse('story:story_list'), self.story.get_absolute_url(), self.other.get_absolute_url()
+        )
+        for url in (list_url, story_url, other_url):
+            self.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(story=self.story, author=self.author, text='What a game')
+        self.assertContains(self.get(story_url), 'What a game')
+        with self.assertNumQueries(0):
+            self.get(list_url)
+            self.get(other_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.title = 'Deadline day'
+            self.other.save()
+        self.assertContains(self.get(list_url), 'Deadline day')
+        self.assertContains(self.get(other_url), 'Deadline day')
+
+    def test_hits_still_count_views(self):
+        url = self.story.get_absolute_url()
+        self.get(url, REMOTE_ADDR='10.0.0.1')
+        self.get(url, REMOTE_ADDR='10.0.0.2')
+        view_counter.flush()
+        self.story.refresh_from_db()
+        self.assertEqual(self.story.views_count, 2)
+
+    def test_concurrent_misses_get_the_previous_rendering(self):
+        url = reverse('story:story_list')
+        self.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Story.objects.create(title='Late winner', content='...', author=self.author, status='published')
+
+        # Another request is rendering the new page
+        request = RequestFactory().get(url)
+        url_hash = hashlib.md5(normalized_url(request).encode()).hexdigest()
+        cache.set(LOCK_KEY.format(url_hash), 1)
+        with self.assertNumQueries(0):
+            response = self.get(url)
+        self.assertNotContains(response, 'Late winner')
+
+        cache.delete(LOCK_KEY.format(url_hash))
+        self.assertContains(self.get(url), 'Late winner')
+
+    def test_a_miss_that_waited_in_vain_leaves_the_lock_alone(self):
+        url = reverse('story:story_list')
+        request = RequestFactory().get(url)
+        url_hash = hashlib.md5(normalized_url(request).encode()).hexdigest()
+        cache.set(LOCK_KEY.format(url_hash), 1)
+
+        async def aget():
+            return await self.async_client.get(url, HTTP_USER_AGENT=BROWSER)
+
+        with mock.patch('apps.utils.page_cache.LOCK_WAIT', 0.1):
+            self.assertEqual(self.get(url).status_code, 200)
+            self.assertEqual(async_to_sync(aget)().status_code, 200)
+        self.assertEqual(cache.get(LOCK_KEY.format(url_hash)), 1)
+
+    def test_per_process_caches_are_flagged_outside_of_debug(self):
+        with override_settings(DEBUG=False):
+            self.assertEqual([warning.id for warning in check_shared_cache(None)], ['utils.W001'])
+            with override_settings(ANONYMOUS_PAGE_CACHE=False):
+                self.assertEqual(check_shared_cache(None), [])
+            with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost:6379/1'
+            }}):
+                self.assertEqual(check_shared_cache(None), [])
+        with override_settings(DEBUG=True):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class LiveStoryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', password='x')
+        self.story = Story.objects.create(title='Cup final', content='...', author=self.author, status='published')
+        patcher = mock.patch.object(live, 'broker', Broadcaster(poll_interval=0.01))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def socket(self, query, count=0, during=None, on_send=None):
+        """Connect, run during() once subscribed, and collect `count` messages"""
+        inbox = asyncio.Queue()
+        inbox.put_nowait({'type': 'websocket.connect'})
+        sent = []
+
+        async def send(message):
+            if on_send is not None:
+                await on_send(message)
+            sent.append(message)
+            if sum(m['type'] == 'websocket.send' for m in sent) >= count:
+                inbox.put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+
+        scope = {'type': 'websocket', 'path': '/ws/stories/', 'query_string': query.encode()}
+        task = asyncio.create_task(live.story_socket_application(scope, inbox.get, send))
+        await asyncio.sleep(0.05)
+        if during is not None:
+            await sync_to_async(during)()
+        await asyncio.wait_for(task, timeout=2)
+        return sent
+
+    def test_comments_and_likes_reach_subscribers_after_commit(self):
+        reader = User.objects.create_user('reader', password='x')
+
+        def engage():
+            self.client.force_login(reader)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('comments:add_comment'), {'story_slug': self.story.slug, 'text': 'Goal!'})
+            comment = Comment.objects.get()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('story:like_story', args=[self.story.slug]), {'action': 'like'})
+                self.client.post(reverse('comments:like_comment', args=[comment.id]), {'action': 'like'})
+                # Repeats change nothing and publish nothing
+                self.client.post(reverse('story:like_story', args=[self.story.slug]), {'action': 'like'})
+
+        sent = async_to_sync(self.socket)(f'story={self.story.id}', count=3, during=engage)
+
+        self.assertEqual(sent[0]['type'], 'websocket.accept')
+        messages = [json.loads(message['text']) for message in sent[1:]]
+        self.assertEqual([message['id'] for message in messages], [1, 2, 3])
+        comment, story_likes, comment_likes = (message['event'] for message in messages)
+        self.assertEqual((comment['type'], comment['text'], comment['author'], comment['depth']), ('comment', 'Goal!', 'reader', 0))
+        self.assertEqual(story_likes, {'type': 'story_likes', 'likes_count': 1})
+        self.assertEqual(comment_likes, {'type': 'comment_likes', 'id': comment['id'], 'likes_count': 1})
+
+    def test_reconnecting_clients_resume_after_their_last_event(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for count in range(1, 4):
+                self.story.likes_count = count
+                live.publish_story_likes(self.story)
+
+        sent = async_to_sync(self.socket)(f'story={self.story.id}&last_event_id=1', count=2)
+
+        self.assertEqual([json.loads(m['text'])['event']['likes_count'] for m in sent[1:]], [2, 3])
+
+    def test_events_arriving_during_a_send_are_not_lost(self):
+        backend = CacheLogBackend()
+        channel = live.story_channel(self.story.id)
+        backend.append(channel, ['{"type":"story_likes","likes_count":1}'])
+
+        async def slow_send(message):
+            if message['type'] == 'websocket.send' and '"likes_count":1' in message['text']:
+                backend.append(channel, ['{"type":"story_likes","likes_count":2}'])
+                # The poller buffers it while this send is still going on
+                await asyncio.sleep(0.05)
+
+        sent = async_to_sync(self.socket)(f'story={self.story.id}&last_event_id=0', count=2, on_send=slow_send)
+
+        self.assertEqual([json.loads(m['text'])['event']['likes_count'] for m in sent[1:]], [1, 2])
+
+    def test_waits_started_before_a_notify_see_it(self):
+        async def notified_before_first_step():
+            channel = Channel(buffer_size=1)
+            waiting = asyncio.create_task(channel.wait(timeout=0.5))
+            channel.notify()
+            return await waiting
+
+        self.assertTrue(async_to_sync(notified_before_first_step)())
+
+    def test_unknown_and_unpublished_stories_are_refused(self):
+        draft = Story.objects.create(title='Draft', content='...', author=self.author)
+        for query in ('story=nope', f'story={draft.id}', ''):
+            sent = async_to_sync(self.socket)(query)
+            self.assertEqual(sent, [{'type': 'websocket.close', 'code': live.CLOSE_UNKNOWN_STORY}])
+
+
+@override_settings(ANONYMOUS_PAGE_CACHE=False)
+class AsyncReadViewTests(TestCase):
+
+    def setUp(self):
+        self.enterContext(routed_read_views(True))
+        cache.clear()
+        self.author = User.objects.create_user('author', password='x')
+        self.reader = User.objects.create_user('reader', password='x')
+        self.story = Story.objects.create(title='Cup final', content='...', author=self.author, status='published')
+        self.draft = Story.objects.create(title='Draft', content='...', author=self.author)
+        self.comment = Comment.objects.create(story=self.story, author=self.author, text='What a game')
+        StoryLike.objects.create(story=self.story, user=self.reader)
+
+    async def test_read_views_serve_signed_in_readers_on_the_asgi_stack(self):
+        await sync_to_async(self.async_client.force_login)(self.reader)
+        for url in (reverse('main:home'), reverse('story:story_list'), reverse('rss_feeds:feed_list')):
+            response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertEqual(response.context['user'], self.reader)
+
+        response = await self.async_client.get(reverse('story:story_list'))
+        self.assertEqual(response.context['liked_story_ids'], {self.story.id})
+        response = await self.async_client.get(self.story.get_absolute_url())
+        self.assertTrue(response.context['user_liked'])
+        self.assertContains(response, 'What a game')
+        response = await self.async_client.get(reverse('story:story_list'), {'q': 'final'})
+        self.assertEqual([story.title for story in response.context['stories']], ['Cup final'])
+
+    async def test_json_views_and_refusals(self):
+        response = await self.async_client.get(reverse('comments:get_comments', args=[self.story.id]))
+        self.assertEqual([comment['text'] for comment in response.json()['comments']], ['What a game'])
+        response = await self.async_client.get(
+            reverse('comments:get_comments', args=[self.story.id]), {'root': self.draft.id}
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual((await self.async_client.get(reverse('rss_feeds:feed_api'))).json()['total'], 0)
+
+        response = await self.async_client.get(self.draft.get_absolute_url())
+        self.assertRedirects(response, reverse('story:story_list'), fetch_redirect_response=False)
+        response = await self.async_client.get(reverse('story:story_detail', args=['missing']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_routed_read_views_switches_the_urls_between_implementations(self):
+        self.assertIs(resolve(reverse('story:story_list')).func, astory_list)
+        self.assertIs(resolve(reverse('comments:get_comments', args=[self.story.id])).func, aget_comments)
+        with routed_read_views(False):
+            self.assertIs(resolve(reverse('story:story_list')).func, story_list)
+            self.assertIs(resolve(reverse('comments:get_comments', args=[self.story.id])).func, get_comments)
+            response = self.client.get(reverse('comments:get_comments', args=[self.story.id]), {'root': self.draft.id})
+            self.assertEqual(response.status_code, 404)
+        self.assertIs(resolve(reverse('story:story_list')).func, astory_list)
@@ -1,14 +1,35 @@
 """===== Imports ====="""
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.db.models import Q
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Count, Q
 from django.utils import timezone
+from datetime import timedelta
+from asgiref.sync import sync_to_async
 import json
-from .models import Story, StoryChapter, StoryLike, StoryView, StoryTag
+from .models import Story, StoryChapter, StoryLike, StoryTag, story_cards
+from .cards import aattach_cards, aload_cards, attach_cards, card_page_queryset, load_cards
+from .detail import aload_story_detail, load_story_detail
+from .live import publish_story_likes
+from .counters import unique_visitors, unique_visitors_total, view_counter
+from .search import search_stories
+from apps.utils.likes import aliked_ids, liked_ids, requested_like, set_like
+from apps.utils.page_cache import anonymous_page_cache
+from apps.utils.pagination import (
+    InvalidCursor, acached_count, apaginate_keyset, cached_count, page_query, paginate_keyset
+)
+from apps.utils.users import auser
+from apps.utils.throttle import throttle
 from django.utils.text import slugify
 
+# Window of the unique-reader figures on the author dashboard
+UNIQUE_VISITOR_DAYS = 30
+STORIES_PER_PAGE = 10
+MY_STORIES_PER_PAGE = 20
+
 """===== Editor Checks ====="""
 def is_editor(user):
     """Check if user is an editor or chief editor"""
@@ -18,75 +39,160 @@ def is_chief_editor(user):
     """Check if user is a chief editor"""
     return user.is_authenticated and user.profile.is_chief_editor
 
+"""===== Keyset Pages ====="""
+def keyset_page(request, queryset, ordering, per_page):
+    """Page of queryset at the request's cursor; a stale or mangled cursor gives the first page"""
+    try:
+        return paginate_keyset(queryset, ordering, request.GET.get('cursor'), per_page)
+    except InvalidCursor:
+        return paginate_keyset(queryset, ordering, None, per_page)
+
+
+async def akeyset_page(request, queryset, ordering, per_page):
+    """keyset_page for async views"""
+    try:
+        return await apaginate_keyset(queryset, ordering, request.GET.get('cursor'), per_page)
+    except InvalidCursor:
+        return await apaginate_keyset(queryset, ordering, None, per_page)
+
+
+def search_page(request, stories, search_text):
+    """Page of ranked search results with their cards, which vary with the query"""
+    page_obj = Paginator(search_stories(search_text, story_cards(stories)), STORIES_PER_PAGE).get_page(request.GET.get('page'))
+    attach_cards(page_obj, 'list', cached=False)
+    return page_obj, page_obj.paginator.count
+
 """===== Story List (All Stories) ====="""
-def story_list(request):
-    """Display list of published stories with search and tag filters"""
-    stories = Story.objects.filter(status='published').select_related('author')
-
-    query = request.GET.get('q', '')
-    title_keyword = request.GET.get('title', '')
-    search_query = request.GET.get('search', '')
-    tag_query = request.GET.get('tag', '')
-
-    # Search filter
-    if query:
-        stories = stories.filter(
-            Q(title__icontains=query) |
-            Q(summary__icontains=query) |
-            Q(author__username__icontains=query)
-        )
-    elif search_query:
-        stories = stories.filter(title__icontains=search_query)
-        tag_query = search_query
-
-    if tag_query and tag_query.lower() != "all":
-        stories = stories.filter(title__icontains=tag_query)
-        search_query = tag_query
-
-    if title_keyword:
-        stories = stories.filter(title__icontains=title_keyword)
+STORY_ORDERING = ('-published_at', '-id')
 
-    context = {
-        'stories': stories,
-        'query': query,
-        'title_keyword': title_keyword,
-        'search_query': search_query,
-        'tag_query': tag_query,
+
+def story_list_filters(request):
+    """Published stories left by the request's filters, the filters, and the search text"""
+    stories = Story.objects.filter(status='published')
+
+    filters = {
+        'query': request.GET.get('q', ''),
+        'title_keyword': request.GET.get('title', ''),
+        'search_query': request.GET.get('search', ''),
+        'tag_query': request.GET.get('tag', ''),
+    }
+
+    if filters['tag_query'] and filters['tag_query'].lower() != "all":
+        stories = stories.filter(title__icontains=filters['tag_query'])
+
+    if filters['title_keyword']:
+        stories = stories.filter(title__icontains=filters['title_keyword'])
+
+    return stories, filters, (filters['query'] or filters['search_query']).strip()
+
+
+def story_list_context(request, page_obj, total, liked_story_ids, filters, search_text, cursors):
+    """Template context of story_list and astory_list"""
+    if cursors:
+        previous_query = page_obj.has_previous and page_query(request, cursor=page_obj.previous_cursor)
+        next_query = page_obj.has_next and page_query(request, cursor=page_obj.next_cursor)
+    else:
+        previous_query = page_obj.has_previous() and page_query(request, page=page_obj.previous_page_number())
+        next_query = page_obj.has_next() and page_query(request, page=page_obj.next_page_number())
+    return {
+        'stories': page_obj,
+        'page_obj': page_obj,
+        'total_stories': total,
+        'previous_page_query': previous_query,
+        'next_page_query': next_query,
+        'liked_story_ids': liked_story_ids,
+        **filters,
+        'search_text': search_text,
         'tags': ["All", "Captures", "IPL", "Premier", "Super League"]
     }
+
+
+@anonymous_page_cache('stories', personalized=True)
+def story_list(request):
+    """Display list of published stories with ranked search and tag filters"""
+    stories, filters, search_text = story_list_filters(request)
+    if search_text:
+        # Full-text search, best matches first with highlighted snippets;
+        # ranked results page by number
+        page_obj, total = search_page(request, stories, search_text)
+    else:
+        page_obj = keyset_page(request, card_page_queryset(stories), STORY_ORDERING, STORIES_PER_PAGE)
+        attach_cards(page_obj, 'list', load_cards)
+        total = cached_count(stories)
+
+    liked = liked_ids(StoryLike, Story, request.user, [story.id for story in page_obj])
+    context = story_list_context(request, page_obj, total, liked, filters, search_text, cursors=not search_text)
+    return render(request, 'story/story_list.html', context)
+
+
+@anonymous_page_cache('stories', personalized=True)
+async def astory_list(request):
+    """story_list for the ASGI stack, see settings.ASYNC_READ_VIEWS"""
+    stories, filters, search_text = story_list_filters(request)
+    if search_text:
+        # Ranked search stays sync, in one trip to a worker thread
+        page_obj, total = await sync_to_async(search_page)(request, stories, search_text)
+    else:
+        page_obj = await akeyset_page(request, card_page_queryset(stories), STORY_ORDERING, STORIES_PER_PAGE)
+        await aattach_cards(page_obj, 'list', aload_cards)
+        total = await acached_count(stories)
+
+    user = await auser(request)
+    liked = await aliked_ids(StoryLike, Story, user, [story.id for story in page_obj])
+    context = story_list_context(request, page_obj, total, liked, filters, search_text, cursors=not search_text)
     return render(request, 'story/story_list.html', context)
 
 """===== Story Detail ====="""
+def count_cached_view(request, meta):
+    """Views served from the page cache still count"""
+    view_counter.record_id(request, meta['story_id'])
+
+@anonymous_page_cache('story:{slug}', on_hit=count_cached_view, personalized=True)
 def story_detail(request, slug):
     """Display single story with view tracking and like status"""
-    story = get_object_or_404(Story, slug=slug)
+    detail = load_story_detail(slug, request.user)
+    if detail is None:
+        raise Http404('No story matches the given query.')
 
-    if not story.can_view(request.user):
+    if not detail.story.can_view(request.user):
         messages.error(request, 'You do not have permission to view this story.')
         return redirect('story:story_list')
 
-    # Track view
-    StoryView.objects.create(
-        story=story,
-        user=request.user if request.user.is_authenticated else None,
-        ip_address=request.META.get('REMOTE_ADDR')
-    )
+    # Track view; buffered and written in bulk by the flush_view_counts task
+    view_counter.record(request, detail.story)
+    return render_story_detail(request, detail)
 
-    # Update view count
-    story.views_count = StoryView.objects.filter(story=story).count()
-    story.save(update_fields=['views_count'])
 
-    # Check if user liked the story
-    user_liked = False
-    if request.user.is_authenticated:
-        user_liked = story.story_likes.filter(user=request.user).exists()
+@anonymous_page_cache('story:{slug}', on_hit=count_cached_view, personalized=True)
+async def astory_detail(request, slug):
+    """story_detail for the ASGI stack, see settings.ASYNC_READ_VIEWS"""
+    user = await auser(request)
+    detail = await aload_story_detail(slug, user)
+    if detail is None:
+        raise Http404('No story matches the given query.')
 
+    if not detail.story.can_view(user):
+        messages.error(request, 'You do not have permission to view this story.')
+        return redirect('story:story_list')
+
+    await sync_to_async(view_counter.record)(request, detail.story)
+    return render_story_detail(request, detail)
+
+
+def render_story_detail(request, detail):
+    """Story page of a loaded StoryDetail"""
     context = {
-        'story': story,
-        'user_liked': user_liked,
-        'chapters': story.chapters.all(),
+        'story': detail.story,
+        'user_liked': detail.user_liked,
+        'liked_comment_ids': detail.liked_comment_ids,
+        'chapters': detail.chapters,
+        'comments': detail.comments,
+        'comment_count': detail.comment_count,
+        'comments_cursor': detail.comments_cursor,
     }
-    return render(request, 'story/story_detail.html', context)
+    response = render(request, 'story/story_detail.html', context)
+    response.page_cache_meta = {'story_id': str(detail.story.id)}
+    return response
 
 """===== Story Create ====="""
 @login_required
@@ -233,30 +339,69 @@ def story_delete(request, slug):
 
 """===== Like/Unlike Story ====="""
 @login_required
+@throttle('likes', '60/m')
 def like_story(request, slug):
     """Like or unlike a story"""
     story = get_object_or_404(Story, slug=slug)
 
     if request.method == 'POST':
-        like, created = StoryLike.objects.get_or_create(story=story, user=request.user)
-        action = 'liked' if created else 'unliked'
-        if not created:
-            like.delete()
-
-        story.likes_count = StoryLike.objects.filter(story=story).count()
-        story.save(update_fields=['likes_count'])
-
-        return JsonResponse({'status': 'success', 'action': action, 'likes_count': story.likes_count})
+        try:
+            liked = requested_like(request, lambda: StoryLike.objects.filter(story=story, user=request.user).exists())
+        except ValueError as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+        # Idempotent: liking twice, or unliking what is not liked, changes nothing
+        changed, likes_count = set_like(StoryLike, story, request.user, liked)
+        if changed:
+            publish_story_likes(story)
+        return JsonResponse({
+            'status': 'success',
+            'action': 'liked' if liked else 'unliked',
+            'changed': changed,
+            'likes_count': likes_count,
+        })
 
     return JsonResponse({'status': 'error', 'message': 'Only POST method allowed'}, status=405)
 
+"""===== Liked Stories ====="""
+def liked_stories(request):
+    """Which of the stories in ?ids=a,b,c the user likes, in one query"""
+    ids = [story_id for story_id in request.GET.get('ids', '').split(',') if story_id][:100]
+    try:
+        liked = liked_ids(StoryLike, Story, request.user, ids)
+    except ValidationError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid story id'}, status=400)
+    return JsonResponse({'status': 'success', 'liked': sorted(str(story_id) for story_id in liked)})
+
 """===== My Stories ====="""
 @login_required
 @user_passes_test(is_editor)
 def my_stories(request):
     """Display stories created by the logged-in editor"""
-    stories = Story.objects.filter(author=request.user).order_by('-created_at')
-    context = {'stories': stories}
+    stories = Story.objects.filter(author=request.user)
+    page_obj = keyset_page(
+        request,
+        card_page_queryset(stories).annotate(chapter_count=Count('chapters', filter=Q(chapters__is_active=True))),
+        ('-created_at', '-id'),
+        MY_STORIES_PER_PAGE
+    )
+    attach_cards(page_obj, 'my_stories', load_cards)
+
+    # Unique readers over the last 30 days, estimated from the daily visitor sketches
+    end = timezone.localdate()
+    start = end - timedelta(days=UNIQUE_VISITOR_DAYS - 1)
+    visitors = unique_visitors([story.id for story in page_obj], start, end)
+    for story in page_obj:
+        story.unique_visitors = visitors.get(str(story.id), 0)
+
+    context = {
+        'page_obj': page_obj,
+        'total_stories': cached_count(stories),
+        'previous_page_query': page_obj.has_previous and page_query(request, cursor=page_obj.previous_cursor),
+        'next_page_query': page_obj.has_next and page_query(request, cursor=page_obj.next_cursor),
+        'unique_visitor_days': UNIQUE_VISITOR_DAYS,
+        'total_unique_visitors': unique_visitors_total(stories.values('id'), start, end),
+    }
     return render(request, 'story/my_stories.html', context)
 
 """===== Submit Story for Review ====="""
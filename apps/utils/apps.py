@@ -4,3 +4,6 @@ class UtilsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.utils'
 
+    def ready(self):
+        # Registers the page cache's system check
+        from . import page_cache  # noqa: F401
@@ -0,0 +1,218 @@
+"""
+Fan-out of events to long-lived connections.
+
+Publishers, whether web processes once their transaction commits or Celery
+workers, append compact JSON events to a named channel ('rss:items',
+'story:<id>', ...) through the broadcast backend. Each ASGI process runs a
+Broadcaster that tails only the channels its connections subscribe to. Events
+go into a bounded in-memory ring buffer per channel, and the connections
+waiting on that channel are woken. An idle connection costs one coroutine and
+no I/O, and each poll is two backend round trips at most, however many
+channels and connections the process serves. Clients resume from the last
+sequence number they saw, with whatever the buffer still holds.
+
+settings.BROADCAST_BACKEND is the dotted path of the backend class. The
+default, CacheLogBackend, keeps a numbered log per channel in the shared
+cache. Another transport only needs its append, last_ids and fetch methods.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# How long published events stay in the cache log
+EVENT_TIMEOUT = 3600
+# A sequence number with no event after this long was lost by its publisher
+MISSING_GRACE = 5.0
+
+
+class CacheLogBackend:
+    """Numbered per-channel event logs in the default cache"""
+
+    SEQUENCE_KEY = 'broadcast:{}:seq'
+    EVENT_KEY = 'broadcast:{}:{}'
+
+    def append(self, channel: str, events: List[str]) -> int:
+        """
+        Append serialized events to the channel's log
+
+        Returns:
+            Sequence number of the last event
+        """
+        sequence_key = self.SEQUENCE_KEY.format(channel)
+        cache.add(sequence_key, 0, timeout=None)
+        last = cache.incr(sequence_key, len(events))
+        first = last - len(events) + 1
+        cache.set_many(
+            {self.EVENT_KEY.format(channel, seq): data for seq, data in enumerate(events, start=first)},
+            timeout=EVENT_TIMEOUT
+        )
+        return last
+
+    async def last_ids(self, channels: Iterable[str]) -> Dict[str, int]:
+        """Sequence number of the last event of each channel, in one round trip"""
+        keys = {self.SEQUENCE_KEY.format(channel): channel for channel in channels}
+        found = await cache.aget_many(list(keys))
+        return {channel: found.get(key) or 0 for key, channel in keys.items()}
+
+    async def fetch(self, wanted: Dict[str, range]) -> Dict[Tuple[str, int], str]:
+        """Events by (channel, sequence number), in one round trip; those not written yet are left out"""
+        keys = {
+            self.EVENT_KEY.format(channel, seq): (channel, seq)
+            for channel, seqs in wanted.items() for seq in seqs
+        }
+        found = await cache.aget_many(list(keys))
+        return {keys[key]: data for key, data in found.items()}
+
+
+def get_backend():
+    return import_string(getattr(settings, 'BROADCAST_BACKEND', 'apps.utils.broadcast.CacheLogBackend'))()
+
+
+def publish(channel: str, events: Iterable[dict]) -> None:
+    """Publish events to the channel once the surrounding transaction commits"""
+    serialized = [json.dumps(event, separators=(',', ':')) for event in events]
+    if serialized:
+        transaction.on_commit(lambda: get_backend().append(channel, serialized))
+
+
+class Channel:
+    """Buffered tail of one channel, shared by every connection subscribed to it"""
+
+    def __init__(self, buffer_size: int):
+        self.buffer = deque(maxlen=buffer_size)
+        self.cursor = None
+        self.listeners = 0
+        self.missing_since = None
+        self._changed = asyncio.Event()
+
+    @property
+    def last_id(self) -> int:
+        return self.cursor or 0
+
+    def since(self, last_id: int) -> List[Tuple[int, str]]:
+        """Buffered events after last_id (all of them if last_id fell out of the buffer)"""
+        return [(seq, data) for seq, data in self.buffer if seq > last_id]
+
+    def wait(self, timeout: Optional[float] = None) -> Awaitable[bool]:
+        """
+        Wait until new events arrive; False on timeout
+
+        The wait covers every notify() from this call on, even one made before
+        the result is first awaited (as when it is wrapped in a task).
+        """
+        return self._wait(self._changed, timeout)
+
+    @staticmethod
+    async def _wait(changed: asyncio.Event, timeout: Optional[float]) -> bool:
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def notify(self):
+        # Wake everyone waiting on the old event, then arm a new one
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+
+class Broadcaster:
+    """Per-process tail of the channels open connections subscribe to"""
+
+    def __init__(self, backend=None, buffer_size: Optional[int] = None, poll_interval: Optional[float] = None):
+        self._backend = backend
+        self.buffer_size = buffer_size or getattr(settings, 'BROADCAST_BUFFER_SIZE', 100)
+        self.poll_interval = poll_interval or getattr(settings, 'BROADCAST_POLL_INTERVAL', 0.5)
+        self.channels: Dict[str, Channel] = {}
+        self._poller = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = get_backend()
+        return self._backend
+
+    async def subscribe(self, name: str) -> Channel:
+        """Register a connection on the channel, catching it up first if it is its first"""
+        channel = self.channels.get(name)
+        if channel is None:
+            channel = self.channels[name] = Channel(self.buffer_size)
+        channel.listeners += 1
+        if channel.cursor is None:
+            try:
+                # Catch up before the connection picks its starting point
+                await self.poll([name])
+            except Exception as e:
+                logger.error(f"Error polling broadcast channel {name}: {e}")
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.create_task(self._run())
+        return channel
+
+    def unsubscribe(self, name: str):
+        channel = self.channels[name]
+        channel.listeners -= 1
+        if channel.listeners <= 0:
+            # Nobody left to serve; a later subscriber backfills from the log
+            del self.channels[name]
+
+    async def poll(self, names: Optional[Iterable[str]] = None):
+        """Move new events of the channels (all subscribed ones by default) into their buffers"""
+        names = list(self.channels) if names is None else names
+        channels = {name: self.channels[name] for name in names if name in self.channels}
+        if not channels:
+            return
+        last_ids = await self.backend.last_ids(channels)
+
+        wanted = {}
+        for name, channel in channels.items():
+            last = last_ids[name]
+            if channel.cursor is None or last < channel.cursor:
+                # First poll, or the log was flushed: backfill what fits in the buffer
+                channel.cursor = max(0, last - channel.buffer.maxlen)
+                channel.buffer.clear()
+            if last > channel.cursor:
+                wanted[name] = range(channel.cursor + 1, min(last, channel.cursor + channel.buffer.maxlen) + 1)
+        if not wanted:
+            return
+
+        found = await self.backend.fetch(wanted)
+        for name, seqs in wanted.items():
+            self._take(name, channels[name], seqs, found)
+
+    def _take(self, name: str, channel: Channel, seqs: range, found: Dict):
+        added = False
+        for seq in seqs:
+            data = found.get((name, seq))
+            if data is None:
+                # Sequence taken but event not written yet; give the publisher a moment
+                now = time.monotonic()
+                channel.missing_since = channel.missing_since or now
+                if now - channel.missing_since < MISSING_GRACE:
+                    break
+                logger.warning(f"Skipping lost event {seq} of {name}")
+            else:
+                channel.buffer.append((seq, data))
+                added = True
+            channel.missing_since = None
+            channel.cursor = seq
+        if added:
+            channel.notify()
+
+    async def _run(self):
+        """Poll while anyone is listening"""
+        while self.channels:
+            try:
+                await self.poll()
+            except Exception as e:
+                logger.error(f"Error polling broadcast channels: {e}")
+            await asyncio.sleep(self.poll_interval)
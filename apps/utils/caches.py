@@ -0,0 +1,15 @@
+"""
+What the configured caches can be relied on for.
+"""
+from django.conf import settings
+
+# Backends whose entries live in the memory of one process
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_shared_cache(alias: str = 'default') -> bool:
+    """Whether every web and Celery process sees the same entries in the cache"""
+    return settings.CACHES[alias]['BACKEND'] not in PROCESS_LOCAL_BACKENDS
@@ -0,0 +1,51 @@
+"""
+Repair of denormalized counters.
+
+Counters such as Story.comments_count or Comment.likes_count are kept with
+F() updates as rows come and go, which cannot drift under concurrency but can
+after raw SQL, restored backups or bugs. reconcile_counter recounts them in
+batches along the primary key: one query finds the rows of a batch whose
+counter is off, and one update recounts just those, in the database, so
+increments landing meanwhile are not lost.
+"""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+RECONCILE_BATCH_SIZE = 1000
+
+
+def count_of(queryset, field: str):
+    """Expression counting the rows of queryset whose field points at the outer row"""
+    counted = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(counted), 0)
+
+
+def reconcile_counter(model, counter: str, actual, batch_size: int = RECONCILE_BATCH_SIZE) -> int:
+    """
+    Set counter to actual wherever they differ
+
+    Args:
+        model: Model with the counter field; inactive rows are repaired too
+        counter: Name of the counter field
+        actual: Expression of the true count for a row, e.g. from count_of
+
+    Returns:
+        Number of rows repaired
+    """
+    rows = model._base_manager.order_by('pk')
+    repaired = 0
+    last = None
+    while True:
+        batch = rows.filter(pk__gt=last) if last is not None else rows
+        ids = list(batch.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return repaired
+        last = ids[-1]
+        drifted = list(
+            model._base_manager.filter(pk__in=ids)
+            .annotate(actual_count=actual)
+            .exclude(**{counter: F('actual_count')})
+            .values_list('pk', flat=True)
+        )
+        if drifted:
+            repaired += model._base_manager.filter(pk__in=drifted).update(**{counter: actual})
@@ -0,0 +1,104 @@
+"""
+Like bookkeeping shared by stories and comments.
+
+A like is a row in a (target, user) unique table plus a likes_count column on
+the target. Setting or clearing a like touches the counter only when the row
+was actually created or deleted, with an F() update, so concurrent and
+repeated requests can neither double count nor drive the count below zero.
+"""
+import json
+from typing import Iterable, Optional, Set, Tuple
+
+from django.db import transaction
+from django.db.models import F, QuerySet
+
+
+def set_like(like_model, target, user, liked: bool) -> Tuple[bool, int]:
+    """
+    Make user like (or stop liking) target; repeating the call changes nothing
+
+    Args:
+        like_model: Like model with a `user` foreign key and one to the target's model
+        target: Story, comment, ... with a likes_count field
+        liked: Whether the user should like target afterwards
+
+    Returns:
+        Tuple of (changed, likes_count)
+    """
+    field = _target_field(like_model, target)
+    counted = type(target)._base_manager.filter(pk=target.pk)
+    # Deactivated likes still hold the (target, user) row but do not count
+    likes = like_model._base_manager.filter(**{field: target}, user=user)
+    with transaction.atomic():
+        if liked:
+            # get_or_create falls back to a get when a concurrent request inserted first
+            _, changed = like_model._base_manager.get_or_create(**{field: target}, user=user)
+            if not changed:
+                # Of two concurrent reactivations only one finds the row inactive
+                changed = likes.filter(is_active=False).update(is_active=True) > 0
+        else:
+            # Of two concurrent deletes only one sees the row
+            changed = likes.filter(is_active=True).delete()[0] > 0
+            likes.delete()
+        if changed:
+            counted.update(likes_count=F('likes_count') + (1 if liked else -1))
+        likes_count = counted.values_list('likes_count', flat=True).get()
+    target.likes_count = likes_count
+    return changed, likes_count
+
+
+def requested_like(request, currently_liked) -> bool:
+    """
+    Whether the request asks to like ("action": "like") or unlike ("unlike")
+
+    Requests without an action toggle, which needs the current state; pass it
+    as a callable so it is only looked up then. Malformed bodies raise ValueError.
+    """
+    if request.content_type == 'application/json':
+        data = json.loads(request.body or b'{}')
+        if not isinstance(data, dict):
+            raise ValueError('Expected a JSON object')
+    else:
+        data = request.POST
+    action = data.get('action')
+    if action is None:
+        return not currently_liked()
+    if action not in ('like', 'unlike'):
+        raise ValueError(f"Unknown action: {action}")
+    return action == 'like'
+
+
+def liked_ids(like_model, target_model, user, ids: Iterable) -> Set:
+    """Which of the targets with these ids user likes, in one query"""
+    liked = _liked(like_model, target_model, user, ids)
+    return set(liked) if liked is not None else set()
+
+
+async def aliked_ids(like_model, target_model, user, ids: Iterable) -> Set:
+    """liked_ids for async views"""
+    liked = _liked(like_model, target_model, user, ids)
+    return {target_id async for target_id in liked} if liked is not None else set()
+
+
+def _liked(like_model, target_model, user, ids: Iterable) -> Optional[QuerySet]:
+    """Ids of the liked targets among ids, or None when there cannot be any"""
+    if not user.is_authenticated:
+        return None
+    if not isinstance(ids, QuerySet):
+        # A queryset of ids is used as a subquery instead
+        ids = list(ids)
+        if not ids:
+            return None
+    field = _target_field(like_model, target_model)
+    return like_model.objects.filter(
+        user=user, **{f"{field}_id__in": ids}
+    ).values_list(f"{field}_id", flat=True)
+
+
+def _target_field(like_model, target) -> str:
+    """Name of the like model's foreign key to target's model"""
+    target_model = target if isinstance(target, type) else type(target)
+    for field in like_model._meta.get_fields():
+        if field.many_to_one and field.related_model is target_model:
+            return field.name
+    raise ValueError(f"{like_model.__name__} has no foreign key to {target_model.__name__}")
@@ -0,0 +1,335 @@
+"""
+Whole-page cache for anonymous readers.
+
+Views decorated with anonymous_page_cache serve anonymous GET requests from
+the cache, as stored identity and gzip bodies, without touching the ORM or
+the template engine. A page is keyed on its normalized URL and on the current
+generation of each group it depends on ('stories', 'story:<slug>', 'rss',
+...). Model signals call invalidate() once their transaction commits, which
+moves a group's generation forward so that every page depending on it misses,
+and nothing else does.
+
+On a miss only one request renders the page; concurrent ones get the
+previous rendering of the URL while it is being refreshed, or wait briefly
+for the new one when there is none.
+
+Cached pages carry no CSRF token: the token inputs are emptied before a page
+is stored, filled in from the csrftoken cookie by static/js/main.js, and each
+hit makes sure that cookie is set.
+
+Generations and render locks live in the default cache, so every process
+serving pages must share it: with a per-process cache (LocMem, when CACHE_URL
+is unset) an invalidation only reaches the process that made it, and the
+others keep serving their copy for up to PAGE_TIMEOUT. That is why
+settings.ANONYMOUS_PAGE_CACHE is only on by default with CACHE_URL, and
+check_shared_cache warns when it is turned on without one outside of DEBUG.
+
+Pages whose per-user bits are all marked with data-personal-* attributes can
+be shared with signed-in readers too (personalized=True): they get the page as
+an anonymous reader would, and main.js fills in who they are and what they
+like from the main:personal endpoint. Only anonymous renderings are stored.
+"""
+import asyncio
+import gzip
+import hashlib
+import re
+import time
+from functools import wraps
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from urllib.parse import urlencode
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core import checks
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import patch_vary_headers
+
+from .caches import is_shared_cache
+from .users import auser
+
+GENERATION_KEY = 'pagecache:gen:{}'
+PAGE_KEY = 'pagecache:page:{}'
+STALE_KEY = 'pagecache:stale:{}'
+LOCK_KEY = 'pagecache:lock:{}'
+# How long a page may be served at most, for what no signal covers (counters)
+PAGE_TIMEOUT = 300
+# Previous renderings are kept longer, to be served while a page is refreshed
+STALE_TIMEOUT = 3600
+LOCK_TIMEOUT = 10
+# How long a request without a previous rendering waits for another to render it
+LOCK_WAIT = 2.0
+LOCK_POLL = 0.05
+
+# Query parameters that never change a page
+IGNORED_PARAMS = re.compile(r'^(utm_\w+|fbclid|gclid|_)$')
+CSRF_INPUT_RE = re.compile(rb'(<input type="hidden" name="csrfmiddlewaretoken" value=")[^"]*(")')
+ACCEPTS_GZIP_RE = re.compile(r'\bgzip\b')
+# Set while signed in, for scripts; says nothing the session cookie does not
+SIGNED_IN_COOKIE = 'signed_in'
+
+
+def invalidate(*groups: str) -> None:
+    """Make every page depending on one of the groups miss, once the current transaction commits"""
+    transaction.on_commit(lambda: _bump(groups))
+
+
+def _bump(groups: Iterable[str]) -> None:
+    for group in groups:
+        key = GENERATION_KEY.format(group)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Generations start from the clock, so one that was evicted never
+            # comes back to a value older pages were stored under
+            cache.add(key, time.time_ns(), timeout=None)
+
+
+def _generations(groups) -> list:
+    keys = [GENERATION_KEY.format(group) for group in groups]
+    current = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in current}
+    for key, value in missing.items():
+        if not cache.add(key, value, timeout=None):
+            value = cache.get(key, value)
+        current[key] = value
+    return [current[key] for key in keys]
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """Warn when pages are cached in a cache only one process sees, outside of DEBUG"""
+    if not getattr(settings, 'ANONYMOUS_PAGE_CACHE', False) or settings.DEBUG or is_shared_cache():
+        return []
+    return [checks.Warning(
+        'ANONYMOUS_PAGE_CACHE is on but the default cache is local to each process, so '
+        'invalidations do not reach the other web processes.',
+        hint='Set CACHE_URL to a shared cache, or ANONYMOUS_PAGE_CACHE=False.',
+        id='utils.W001',
+    )]
+
+
+def normalized_url(request) -> str:
+    """Host, path and sorted query of the request, without tracking or empty parameters"""
+    params = sorted(
+        (name, value) for name, values in request.GET.lists() for value in values
+        if value and not IGNORED_PARAMS.match(name)
+    )
+    query = urlencode(params)
+    return f"{request.get_host()}{request.path}{'?' + query if query else ''}"
+
+
+def is_cacheable_request(request, personalized: bool = False) -> bool:
+    """GETs with nothing per-visitor to show besides, for personalized pages, the holes"""
+    if (
+        not getattr(settings, 'ANONYMOUS_PAGE_CACHE', False)
+        or request.method != 'GET'
+        or CookieStorage.cookie_name in request.COOKIES
+    ):
+        return False
+    # Without a session cookie there is no user to look up
+    return personalized or settings.SESSION_COOKIE_NAME not in request.COOKIES
+
+
+def anonymous_page_cache(*groups: str, timeout: int = PAGE_TIMEOUT, on_hit: Optional[Callable] = None,
+                         personalized: bool = False):
+    """
+    Cache the view's pages for anonymous readers
+
+    Args:
+        groups: Invalidation groups of the page; '{name}' is filled in from
+            the view's keyword arguments, e.g. 'story:{slug}'
+        timeout: Longest a page is served for
+        on_hit: Called as on_hit(request, meta) when a page is served from the
+            cache, with the dictionary the view left in response.page_cache_meta;
+            for side effects of the view that must not be skipped, like counting views
+        personalized: Serve cached pages to signed-in readers as well, for
+            templates whose per-user bits are data-personal-* holes
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            return _async_page_cache(view, groups, timeout, on_hit, personalized)
+
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if not is_cacheable_request(request, personalized):
+                return view(request, *args, **kwargs)
+
+            page_groups = [group.format(**kwargs) for group in groups]
+            url_hash, page_key, entry = _cached_entry(request, page_groups)
+            if entry is None and request.user.is_authenticated:
+                # Their rendering is theirs alone
+                return view(request, *args, **kwargs)
+            locked = False
+            if entry is None:
+                locked = cache.add(LOCK_KEY.format(url_hash), 1, timeout=LOCK_TIMEOUT)
+                if not locked:
+                    # Someone else is rendering it
+                    entry = cache.get(STALE_KEY.format(url_hash)) or _wait_for(page_key)
+            if entry is not None:
+                if on_hit is not None:
+                    on_hit(request, entry['meta'])
+                return _from_entry(request, entry)
+
+            try:
+                response = view(request, *args, **kwargs)
+                entry = _to_entry(response)
+                if entry is not None:
+                    cache.set(page_key, entry, timeout)
+                    cache.set(STALE_KEY.format(url_hash), entry, STALE_TIMEOUT)
+            finally:
+                # After a wait that timed out the lock is still someone else's
+                if locked:
+                    cache.delete(LOCK_KEY.format(url_hash))
+            return response
+        return wrapped
+    return decorator
+
+
+def _async_page_cache(view, groups, timeout, on_hit, personalized):
+    """anonymous_page_cache of an async view, with the async cache API"""
+    @wraps(view)
+    async def wrapped(request, *args, **kwargs):
+        if not is_cacheable_request(request, personalized):
+            return await view(request, *args, **kwargs)
+
+        page_groups = [group.format(**kwargs) for group in groups]
+        # The async cache API of Django 4.2 takes a thread hop per call; a hit takes one in all
+        url_hash, page_key, entry = await sync_to_async(_cached_entry)(request, page_groups)
+        if entry is None and (await auser(request)).is_authenticated:
+            return await view(request, *args, **kwargs)
+        locked = False
+        if entry is None:
+            locked = await cache.aadd(LOCK_KEY.format(url_hash), 1, timeout=LOCK_TIMEOUT)
+            if not locked:
+                entry = await cache.aget(STALE_KEY.format(url_hash)) or await _await_for(page_key)
+        if entry is not None:
+            if on_hit is not None:
+                await sync_to_async(on_hit)(request, entry['meta'])
+            return _from_entry(request, entry)
+
+        try:
+            response = await view(request, *args, **kwargs)
+            entry = _to_entry(response)
+            if entry is not None:
+                await cache.aset(page_key, entry, timeout)
+                await cache.aset(STALE_KEY.format(url_hash), entry, STALE_TIMEOUT)
+        finally:
+            if locked:
+                await cache.adelete(LOCK_KEY.format(url_hash))
+        return response
+    return wrapped
+
+
+def _cached_entry(request, groups) -> Tuple[str, str, Optional[Dict]]:
+    """Hash of the request's URL, key of its page at the groups' current generations, and the page"""
+    url_hash = hashlib.md5(normalized_url(request).encode()).hexdigest()
+    generations = '.'.join(map(str, _generations(groups)))
+    page_key = PAGE_KEY.format(hashlib.md5(f'{url_hash}|{generations}'.encode()).hexdigest())
+    return url_hash, page_key, cache.get(page_key)
+
+
+def _wait_for(page_key: str) -> Optional[Dict]:
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL)
+        entry = cache.get(page_key)
+        if entry is not None:
+            return entry
+    # Render it ourselves rather than fail the request
+    return None
+
+
+async def _await_for(page_key: str) -> Optional[Dict]:
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(LOCK_POLL)
+        entry = await cache.aget(page_key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def _to_entry(response) -> Optional[Dict]:
+    """Cache entry of a response, or None for responses that cannot be shared"""
+    if (
+        response.status_code != 200
+        or response.streaming
+        or not response.get('Content-Type', '').startswith('text/html')
+        or response.has_header('Content-Encoding')
+        or any(name != settings.CSRF_COOKIE_NAME for name in response.cookies)
+    ):
+        return None
+    if hasattr(response, 'render') and not response.is_rendered:
+        response.render()
+    body = CSRF_INPUT_RE.sub(rb'\1\2', response.content)
+    return {
+        'content_type': response['Content-Type'],
+        'identity': body,
+        'gzip': gzip.compress(body, compresslevel=6, mtime=0),
+        'meta': getattr(response, 'page_cache_meta', {}),
+    }
+
+
+def _from_entry(request, entry: Dict) -> HttpResponse:
+    if ACCEPTS_GZIP_RE.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        response = HttpResponse(entry['gzip'], content_type=entry['content_type'])
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(entry['identity'], content_type=entry['content_type'])
+    patch_vary_headers(response, ('Accept-Encoding', 'Cookie'))
+    # Forms on the page take their token from the cookie
+    get_token(request)
+    return response
+
+
+class SignedInCookieMiddleware:
+    """
+    Keep a script-readable SIGNED_IN_COOKIE while the visitor is signed in
+
+    main.js only asks the personal endpoint to fill in the holes of a page when
+    it is set. The user is looked up only when the cookie may be out of date.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if self._may_have_signed_in(request, response) and request.user.is_authenticated:
+            response.set_cookie(SIGNED_IN_COOKIE, '1', samesite='Lax', secure=request.is_secure())
+        else:
+            self._drop_stale_cookie(request, response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self._may_have_signed_in(request, response) and (await auser(request)).is_authenticated:
+            response.set_cookie(SIGNED_IN_COOKIE, '1', samesite='Lax', secure=request.is_secure())
+        else:
+            self._drop_stale_cookie(request, response)
+        return response
+
+    @staticmethod
+    def _has_session(request, response) -> bool:
+        return settings.SESSION_COOKIE_NAME in request.COOKIES or settings.SESSION_COOKIE_NAME in response.cookies
+
+    def _may_have_signed_in(self, request, response) -> bool:
+        return self._has_session(request, response) and SIGNED_IN_COOKIE not in request.COOKIES
+
+    def _drop_stale_cookie(self, request, response) -> None:
+        if SIGNED_IN_COOKIE in request.COOKIES and (
+            not self._has_session(request, response)
+            or response.cookies.get(settings.SESSION_COOKIE_NAME, {}).get('max-age') == 0
+        ):
+            response.delete_cookie(SIGNED_IN_COOKIE, samesite='Lax')
@@ -0,0 +1,192 @@
+"""
+Keyset (seek) pagination for list views.
+
+A page is addressed by an opaque cursor holding the sort key of the row next
+to it rather than by a page number, so the database seeks to the page along
+the ordering's index instead of counting and skipping every row before it:
+the hundredth page costs what the first does. Pages no longer need a total;
+where one is shown it comes from cached_count.
+"""
+import base64
+import hashlib
+import json
+from typing import Optional, Sequence
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+
+COUNT_CACHE_TIMEOUT = 300
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    """One page of rows, with cursors to the pages on either side"""
+
+    def __init__(self, object_list: list, next_cursor: Optional[str], previous_cursor: Optional[str]):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self) -> bool:
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+
+def paginate_keyset(queryset, ordering: Sequence[str], cursor: Optional[str] = None, per_page: int = 20) -> KeysetPage:
+    """
+    Page of queryset ordered by ordering, starting next to cursor
+
+    Args:
+        queryset: Rows to page through
+        ordering: Fields as for order_by, e.g. ('-published_at', '-id'); the
+            last must be unique and none may be null
+        cursor: next_cursor or previous_cursor of another page, or None for the first
+
+    Raises:
+        InvalidCursor: If cursor was not made for this ordering
+    """
+    seek = _seek(queryset, ordering, cursor)
+    return _page(list(seek.rows[:per_page + 1]), per_page, seek)
+
+
+async def apaginate_keyset(queryset, ordering: Sequence[str], cursor: Optional[str] = None,
+                           per_page: int = 20) -> KeysetPage:
+    """paginate_keyset for async views"""
+    seek = _seek(queryset, ordering, cursor)
+    return _page([row async for row in seek.rows[:per_page + 1]], per_page, seek)
+
+
+class _Seek:
+    def __init__(self, rows, fields, backwards: bool, key):
+        self.rows = rows
+        self.fields = fields
+        self.backwards = backwards
+        self.key = key
+
+
+def _seek(queryset, ordering, cursor) -> _Seek:
+    """Queryset of the rows from cursor on, in the order they are read"""
+    fields = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+    backwards, key = _decode(cursor, queryset.model, fields) if cursor else (False, None)
+
+    if backwards:
+        queryset = queryset.order_by(*(name if descending else f'-{name}' for name, descending in fields))
+    else:
+        queryset = queryset.order_by(*ordering)
+    if key is not None:
+        queryset = queryset.filter(_beyond(fields, key, backwards))
+    return _Seek(queryset, fields, backwards, key)
+
+
+def _page(rows: list, per_page: int, seek: _Seek) -> KeysetPage:
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if seek.backwards:
+        rows.reverse()
+    if not rows:
+        return KeysetPage([], None, None)
+
+    # Coming back from a later page means there is one; leaving a cursor behind means an earlier one
+    has_next = True if seek.backwards else more
+    has_previous = more if seek.backwards else seek.key is not None
+    return KeysetPage(
+        rows,
+        _encode(False, rows[-1], seek.fields) if has_next else None,
+        _encode(True, rows[0], seek.fields) if has_previous else None,
+    )
+
+
+def _beyond(fields, key, backwards: bool) -> Q:
+    """Rows after key in the ordering, or before it going backwards"""
+    condition = Q()
+    for index, (name, descending) in enumerate(fields):
+        lookup = 'lt' if descending != backwards else 'gt'
+        step = Q(**{f'{name}__{lookup}': key[index]})
+        for tied, (previous, _) in enumerate(fields[:index]):
+            step &= Q(**{previous: key[tied]})
+        condition |= step
+    return condition
+
+
+def _encode(backwards: bool, row, fields) -> str:
+    key = [str(getattr(row, name)) for name, _ in fields]
+    data = json.dumps(['p' if backwards else 'n', key], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def _decode(cursor: str, model, fields):
+    try:
+        direction, key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if direction not in ('n', 'p') or len(key) != len(fields):
+            raise InvalidCursor(cursor)
+        values = [model._meta.get_field(name).to_python(value) for (name, _), value in zip(fields, key)]
+    except (ValueError, TypeError, ValidationError):
+        raise InvalidCursor(cursor)
+    return direction == 'p', values
+
+
+def cached_count(queryset, timeout: int = COUNT_CACHE_TIMEOUT) -> int:
+    """Row count of queryset, counted at most once per timeout for the same query"""
+    key = _count_key(queryset)
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout)
+    return count
+
+
+async def acached_count(queryset, timeout: int = COUNT_CACHE_TIMEOUT) -> int:
+    """cached_count for async views"""
+    key = _count_key(queryset)
+    count = await cache.aget(key)
+    if count is None:
+        count = await queryset.acount()
+        await cache.aset(key, count, timeout)
+    return count
+
+
+def _count_key(queryset) -> str:
+    sql, params = queryset.order_by().query.sql_with_params()
+    return 'count:' + hashlib.md5(f'{sql}|{params}'.encode()).hexdigest()
+
+
+async def aget_page(queryset, per_page: int, number) -> Page:
+    """Paginator(queryset, per_page).get_page(number) for async views, with its rows loaded"""
+    paginator = Paginator(queryset, per_page)
+    # count is a cached property; with it set, picking the page needs no query
+    paginator.count = await queryset.acount()
+    page = paginator.get_page(number)
+    page.object_list = [row async for row in page.object_list]
+    return page
+
+
+def page_query(request, **params) -> str:
+    """Query string of the request with params replaced; a None value drops one"""
+    query = request.GET.copy()
+    for name, value in params.items():
+        query.pop(name, None)
+        if value is not None:
+            query[name] = value
+    return query.urlencode()
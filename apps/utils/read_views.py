@@ -0,0 +1,16 @@
+"""
+Choosing between the sync and async implementations of the hot read views.
+
+home, story_list, story_detail, get_comments, rss_feed_list and rss_feed_api
+each have an async twin, prefixed with "a". The URLconfs route to the twins
+when settings.ASYNC_READ_VIEWS is set. On Django 4.2 every async ORM and cache
+call still hops to a worker thread, so run manage.py benchmark_read_views
+against a deployment before turning it on.
+"""
+from django.conf import settings
+
+
+def read_view(view, aview):
+    """The implementation the URLconfs route to"""
+    return aview if settings.ASYNC_READ_VIEWS else view
+
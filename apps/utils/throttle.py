@@ -0,0 +1,173 @@
+"""
+Token-bucket throttling for views.
+
+Each scope (a view, or a group of them) gives every client a bucket of
+`burst` tokens that refills at the scope's rate; a request that changes
+something (POST, PUT, PATCH or DELETE) takes a token, or gets a 429 with
+Retry-After saying when the next one is due when there is none. Reads are
+never throttled. Clients are signed-in users by id and anonymous visitors by
+address.
+
+Throttles stack: a request refused by an inner one gets its token back from
+the outer ones, so that it only counts against the scope that refused it.
+
+Buckets are (tokens, timestamp) pairs in the default cache, refilled lazily
+when a token is taken. With CACHE_URL taking one is a single Lua script, run
+by a client of our own on the cache's Redis server, atomic across every web
+process and timed by the Redis clock; other backends fall back to a lock,
+which is atomic only within one process, as LocMemCache is.
+Either way a request costs one cache round trip.
+"""
+import math
+import threading
+import time
+from functools import lru_cache, wraps
+from typing import AbstractSet, Callable, Optional
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.http import JsonResponse
+
+BUCKET_KEY = 'throttle:{scope}:{client}'
+RATE_PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+# Methods that take a token; reads pass freely
+MUTATING_METHODS = frozenset({'POST', 'PUT', 'PATCH', 'DELETE'})
+REDIS_SCHEMES = ('redis://', 'rediss://', 'unix://')
+
+TAKE_SCRIPT = """
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local tokens = tonumber(bucket[1]) or burst
+local at = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - at) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+RETURN_SCRIPT = """
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+if tokens then
+    redis.call('HSET', KEYS[1], 'tokens', tostring(math.min(tonumber(ARGV[1]), tokens + 1)))
+end
+return 1
+"""
+
+# Guards the read-modify-write of buckets on backends without scripting
+_local_lock = threading.Lock()
+
+
+def parse_rate(rate: str) -> float:
+    """Tokens per second of a rate such as '30/m' (per second, minute, hour or day)"""
+    count, _, period = rate.partition('/')
+    return int(count) / RATE_PERIODS[period[:1]]
+
+
+def client_key(request) -> str:
+    """Signed-in users by id, everyone else by address"""
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def everyone(request) -> str:
+    """One bucket shared by all clients, for work that is the same whoever asks"""
+    return 'all'
+
+
+def redis_client():
+    """Client of the Redis server behind CACHE_URL, or None without one"""
+    url = getattr(settings, 'CACHE_URL', '')
+    return _redis(url) if url.startswith(REDIS_SCHEMES) else None
+
+
+@lru_cache(maxsize=None)
+def _redis(url: str):
+    # One client, and so one connection pool, per process
+    import redis
+    return redis.Redis.from_url(url)
+
+
+def take_token(scope: str, client: str, rate: float, burst: int) -> float:
+    """Take a token from the bucket; seconds until one is due, or 0 if one was taken"""
+    key = BUCKET_KEY.format(scope=scope, client=client)
+    redis = redis_client()
+    if redis is not None:
+        full_key = caches['default'].make_key(key)
+        return float(redis.eval(TAKE_SCRIPT, 1, full_key, rate, burst))
+
+    with _local_lock:
+        now = time.time()
+        tokens, at = cache.get(key, (burst, now))
+        tokens = min(burst, tokens + max(0.0, now - at) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        cache.set(key, (tokens, now), math.ceil(burst / rate) + 1)
+    return wait
+
+
+def return_token(scope: str, client: str, rate: float, burst: int) -> None:
+    """Put back a token taken for a request that was refused further on"""
+    key = BUCKET_KEY.format(scope=scope, client=client)
+    redis = redis_client()
+    if redis is not None:
+        redis.eval(RETURN_SCRIPT, 1, caches['default'].make_key(key), burst)
+        return
+
+    with _local_lock:
+        bucket = cache.get(key)
+        if bucket is not None:
+            tokens, at = bucket
+            cache.set(key, (min(burst, tokens + 1), at), math.ceil(burst / rate) + 1)
+
+
+def throttle(scope: str, rate: str, burst: Optional[int] = None, key: Callable = client_key,
+             methods: AbstractSet[str] = MUTATING_METHODS):
+    """
+    Limit how often each client may call the view
+
+    Args:
+        scope: Name of the buckets; views sharing one share their tokens
+        rate: Refill rate such as '30/m'; settings.THROTTLE_RATES[scope]
+            overrides it, and burst with it
+        burst: Most requests in a row after a pause; defaults to the rate's count
+        key: Callable giving the client of a request, e.g. client_key or everyone
+        methods: HTTP methods that take a token; others are let through
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if not getattr(settings, 'THROTTLE_ENABLED', True) or request.method not in methods:
+                return view(request, *args, **kwargs)
+            rates = getattr(settings, 'THROTTLE_RATES', {})
+            # A rate from the settings comes with the burst of its count
+            scope_rate, scope_burst = (rates[scope], None) if scope in rates else (rate, burst)
+            scope_burst = scope_burst or int(scope_rate.partition('/')[0])
+            client, tokens_per_second = key(request), parse_rate(scope_rate)
+            wait = take_token(scope, client, tokens_per_second, scope_burst)
+            if wait > 0:
+                retry_after = math.ceil(wait)
+                response = JsonResponse({
+                    'status': 'error',
+                    'message': f'Too many requests; try again in {retry_after} seconds'
+                }, status=429)
+                response['Retry-After'] = str(retry_after)
+                response.throttled = True
+                return response
+            response = view(request, *args, **kwargs)
+            if getattr(response, 'throttled', False):
+                return_token(scope, client, tokens_per_second, scope_burst)
+            return response
+        return wrapped
+    return decorator
@@ -0,0 +1,29 @@
+"""
+The signed-in user of a request, for async views.
+
+request.user is loaded lazily with sync queries (session, user, and the
+profile templates check), which async code may not run. auser loads all of
+it in one call to a worker thread, or none when there is no session to read,
+so that request.user and templates rendered afterwards run no queries. Django 5's
+request.auser() covers the user but not the profile.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+
+async def auser(request):
+    """request.user, with its profile loaded when signed in"""
+    if not hasattr(request, '_auser'):
+        if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+            # Anonymous without touching the session store
+            request._auser = request.user
+        else:
+            request._auser = await sync_to_async(_load_user)(request)
+    return request._auser
+
+
+def _load_user(request):
+    user = request.user
+    if user.is_authenticated:
+        user.profile
+    return user
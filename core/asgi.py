@@ -13,4 +13,28 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after setup: the streams read settings, the cache and models
+from apps.rss_feeds.events import sse_application  # noqa: E402
+from apps.story.live import story_socket_application  # noqa: E402
+
+# Long-lived streams are served by plain ASGI apps, outside Django's request cycle
+STREAMS = {
+    '/rss/events/': sse_application,
+}
+SOCKETS = {
+    '/ws/stories/': story_socket_application,
+}
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] in STREAMS:
+        return await STREAMS[scope['path']](scope, receive, send)
+    if scope['type'] == 'websocket':
+        if scope['path'] in SOCKETS:
+            return await SOCKETS[scope['path']](scope, receive, send)
+        # Django serves no WebSockets; refuse the handshake
+        await receive()
+        return await send({'type': 'websocket.close'})
+    return await django_application(scope, receive, send)
@@ -49,6 +49,22 @@ app.conf.update(
             'task': 'apps.rss_feeds.tasks.health_check_task',
             'schedule': 3600.0,  # 1 hour
         },
+        'renew-websub-leases-every-6-hours': {
+            'task': 'rss_feeds.renew_websub_leases',
+            'schedule': 21600.0,  # 6 hours
+        },
+        'sweep-thumbnails-every-15-minutes': {
+            'task': 'rss_feeds.generate_thumbnails',
+            'schedule': 900.0,  # 15 minutes
+        },
+        'flush-story-views-every-minute': {
+            'task': 'story.flush_view_counts',
+            'schedule': 60.0,  # 1 minute
+        },
+        'rollup-story-views-hourly': {
+            'task': 'story.rollup_story_views',
+            'schedule': 3600.0,  # 1 hour
+        },
     },
     
     # Task routing
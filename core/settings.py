@@ -29,6 +29,9 @@ DEBUG = config('DEBUG', default=True, cast=bool)
 
 ALLOWED_HOSTS = config('ALLOWED_HOSTS', default='localhost,127.0.0.1').split(',')
 
+# Public base URL, for absolute links in content served outside the site (e.g. feeds)
+SITE_URL = config('SITE_URL', default='http://localhost:8000')
+
 
 # Application definition
 
@@ -54,6 +57,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'apps.utils.page_cache.SignedInCookieMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -90,6 +94,30 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Web and Celery processes share rendered output through the cache, so set
+# CACHE_URL (e.g. redis://localhost:6379/1) anywhere but in development.
+
+CACHE_URL = config('CACHE_URL', default='')
+
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            # The view buffer and event log use one entry per event
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -299,6 +327,58 @@ JAZZMIN_UI_TWEAKS = {
     },
 }
 
+# RSS Feeds Configuration
+# Keep compressed copies of raw fetched payloads for replays (see replay_rss_payloads)
+RSS_FEEDS_ARCHIVE_PAYLOADS = config('RSS_FEEDS_ARCHIVE_PAYLOADS', default=False, cast=bool)
+# Threads downloading feeds, and processes parsing them (0 = one per CPU)
+RSS_FEEDS_FETCH_WORKERS = config('RSS_FEEDS_FETCH_WORKERS', default=8, cast=int)
+RSS_FEEDS_PARSE_WORKERS = config('RSS_FEEDS_PARSE_WORKERS', default=0, cast=int)
+# Public base URL hubs call back (e.g. https://goallinereport.com); WebSub is off when empty
+RSS_FEEDS_WEBSUB_CALLBACK_BASE_URL = config('RSS_FEEDS_WEBSUB_CALLBACK_BASE_URL', default='')
+RSS_FEEDS_WEBSUB_LEASE_SECONDS = config('RSS_FEEDS_WEBSUB_LEASE_SECONDS', default=864000, cast=int)  # 10 days
+# Sources the hub pushes are still polled when no push arrived for this long
+RSS_FEEDS_PUSHED_POLL_INTERVAL = config('RSS_FEEDS_PUSHED_POLL_INTERVAL', default=21600, cast=int)  # 6 hours
+# Items in the outgoing RSS/Atom feeds we publish (see apps/rss_feeds/syndication.py)
+RSS_FEEDS_OUTGOING_ITEMS = config('RSS_FEEDS_OUTGOING_ITEMS', default=50, cast=int)
+# Thumbnails of item images (see apps/rss_feeds/thumbnails.py)
+RSS_FEEDS_THUMBNAIL_WIDTH = config('RSS_FEEDS_THUMBNAIL_WIDTH', default=320, cast=int)
+RSS_FEEDS_IMAGE_MAX_BYTES = config('RSS_FEEDS_IMAGE_MAX_BYTES', default=5 * 1024 * 1024, cast=int)
+RSS_FEEDS_IMAGE_WORKERS = config('RSS_FEEDS_IMAGE_WORKERS', default=4, cast=int)
+# Server-Sent Events of new items (see apps/rss_feeds/events.py): events kept per
+# ASGI process for Last-Event-ID resume, and how often the shared log is tailed
+RSS_FEEDS_SSE_BUFFER_SIZE = config('RSS_FEEDS_SSE_BUFFER_SIZE', default=1000, cast=int)
+RSS_FEEDS_SSE_POLL_INTERVAL = config('RSS_FEEDS_SSE_POLL_INTERVAL', default=0.5, cast=float)
+
+# Story views are buffered in the cache and flushed by the story.flush_view_counts
+# task; views of a story by the same user or address within this window count once
+STORY_VIEW_REPEAT_WINDOW = config('STORY_VIEW_REPEAT_WINDOW', default=1800, cast=int)  # 30 minutes
+# Only a single-process deployment without CACHE_URL should write views straight
+# to the database instead (apps/story/counters.py)
+STORY_VIEW_BUFFERED = config('STORY_VIEW_BUFFERED', default=True, cast=bool)
+# Raw StoryView rows are rolled up into monthly series hourly and purged after this many days
+STORY_VIEW_RETENTION_DAYS = config('STORY_VIEW_RETENTION_DAYS', default=90, cast=int)
+# Serve home, story and RSS list pages to anonymous readers from the cache
+# (apps/utils/page_cache.py). On by default only with a shared cache (CACHE_URL):
+# with per-process LocMem, invalidations from Celery and other workers never
+# reach the web processes, see check utils.W001
+ANONYMOUS_PAGE_CACHE = config('ANONYMOUS_PAGE_CACHE', default=bool(CACHE_URL), cast=bool)
+# Route home, story_list, story_detail, get_comments, rss_feed_list and
+# rss_feed_api to their async implementations (apps/utils/read_views.py). Off by
+# default: measured with manage.py benchmark_read_views they are slower than the
+# sync views under both WSGI and ASGI on Django 4.2
+ASYNC_READ_VIEWS = config('ASYNC_READ_VIEWS', default=False, cast=bool)
+# Token-bucket limits of comment, like and fetch endpoints (apps/utils/throttle.py);
+# THROTTLE_RATES overrides a scope's rate, e.g. {'comments': '20/m'}
+THROTTLE_ENABLED = config('THROTTLE_ENABLED', default=True, cast=bool)
+THROTTLE_RATES = {}
+
+# Live events of story pages and RSS streams (apps/utils/broadcast.py): the class
+# carrying events between processes, events kept per channel and per process,
+# and how often a process polls for them, in seconds
+BROADCAST_BACKEND = config('BROADCAST_BACKEND', default='apps.utils.broadcast.CacheLogBackend')
+BROADCAST_BUFFER_SIZE = config('BROADCAST_BUFFER_SIZE', default=100, cast=int)
+BROADCAST_POLL_INTERVAL = config('BROADCAST_POLL_INTERVAL', default=0.5, cast=float)
+
 # Celery Configuration
 CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = config('CELERY_RESULT_BACKEND', default='redis://localhost:6379/0')
@@ -321,4 +401,20 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'apps.rss_feeds.tasks.health_check_task',
         'schedule': 3600.0,  # 1 hour
     },
+    'renew-websub-leases-every-6-hours': {
+        'task': 'rss_feeds.renew_websub_leases',
+        'schedule': 21600.0,  # 6 hours
+    },
+    'sweep-thumbnails-every-15-minutes': {
+        'task': 'rss_feeds.generate_thumbnails',
+        'schedule': 900.0,  # 15 minutes
+    },
+    'flush-story-views-every-minute': {
+        'task': 'story.flush_view_counts',
+        'schedule': 60.0,  # 1 minute
+    },
+    'rollup-story-views-hourly': {
+        'task': 'story.rollup_story_views',
+        'schedule': 3600.0,  # 1 hour
+    },
 }
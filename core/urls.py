@@ -18,6 +18,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from apps.rss_feeds.views import thumbnail
 
 urlpatterns = [
     path('stories/', include('apps.story.urls')),
@@ -28,7 +29,12 @@ urlpatterns = [
     path('', include('apps.main.urls')),
 ] 
 
-# Serve static and media files during development
+# Serve static and media files during development. In production the web
+# server serves them; rss_thumbnails/ under MEDIA_URL is content-addressed,
+# so it can be given a long cache lifetime there.
 if settings.DEBUG:
+    urlpatterns += [
+        path(f"{settings.MEDIA_URL.lstrip('/')}rss_thumbnails/<path:path>", thumbnail, name='rss_thumbnail'),
+    ]
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
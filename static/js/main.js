@@ -1,5 +1,90 @@
 // Main JavaScript file for Goal Line Report
 
+// Pages served from the anonymous page cache carry empty CSRF inputs; the
+// token is in the csrftoken cookie
+(function fillCsrfInputs() {
+    var match = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+    if (!match) {
+        return;
+    }
+    document.querySelectorAll('input[name="csrfmiddlewaretoken"]').forEach(function(input) {
+        if (!input.value) {
+            input.value = decodeURIComponent(match[1]);
+        }
+    });
+})();
+
+// Signed-in readers may be served a page cached for everyone; its per-user
+// bits are data-personal-* holes, filled in from the personal endpoint
+(function personalize() {
+    var script = document.querySelector('script[data-personal-url]');
+    if (!script || !/(?:^|;\s*)signed_in=1(?:;|$)/.test(document.cookie)) {
+        return;
+    }
+    function ids(selector, attribute) {
+        var seen = {};
+        document.querySelectorAll(selector).forEach(function(element) {
+            seen[element.getAttribute(attribute)] = true;
+        });
+        return Object.keys(seen).join(',');
+    }
+    var params = new URLSearchParams({
+        stories: ids('[data-liked-story]', 'data-liked-story'),
+        comments: ids('.like-comment-btn[data-comment-id]', 'data-comment-id')
+    });
+    fetch(script.dataset.personalUrl + '?' + params, {credentials: 'same-origin'})
+        .then(function(response) {
+            return response.ok ? response.json() : null;
+        })
+        .then(function(data) {
+            if (data) {
+                applyPersonal(data);
+            }
+        });
+})();
+
+function applyPersonal(data) {
+    var roles = {
+        authenticated: data.authenticated,
+        anonymous: !data.authenticated,
+        editor: data.is_editor,
+        chief_editor: data.is_chief_editor
+    };
+    document.querySelectorAll('[data-personal-show]').forEach(function(element) {
+        element.hidden = !roles[element.dataset.personalShow];
+    });
+    document.querySelectorAll('[data-personal-text]').forEach(function(element) {
+        element.textContent = data[element.dataset.personalText] || '';
+    });
+    document.querySelectorAll('[data-personal-owner]').forEach(function(element) {
+        element.hidden = !data.authenticated || String(data.id) !== element.dataset.personalOwner;
+    });
+
+    var likedStories = new Set(data.liked_stories || []);
+    document.querySelectorAll('[data-liked-story]').forEach(function(element) {
+        setLiked(element, likedStories.has(element.dataset.likedStory));
+    });
+    var likedComments = new Set(data.liked_comments || []);
+    document.querySelectorAll('.like-comment-btn[data-comment-id]').forEach(function(element) {
+        setLiked(element, likedComments.has(element.dataset.commentId));
+    });
+}
+
+function setLiked(element, liked) {
+    var icon = element.matches('i') ? element : element.querySelector('i');
+    if (icon) {
+        icon.classList.toggle('text-danger', liked);
+    }
+    var text = element.querySelector('.like-text');
+    if (text) {
+        text.textContent = liked ? 'Unlike' : 'Like';
+    }
+    if (element.hasAttribute('data-liked')) {
+        // The like handlers read it through jQuery's data cache
+        $(element).attr('data-liked', liked ? 'true' : 'false').data('liked', liked);
+    }
+}
+
 $(document).ready(function() {
     console.log('Goal Line Report - Application loaded');
     